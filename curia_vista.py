@@ -3,13 +3,23 @@ import argparse
 import logging
 import sys
 import traceback
+import uuid
 
 from odata2sql import command_dot, command_dump, command_init, command_sync, command_benchmark_aiohttp, \
-    command_benchmark_parallel
-from odata2sql.odata import Context, SettingsBuilder
+    command_benchmark_parallel, command_benchmark_sync, command_indexes, command_replay, command_serve
+from odata2sql.metadata import default_cache_directory
+from odata2sql.odata import Context, SettingsBuilder, DB_LOADERS, SYNC_ENGINES, ODATA_DECODERS
+from odata2sql.odata_json import JSON_PARSERS
 
 log = logging.getLogger('curia_vista')
 
+# The largest tables, queried per language most of the time
+PARTITION_BY_LANGUAGE = {
+    'by': 'list',
+    'property': 'Language',
+    'values': ['DE', 'FR', 'IT', 'RM', 'EN'],
+}
+
 """Settings format easy to understand for humans """
 SYNC_CONFIGURATION = {
     'sync_unconfigured_entities': True,
@@ -823,6 +833,7 @@ SYNC_CONFIGURATION = {
             },
         },
         'Transcript': {
+            'partition': PARTITION_BY_LANGUAGE,
             'selected_properties': {
                 'ID',
                 'Language',
@@ -883,6 +894,7 @@ SYNC_CONFIGURATION = {
         },
         'Voting': {
             'sync_by': 'Vote',
+            'partition': PARTITION_BY_LANGUAGE,
             'selected_properties': {
                 'ID',
                 'Language',
@@ -924,6 +936,14 @@ def settings_from_args(args):
         requests_cache.install_cache(args.requests_cache)
 
     settings_builder = SettingsBuilder(args.url)
+    settings_builder.metadata(args.metadata, None if args.no_metadata_cache else args.metadata_cache,
+                              args.refresh_metadata)
+
+    try:
+        if args.resume:
+            settings_builder.session_id(args.resume)
+    except AttributeError:
+        pass
 
     try:
         # Install global filter
@@ -974,6 +994,76 @@ def settings_from_args(args):
 
     try:
         settings_builder.odata_server_max_connections(args.connections)
+        settings_builder.adaptive_concurrency(not args.fixed_concurrency)
+    except AttributeError:
+        pass
+
+    try:
+        settings_builder.odata_timeouts(args.connect_timeout, args.read_timeout)
+        settings_builder.hedge_percentile(args.hedge_percentile or None)
+    except AttributeError:
+        pass
+
+    try:
+        settings_builder.page_archive(args.archive_pages)
+    except AttributeError:
+        pass
+
+    try:
+        for entity_connections_string in args.entity_connections:
+            try:
+                entity_type_name, max_connections = entity_connections_string.split()
+                SYNC_CONFIGURATION['entities'].setdefault(entity_type_name, {})['max_connections'] = int(
+                    max_connections)
+            except Exception as e:
+                raise RuntimeError(f'Invalid connection cap specification: {entity_connections_string}')
+    except (AttributeError, TypeError):
+        pass
+
+    try:
+        settings_builder.db_loader(args.loader)
+    except AttributeError:
+        pass
+
+    try:
+        settings_builder.fk_batch_size(args.fk_batch_size, args.fk_batch_size_max)
+    except AttributeError:
+        pass
+
+    try:
+        settings_builder.key_range_size(args.key_range_size or None)
+    except AttributeError:
+        pass
+
+    try:
+        settings_builder.sync_engine(args.engine)
+    except AttributeError:
+        pass
+
+    try:
+        if args.processes:
+            settings_builder.sync_processes(args.processes)
+    except AttributeError:
+        pass
+
+    try:
+        settings_builder.max_in_flight(args.max_in_flight_rows,
+                                       args.max_in_flight_mib * 2 ** 20 if args.max_in_flight_mib else None)
+    except AttributeError:
+        pass
+
+    try:
+        settings_builder.odata_decoder(args.decoder, args.json_parser)
+    except AttributeError:
+        pass
+
+    try:
+        settings_builder.db_writers(args.db_writers, args.db_writer_queue_depth)
+    except AttributeError:
+        pass
+
+    try:
+        settings_builder.defer_indexes(args.defer_indexes, args.maintenance_work_mem)
     except AttributeError:
         pass
 
@@ -990,26 +1080,38 @@ def main():
     parser_top_level.add_argument('--url', type=str, default='https://ws.parlament.ch/odata.svc')
     parser_top_level.add_argument('--requests-cache', type=str,
                                   help="Cache HTTP requests in <cache>.sqlite. Useful to speed up development.")
+    parser_top_level.add_argument('--metadata', type=str, metavar='file',
+                                  help='Use the $metadata document in file (e.g. doc/metadata.xml) instead of fetching it')
+    parser_top_level.add_argument('--metadata-cache', type=str, default=default_cache_directory(), metavar='directory',
+                                  help='Directory to cache $metadata documents in')
+    parser_top_level.add_argument('--no-metadata-cache', action='store_true', help='Do not cache $metadata documents')
+    parser_top_level.add_argument('--refresh-metadata', action='store_true',
+                                  help='Fetch the $metadata document even if a cached one exists')
     subparsers = parser_top_level.add_subparsers(dest='command', required=True)
     benchmark_aiohttp_parser = subparsers.add_parser('benchmark-aiohttp', help='Benchmark OData server using aiohttp')
     benchmark_multithreading_parser = subparsers.add_parser('benchmark-multithreading',
                                                             help='Benchmark OData fetching using multiple threads')
     benchmark_multiprocessing_parser = subparsers.add_parser('benchmark-multiprocessing',
                                                              help='Benchmark OData fetching using multiple processes')
+    benchmark_sync_parser = subparsers.add_parser('benchmark-sync',
+                                                  help='Benchmark a sync, reporting the time spent per pipeline stage')
     init_parser = subparsers.add_parser('init', help='Initialize database')
     sync_parser = subparsers.add_parser('sync', help='Synchronize database from scratch')
     update_parser = subparsers.add_parser('update', help='Incrementally update database')
+    replay_parser = subparsers.add_parser('replay', help='Rebuild database from pages archived by a previous sync')
+    serve_parser = subparsers.add_parser('serve', help='Serve a local stand-in for the OData server')
     dot_parser = subparsers.add_parser('dot', help='Show dependencies between entity types')
     dump_parser = subparsers.add_parser('dump', help='Show dependencies between entity types')
+    indexes_parser = subparsers.add_parser('indexes', help='Report redundant and unused indexes')
     for parser in [benchmark_aiohttp_parser, benchmark_multithreading_parser, benchmark_multiprocessing_parser,
-                   init_parser, sync_parser, update_parser, dot_parser,
+                   benchmark_sync_parser, init_parser, sync_parser, update_parser, replay_parser, dot_parser,
                    dump_parser]:
         parser.add_argument('--include', type=str, nargs='+',
                             help='Entity types to work on, dependencies added as needed. All if unspecified.')
     for parser in [benchmark_aiohttp_parser, benchmark_multithreading_parser, benchmark_multiprocessing_parser,
-                   sync_parser, update_parser, dump_parser]:
+                   benchmark_sync_parser, sync_parser, update_parser, replay_parser, dump_parser]:
         parser.add_argument('--skip', type=str, nargs='+', help='Forcefully ignore the listed entities. Beware!')
-    for parser in [init_parser, sync_parser, update_parser]:
+    for parser in [init_parser, benchmark_sync_parser, sync_parser, update_parser, replay_parser, indexes_parser]:
         parser.add_argument("-u", '--user', type=str, default='curiavista', help='Database user (default: %(default)s)')
         parser.add_argument("-H", '--host', type=str, default='127.0.0.1',
                             help='PostgreSQL host (default: %(default)s)')
@@ -1018,27 +1120,127 @@ def main():
         parser.add_argument("-d", '--database', dest='dbname', type=str, default='curiavista',
                             help='Database name (default: %(default)s)')
     for parser in [benchmark_aiohttp_parser, benchmark_multithreading_parser, benchmark_multiprocessing_parser,
-                   sync_parser, update_parser]:
+                   benchmark_sync_parser, sync_parser, update_parser]:
         parser.add_argument('--language', type=str, nargs='+',
                             help='Restrict import to specified language(s): DE, FR, IT, RM, EN. (default: all)')
-    for parser in [sync_parser]:
+    for parser in [benchmark_sync_parser, sync_parser, update_parser]:
         parser.add_argument('--sync-by-fk', type=str, nargs='+', action='extend',
                             help='Entity types to sync via foreign key (default: %(default)s)',
                             metavar='<Dependant Principal>')
         parser.add_argument('-j', '--connections', type=int, default=20, metavar='count',
-                            help='Number of parallel HTTP connections to establish (default: %(default)s)')
+                            help='Maximal number of parallel HTTP connections to establish (default: %(default)s)')
+        parser.add_argument('--fixed-concurrency', action='store_true',
+                            help='Always use all connections instead of adapting their number to the server health')
+        parser.add_argument('--entity-connections', type=str, nargs='+', action='extend',
+                            help='Cap simultaneous requests for an entity type (default: %(default)s)',
+                            metavar='<EntityType count>')
+        parser.add_argument('--connect-timeout', type=float, default=10.0, metavar='seconds',
+                            help='Deadline for establishing a connection to the OData server (default: %(default)s)')
+        parser.add_argument('--read-timeout', type=float, default=60.0, metavar='seconds',
+                            help='Deadline for the OData server to send (more of) a response (default: %(default)s)')
+        parser.add_argument('--hedge-percentile', type=float, default=95.0, metavar='percentile',
+                            help='Issue requests slower than this percentile of recent ones once more, the first answer'
+                                 ' wins. 0 disables hedging (default: %(default)s)')
         parser.add_argument('--legislative-period', type=int, nargs='+',
                             help='Legislature periods to import. All if unspecified.')
+        parser.add_argument('--loader', type=str, choices=DB_LOADERS, default='copy-text',
+                            help='Strategy to write entities to the database (default: %(default)s)')
+        parser.add_argument('--fk-batch-size', type=int, default=10, metavar='count',
+                            help='Initial number of foreign keys per request when syncing by FK (default: %(default)s)')
+        parser.add_argument('--fk-batch-size-max', type=int, default=50, metavar='count',
+                            help='Maximal number of foreign keys per request when syncing by FK (default: %(default)s)')
+        parser.add_argument('--key-range-size', type=int, default=20000, metavar='count',
+                            help='Split large entity sets into key ranges of this many entities, fetched in parallel.'
+                                 ' 0 to disable (default: %(default)s)')
+        parser.add_argument('--engine', type=str, choices=SYNC_ENGINES, default='threading',
+                            help='Fetch using worker threads, a single asyncio event loop or worker processes, which'
+                                 ' decode responses using all CPU cores (default: %(default)s)')
+        parser.add_argument('--processes', type=int, metavar='count',
+                            help='Number of worker processes of the multiprocessing engine, sharing the connections'
+                                 ' (default: number of CPU cores)')
+        parser.add_argument('--decoder', type=str, choices=ODATA_DECODERS, default='json',
+                            help='Map JSON responses straight into rows or use pyodata (default: %(default)s)')
+        parser.add_argument('--json-parser', type=str, choices=JSON_PARSERS, default='json',
+                            help='JSON parser to decode responses with, orjson and ujson need to be installed separately'
+                                 ' (default: %(default)s)')
+        parser.add_argument('--db-writers', type=int, default=4, metavar='count',
+                            help='Number of database connections persisting entities in parallel (default: %(default)s)')
+        parser.add_argument('--db-writer-queue-depth', type=int, default=4, metavar='count',
+                            help='Pages each database writer may queue up before fetching pauses (default: %(default)s)')
+        parser.add_argument('--max-in-flight-rows', type=int, metavar='count',
+                            help='Pause fetching while this many rows wait to be persisted (default: unlimited)')
+        parser.add_argument('--max-in-flight-mib', type=int, default=256, metavar='MiB',
+                            help='Pause fetching while this much memory is used by entities waiting to be persisted,'
+                                 ' 0 for unlimited (default: %(default)s)')
+        parser.add_argument('--resume', type=uuid.UUID, metavar='session_id',
+                            help='Resume an interrupted session, skipping work already done')
+        parser.add_argument('--metrics-port', type=int, metavar='port',
+                            help='Serve metrics in Prometheus format at http://127.0.0.1:<port>/metrics')
+        parser.add_argument('--metrics-file', type=str, metavar='file',
+                            help='Periodically write metrics in Prometheus format to this file')
+        parser.add_argument('--archive-pages', type=str, metavar='directory',
+                            help='Archive all pages fetched (compressed JSON) for replaying them later on')
+    for parser in [benchmark_sync_parser, sync_parser]:
+        parser.add_argument('--defer-indexes', action='store_true',
+                            help='Drop secondary indexes while loading, rebuild them in parallel (one database writer'
+                                 ' per table) and analyze all tables synced afterwards')
+        parser.add_argument('--maintenance-work-mem', type=str, default='1GB', metavar='size',
+                            help='maintenance_work_mem to rebuild deferred indexes with (default: %(default)s)')
+    for parser in [replay_parser]:
+        parser.add_argument('archive', type=str, metavar='directory',
+                            help='Directory pages were archived to, see --archive-pages of sync')
+        parser.add_argument('--session', type=uuid.UUID, metavar='session_id',
+                            help='Session to replay (default: the one which archived pages most recently)')
+        parser.add_argument('--loader', type=str, choices=DB_LOADERS, default='copy-text',
+                            help='Strategy to write entities to the database (default: %(default)s)')
+    for parser in [benchmark_sync_parser]:
+        parser.add_argument('--label', type=str, help='Name of the run, e.g. what is being compared')
+        parser.add_argument('--json', type=str, metavar='file', help='Write results (including settings) as JSON')
+        parser.add_argument('--csv', type=str, metavar='file', help='Write per stage results as CSV')
+    for parser in [serve_parser]:
+        parser.add_argument('--bind', type=str, default='127.0.0.1', help='Address to listen on (default: %(default)s)')
+        parser.add_argument('--port', type=int, default=8000, help='Port to listen on (default: %(default)s)')
+        parser.add_argument('--entities', type=int, default=1000, metavar='count',
+                            help='Entities to generate per entity type (default: %(default)s)')
+        parser.add_argument('--entity-count', type=str, nargs='+', action='extend',
+                            help='Entities to generate for an entity type', metavar='<EntityType count>')
+        parser.add_argument('--archive', type=str, metavar='directory',
+                            help='Serve the entities archived by a sync (see --archive-pages) instead')
+        parser.add_argument('--session', type=uuid.UUID, metavar='session_id',
+                            help='Archived session to serve (default: the one which archived pages most recently)')
+        parser.add_argument('--page-size', type=int, default=1000, metavar='count',
+                            help='Entities per page (default: %(default)s)')
+        parser.add_argument('--latency', type=float, default=0.0, metavar='seconds',
+                            help='Delay of every response (default: %(default)s)')
+        parser.add_argument('--latency-jitter', type=float, default=0.0, metavar='seconds',
+                            help='Additional, uniformly distributed delay (default: %(default)s)')
+        parser.add_argument('--error-rate', type=float, default=0.0, metavar='probability',
+                            help='Answer requests with 503 Service Unavailable (default: %(default)s)')
+        parser.add_argument('--disconnect-rate', type=float, default=0.0, metavar='probability',
+                            help='Close the connection without answering (default: %(default)s)')
+        parser.add_argument('--stall-rate', type=float, default=0.0, metavar='probability',
+                            help='Answer requests after --stall-seconds only (default: %(default)s)')
+        parser.add_argument('--stall-seconds', type=float, default=30.0, metavar='seconds',
+                            help='Delay of stalled requests (default: %(default)s)')
+        parser.add_argument('--seed', type=int, help='Seed making injected failures reproducible')
     for parser in [init_parser]:
         parser.add_argument("-f", '--force', action='store_true', help='Erase all preexisting content in database')
     for parser in [dump_parser]:
         parser.add_argument('--ipython', action='store_true', help='Drop into IPython shell')
+    for parser in [indexes_parser]:
+        parser.add_argument('--ddl', action='store_true',
+                            help='Show the indexes and statistics derived from the OData schema instead')
     args = parser_top_level.parse_args()
 
     log_level = max(3 - args.verbose_count, 0) * 10
     log.info(f"Setting loglevel to {log_level}")
     logging.basicConfig(stream=sys.stderr, level=log_level, format='%(asctime)s %(name)s %(levelname)s %(message)s')
 
+    if args.command == 'serve':
+        # Serves the metadata rather than depending on it
+        command_serve.work(args)
+        return
+
     context = Context.from_settings(settings_from_args(args))
     log.info(f"This is session {context.session_id}: {context.settings}")
     if args.command == 'benchmark-aiohttp':
@@ -1047,6 +1249,8 @@ def main():
         command_benchmark_parallel.work(context, args, 'multithreading')
     if args.command == 'benchmark-multiprocessing':
         command_benchmark_parallel.work(context, args, 'multiprocessing')
+    if args.command == 'benchmark-sync':
+        command_benchmark_sync.work(context, args)
     if args.command == 'dump':
         command_dump.work(context, args)
     elif args.command == 'dot':
@@ -1056,7 +1260,11 @@ def main():
     if args.command == 'sync':
         command_sync.work(context, args)
     if args.command == 'update':
-        raise NotImplemented('Update functionality is not yet implemented!')
+        command_sync.work(context, args, incremental=True)
+    if args.command == 'replay':
+        command_replay.work(context, args)
+    if args.command == 'indexes':
+        command_indexes.work(context, args)
 
 
 if __name__ == '__main__':
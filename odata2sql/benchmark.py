@@ -1,10 +1,14 @@
 import dataclasses
 import logging
+import subprocess
 import sys
-from typing import Iterable
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
 
 from tabulate import tabulate
 
+from odata2sql.stage_timing import StageSummary
+
 
 @dataclasses.dataclass
 class EntityTypeSyncResult:
@@ -23,3 +27,23 @@ def set_log_level(log: logging.Logger):
     if log.level == logging.NOTSET or log.level > logging.INFO:
         log.warning(f'Raising logging level "{logging.getLevelName(log.level)}" to "INFO"')
         log.setLevel(logging.INFO)
+
+
+def print_stage_summaries(summaries: Iterable[StageSummary], file=sys.stdout):
+    print(tabulate([[x.stage, x.pages, x.rows, x.seconds, x.rows_per_second, x.p50 * 1000, x.p90 * 1000, x.p99 * 1000,
+                     x.max * 1000] for x in summaries],
+                   headers=['Stage', 'Pages', 'Entities', 'Time[s]', 'Entities per second', 'p50[ms]', 'p90[ms]',
+                            'p99[ms]', 'Max[ms]'], floatfmt=('', '', '', '.3f', '.1f', '.1f', '.1f', '.1f', '.1f')), file=file)
+
+
+def git_revision() -> Tuple[Optional[str], Optional[bool]]:
+    """Commit checked out and whether there are local modifications, None if not running from a git work tree"""
+    directory = Path(__file__).parent
+    try:
+        revision = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=directory, capture_output=True, check=True,
+                                  text=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=directory,
+                                capture_output=True, check=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return revision, bool(status.strip())
@@ -0,0 +1,120 @@
+import datetime
+import json
+import logging
+import uuid
+from typing import Dict, Set, Iterable, Sequence, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+log = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    """Persist the progress of a sync session, allowing to resume it after an interruption.
+
+    Every method commits, callers must only record progress which is durable already.
+    """
+
+    def __init__(self, db_connection, session_id: uuid.UUID):
+        self._db_connection = db_connection
+        self._session_id = session_id
+        self.completed_entity_types: Set[str] = set()
+        # Per entity type, the point in time (UTC) fetching its entities started at, see entity_type_started
+        self.started_at: Dict[str, datetime.datetime] = {}
+        self.next_urls: Dict[str, str] = {}
+        self._completed_foreign_keys: Dict[str, Set[str]] = {}
+        # Per entity type, (lower, upper, completed) of the key ranges its entity set got split into
+        self.key_ranges: Dict[str, List[Tuple[Optional[int], Optional[int], bool]]] = {}
+
+    def load(self) -> 'Checkpoint':
+        """Read the progress made by previous runs of the same session"""
+        with self._db_connection.cursor() as cur:
+            cur.execute('SELECT entity_type, started_at, completed_at IS NOT NULL'
+                        ' FROM private.sync_checkpoint_entity_type WHERE session_id = %s', (self._session_id,))
+            self.completed_entity_types = set()
+            self.started_at = {}
+            for entity_type_name, started_at, completed in cur.fetchall():
+                self.started_at[entity_type_name] = started_at.replace(tzinfo=datetime.timezone.utc)
+                if completed:
+                    self.completed_entity_types.add(entity_type_name)
+            cur.execute('SELECT work_item, next_url FROM private.sync_checkpoint_page WHERE session_id = %s',
+                        (self._session_id,))
+            self.next_urls = dict(cur.fetchall())
+            cur.execute('SELECT entity_type, foreign_key FROM private.sync_checkpoint_foreign_key WHERE session_id = %s',
+                        (self._session_id,))
+            self._completed_foreign_keys = {}
+            for entity_type_name, foreign_key in cur.fetchall():
+                self._completed_foreign_keys.setdefault(entity_type_name, set()).add(foreign_key)
+            cur.execute('SELECT entity_type, lower_bound, upper_bound, completed_at IS NOT NULL'
+                        ' FROM private.sync_checkpoint_key_range WHERE session_id = %s ORDER BY entity_type, position',
+                        (self._session_id,))
+            self.key_ranges = {}
+            for entity_type_name, lower, upper, completed in cur.fetchall():
+                self.key_ranges.setdefault(entity_type_name, []).append((lower, upper, completed))
+        self._db_connection.commit()
+        log.info(f'Resuming session {self._session_id}: {len(self.completed_entity_types)} entity types completed,'
+                 f' {len(self.next_urls)} work items partially done,'
+                 f' {sum(len(v) for v in self._completed_foreign_keys.values())} foreign keys done')
+        return self
+
+    def is_foreign_key_completed(self, entity_type_name: str, foreign_key: Sequence) -> bool:
+        return _foreign_key_to_json(foreign_key) in self._completed_foreign_keys.get(entity_type_name, ())
+
+    def entity_type_started(self, entity_type_name: str) -> datetime.datetime:
+        """Point in time (UTC) fetching entities of @entity_type_name started at. When resuming, that is the start
+        of the first run, as pages fetched back then may have been modified since."""
+        if entity_type_name not in self.started_at:
+            started_at = datetime.datetime.now(datetime.timezone.utc)
+            with self._db_connection.cursor() as cur:
+                cur.execute('INSERT INTO private.sync_checkpoint_entity_type (session_id, entity_type, started_at)'
+                            ' VALUES (%s, %s, %s) ON CONFLICT DO NOTHING',
+                            (self._session_id, entity_type_name, started_at.replace(tzinfo=None)))
+            self._db_connection.commit()
+            self.started_at[entity_type_name] = started_at
+        return self.started_at[entity_type_name]
+
+    def entity_type_completed(self, entity_type_name: str):
+        self.entity_type_started(entity_type_name)
+        with self._db_connection.cursor() as cur:
+            cur.execute('UPDATE private.sync_checkpoint_entity_type SET completed_at = NOW()'
+                        ' WHERE session_id = %s AND entity_type = %s', (self._session_id, entity_type_name))
+        self._db_connection.commit()
+
+    def page_persisted(self, work_item_key: str, next_url: str):
+        """All pages of @work_item_key up to @next_url have been persisted"""
+        with self._db_connection.cursor() as cur:
+            cur.execute('INSERT INTO private.sync_checkpoint_page (session_id, work_item, next_url) VALUES (%s, %s, %s)'
+                        ' ON CONFLICT (session_id, work_item) DO UPDATE'
+                        ' SET next_url = EXCLUDED.next_url, updated_at = NOW()',
+                        (self._session_id, work_item_key, next_url))
+        self._db_connection.commit()
+
+    def key_ranges_planned(self, entity_type_name: str, bounds: Sequence[Tuple[Optional[int], Optional[int]]]):
+        """The entity set of @entity_type_name got split into ranges of keys within (lower, upper) @bounds"""
+        with self._db_connection.cursor() as cur:
+            execute_values(cur, 'INSERT INTO private.sync_checkpoint_key_range'
+                                ' (session_id, entity_type, position, lower_bound, upper_bound) VALUES %s',
+                           [(self._session_id, entity_type_name, position, lower, upper) for position, (lower, upper) in
+                            enumerate(bounds)])
+        self._db_connection.commit()
+
+    def key_range_completed(self, entity_type_name: str, lower: Optional[int], upper: Optional[int]):
+        """All entities of type @entity_type_name with keys in [@lower, @upper) have been persisted"""
+        with self._db_connection.cursor() as cur:
+            cur.execute('UPDATE private.sync_checkpoint_key_range SET completed_at = NOW()'
+                        ' WHERE session_id = %s AND entity_type = %s'
+                        ' AND lower_bound IS NOT DISTINCT FROM %s AND upper_bound IS NOT DISTINCT FROM %s',
+                        (self._session_id, entity_type_name, lower, upper))
+        self._db_connection.commit()
+
+    def foreign_keys_completed(self, entity_type_name: str, foreign_keys: Iterable[Sequence]):
+        """All entities of type @entity_type_name referencing @foreign_keys have been persisted"""
+        with self._db_connection.cursor() as cur:
+            execute_values(cur, 'INSERT INTO private.sync_checkpoint_foreign_key (session_id, entity_type, foreign_key)'
+                                ' VALUES %s ON CONFLICT DO NOTHING',
+                           [(self._session_id, entity_type_name, _foreign_key_to_json(fk)) for fk in foreign_keys])
+        self._db_connection.commit()
+
+
+def _foreign_key_to_json(foreign_key: Sequence) -> str:
+    return json.dumps(list(foreign_key), default=str)
@@ -0,0 +1,65 @@
+import csv
+import dataclasses
+import datetime
+import json
+import logging
+import time
+from typing import List, Tuple
+
+from odata2sql import command_sync
+from odata2sql.benchmark import set_log_level, git_revision, print_stage_summaries
+from odata2sql.odata import Context
+from odata2sql.stage_timing import StageSummary
+
+log = logging.getLogger(__name__)
+
+# Columns of the CSV output, one row per stage
+CSV_FIELDS = ['label', 'started_at', 'git_revision', 'git_dirty', 'stage', 'pages', 'rows', 'seconds',
+              'rows_per_second', 'p50', 'p90', 'p99', 'max']
+
+
+def run(context: Context, args) -> Tuple[List[StageSummary], dict]:
+    """Sync using the real pipeline, return the per stage summaries and all results in a JSON serializable form"""
+    revision, dirty = git_revision()
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    begin = time.perf_counter()
+    scheduler = command_sync.work(context, args)
+    wall_seconds = time.perf_counter() - begin
+    timings = scheduler.stage_timings
+    entities = sum(timings.rows_by_entity_type.values())
+    summaries = timings.summary()
+    return summaries, {
+        'label': args.label,
+        'started_at': started_at.isoformat(),
+        'git_revision': revision,
+        'git_dirty': dirty,
+        'settings': dataclasses.asdict(context.settings),
+        'wall_seconds': wall_seconds,
+        'entities': entities,
+        'entities_per_second': entities / wall_seconds if wall_seconds else None,
+        'stages': [dict(dataclasses.asdict(s), rows_per_second=s.rows_per_second) for s in summaries],
+        'entity_types': {name: {'pages': timings.pages_by_entity_type[name], 'entities': rows} for name, rows in
+                         sorted(timings.rows_by_entity_type.items())},
+    }
+
+
+def write_csv(results: dict, filename: str):
+    with open(filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for stage in results['stages']:
+            writer.writerow(dict(stage, **{k: results[k] for k in ('label', 'started_at', 'git_revision', 'git_dirty')}))
+
+
+def work(context: Context, args):
+    """Benchmark a sync from scratch, reporting where the time goes per stage of the pipeline"""
+    set_log_level(log)
+    summaries, results = run(context, args)
+    log.info(f'Synced {results["entities"]} entities in {results["wall_seconds"]:.1f}s'
+             f' at revision {results["git_revision"]}{" (modified)" if results["git_dirty"] else ""}')
+    print_stage_summaries(summaries)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+    if args.csv:
+        write_csv(results, args.csv)
@@ -0,0 +1,21 @@
+import logging
+
+from odata2sql.index_advisor import IndexAdvisor, load_index_usage, index_report
+from odata2sql.odata import Context
+from odata2sql.sql import database_connection
+
+log = logging.getLogger(__name__)
+
+
+def work(context: Context, args):
+    """Show the indexes and statistics derived from the OData schema (applied by init) or report indexes being redundant
+    or unused since the database statistics were reset"""
+    if args.ddl:
+        print(IndexAdvisor(context).odata_to_ddl())
+        return
+    with database_connection(args) as db_connection:
+        findings = index_report(load_index_usage(db_connection))
+    for finding in findings:
+        print(finding)
+    if not findings:
+        log.info('Neither redundant nor unused indexes found')
@@ -0,0 +1,51 @@
+import functools
+import logging
+import uuid
+
+from pyodata.v2.model import EntityType
+
+from odata2sql.command_sync import WorkItemDbPersisting, update_db, run_post_sync_scripts
+from odata2sql.logging import log_to_database
+from odata2sql.odata import Context
+from odata2sql.odata_json import RowDecoder, json_parser, parse_page
+from odata2sql.page_archive import read_pages, latest_session, archived_entity_types
+from odata2sql.sql import database_connection, to_pg_name
+
+log = logging.getLogger(__name__)
+
+
+def replay_entity_type(context: Context, db_connection, directory: str, session_id: uuid.UUID,
+                       entity_type: EntityType) -> int:
+    """Persist all pages archived for @entity_type by session @session_id, returns the number of entities"""
+    loads = json_parser(context.settings.json_parser)
+    decoder = RowDecoder(entity_type, context.odata_selected_properties(entity_type))
+    columns = [to_pg_name(n) for n in decoder.property_names]
+    total = 0
+    for content in read_pages(directory, session_id, entity_type.name):
+        rows = decoder.batch(parse_page(loads(content)).results)
+        update_db(context, db_connection, WorkItemDbPersisting(entity_type.name, rows, columns))
+        total += len(rows)
+    return total
+
+
+def work(context: Context, args):
+    """Rebuild the odata schema from pages archived by a previous sync, without contacting the OData server.
+
+    Watermarks are left alone, as the archive may well be older than the database content.
+    """
+    session_id = args.session or latest_session(args.archive)
+    if session_id is None:
+        raise ValueError(f'No archived session found in {args.archive}')
+    archived = set(archived_entity_types(args.archive, session_id))
+    log.info(f'Replaying session {session_id} from {args.archive}')
+    with database_connection(args) as db_connection, \
+            log_to_database(log, context.session_id, functools.partial(database_connection, args)):
+        # Principals first, same as when syncing
+        for entity_types in context.get_topology():
+            for entity_type in sorted(entity_types, key=lambda et: et.name):
+                if entity_type.name not in archived:
+                    log.warning(f'No pages archived for entity type "{entity_type.name}"')
+                    continue
+                total = replay_entity_type(context, db_connection, args.archive, session_id, entity_type)
+                log.info(f'Replayed {total} entities of type "{entity_type.name}"')
+        run_post_sync_scripts(db_connection)
@@ -0,0 +1,42 @@
+import logging
+from pathlib import Path
+
+from odata2sql.page_archive import latest_session
+from odata2sql.stand_in_server import StandInServer, Faults, parse_schema, generate_entities, archived_entities
+
+log = logging.getLogger(__name__)
+
+# $metadata document served unless a different one is given
+BUNDLED_METADATA = Path(__file__).parent.joinpath('../doc/metadata.xml').resolve()
+
+
+def work(args):
+    """Serve a local stand-in for the OData server, allowing to sync and benchmark without depending on Curia Vista"""
+    with open(args.metadata or BUNDLED_METADATA, 'rb') as f:
+        metadata = f.read()
+    schema = parse_schema(metadata)
+    counts = {}
+    for entity_count_string in args.entity_count or []:
+        entity_type_name, count = entity_count_string.split()
+        counts[entity_type_name] = int(count)
+    entities = {}
+    if args.archive:
+        session_id = args.session or latest_session(args.archive)
+        if session_id is None:
+            raise ValueError(f'No archived session found in {args.archive}')
+        log.info(f'Serving entities archived by session {session_id}')
+        for entity_set in schema.entity_sets:
+            entities[entity_set.name] = archived_entities(args.archive, session_id, entity_set.entity_type)
+    else:
+        for entity_set in schema.entity_sets:
+            entities[entity_set.name] = generate_entities(schema, entity_set.entity_type,
+                                                          lambda name: counts.get(name, args.entities))
+    faults = Faults(args.latency, args.latency_jitter, args.error_rate, args.disconnect_rate, args.stall_rate,
+                    args.stall_seconds)
+    server = StandInServer((args.bind, args.port), metadata, entities, args.page_size, faults, args.seed)
+    log.info(f'Serving {sum(len(e) for e in entities.values())} entities at {server.url} ({faults})')
+    log.info(f'Pass --url {server.url} to sync from the stand-in server')
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -1,34 +1,72 @@
 import dataclasses
+import datetime
+import functools
 import logging
 import multiprocessing
 import queue
 import sys
+import time
 from functools import cached_property
+from pathlib import Path
 from threading import Thread
 from timeit import default_timer as timer
-from typing import List, Dict, Generator, Union, Optional
+from typing import List, Dict, Generator, Union, Optional, Sequence, Callable, ContextManager, Any
 
 import psycopg2
+import requests
 from alive_progress import alive_bar
 from psycopg2 import ProgrammingError
-from psycopg2.extras import execute_batch
+from psycopg2.extras import execute_values
+from pyodata.exceptions import HttpError
 from pyodata.v2.model import EntityType, ReferentialConstraint
 
-from odata2sql.logging import LogDbHandler
-from odata2sql.odata import Context, Settings, get_property_names_of_entity_type
-from odata2sql.sql import database_connection, to_pg_name
+from odata2sql import metrics
+from odata2sql.checkpoint import Checkpoint
+from odata2sql.concurrency import ConcurrencyController
+from odata2sql.db_writer import DbWriterPool, WorkItemPersisted, WorkItemDurable
+from odata2sql.deferred_indexes import defer_indexes, rebuild_indexes
+from odata2sql.flow_control import InFlightBudget, estimate_payload_bytes
+from odata2sql.http_session import DeadlineSession, RequestStatistics
+from odata2sql.key_range import KeyRange, range_key_property, key_range, key_ranges, boundaries_from_database, \
+    boundaries_from_server
+from odata2sql.logging import log_to_database
+from odata2sql.odata import Context, get_property_names_of_entity_type, odata_filter_conjunction, \
+    odata_filter_modified_since
+from odata2sql.odata_json import RowDecoder, json_parser, parse_page
+from odata2sql.page_archive import PageArchive
+from odata2sql.pg_copy import copy_rows
+from odata2sql.quarantine import quarantine_row
+from odata2sql.row_batch import RowBatch, last_per_key
+from odata2sql.row_hash import ROW_HASH_COLUMN, ROW_HASH_TYPE, has_row_hash_column, with_row_hashes
+from odata2sql.sql import database_connection, to_pg_name, to_snake_case, run_sql_scripts
+from odata2sql.stage_timing import StageTimings
+from odata2sql.watermark import has_modified_property, load_watermarks, store_watermark, next_watermark
 
 log = logging.getLogger(__name__)
 
 keep_working = True
 
+# Attempts to fetch entities of a single foreign key before giving up
+MAX_ATTEMPTS = 3
 
-def do_odata_fetch(settings: Settings, input_: multiprocessing.Queue, output: multiprocessing.Queue):
-    """Worker thread function"""
-    # Separate instances for every thread
+# Seconds between logging the fill level of queues
+FLOW_LOG_INTERVAL = 30
+
+
+def do_odata_fetch(context: Context, input_: multiprocessing.Queue, output: multiprocessing.Queue,
+                   budget: InFlightBudget, controller: ConcurrencyController, statistics: RequestStatistics,
+                   archive: Optional[PageArchive] = None):
+    """Worker thread function. Blocks while @budget is exhausted, i.e. the database falls behind, and while
+    @controller does not allow for another request. Requests get recorded in @statistics, pages in @archive (if any)."""
+    # Separate HTTP session for every thread, the parsed metadata gets shared
     try:
-        # TODO: Re-use already fetched metadata
-        context = Context.from_settings(settings)
+        settings = context.settings
+        context = context.with_new_session(
+            DeadlineSession((settings.odata_connect_timeout, settings.odata_read_timeout), statistics, controller))
+        if context.settings.odata_decoder == 'json':
+            fetcher = JsonPageFetcher(context, controller, archive)
+        else:
+            fetcher = PyodataPageFetcher(context, controller)
         while keep_working:
             try:
                 work_item = input_.get(timeout=1)
@@ -40,7 +78,6 @@ def do_odata_fetch(settings: Settings, input_: multiprocessing.Queue, output: mu
             if type(work_item) not in (WorkItemFetchByPrincipal, WorkItemFetchByEntityType):
                 log.error(f'Can not process work item {work_item}')
                 break
-            list_of_entities_generator = work_item.run(context)
             if work_item.selected_property_names:
                 property_names = work_item.selected_property_names
                 sql_column_names = [to_pg_name(n) for n in work_item.selected_property_names]
@@ -48,15 +85,19 @@ def do_odata_fetch(settings: Settings, input_: multiprocessing.Queue, output: mu
                 entity_type = context.get_entity_type_by_name(work_item.entity_type_name)
                 property_names = get_property_names_of_entity_type(entity_type)
                 sql_column_names = get_gp_column_names_from_entity_type(entity_type)
-            for list_of_entities in list_of_entities_generator:
-                sql_row_data = []
-                for entity in list_of_entities:
-                    row = []
-                    for property_name in property_names:
-                        value = getattr(entity, property_name)
-                        row.append(value)
-                    sql_row_data.append(row)
-                output.put(WorkItemDbPersisting(work_item.entity_type_name, sql_row_data, sql_column_names))
+            try:
+                for page in work_item.run(context, fetcher, property_names):
+                    persisting = WorkItemDbPersisting(work_item.entity_type_name, page.rows, sql_column_names,
+                                                      work_item.checkpoint_key, work_item.next_url,
+                                                      page.stage_seconds)
+                    budget.acquire(persisting.total, persisting.payload_bytes)
+                    output.put(persisting)
+            except (requests.exceptions.RequestException, HttpError) as e:
+                if type(work_item) is not WorkItemFetchByPrincipal:
+                    raise
+                # Let the scheduler retry using smaller work items
+                log.warning(f'{work_item}: Attempt #{work_item.attempt} failed: {e}')
+                work_item.failed = True
             output.put(work_item)
     except Exception as e:
         output.put(e)
@@ -64,6 +105,76 @@ def do_odata_fetch(settings: Settings, input_: multiprocessing.Queue, output: mu
         log.info(f'Shutting thread down')
 
 
+@dataclasses.dataclass(frozen=True)
+class RowPage:
+    """Entities of a single response, one row per entity holding the values of the requested properties"""
+    rows: RowBatch
+    total_count: Optional[int]
+    next_url: Optional[str]
+    # Seconds spent per stage (see STAGES) to get the page
+    stage_seconds: Dict[str, float] = dataclasses.field(default_factory=dict)
+
+
+class PyodataPageFetcher:
+    """Fetch pages using pyodata, which converts every entity into a proxy object first"""
+
+    def __init__(self, context: Context, controller: ConcurrencyController):
+        self._context = context
+        self._controller = controller
+
+    def fetch(self, entity_type: EntityType, property_names: List[str], odata_filter: Optional[str],
+              next_url: Optional[str], inline_count: bool) -> RowPage:
+        request = getattr(self._context.client.entity_sets, entity_type.name).get_entities()
+        if odata_filter:
+            request.filter(odata_filter)
+        request.select(','.join(property_names))
+        if inline_count:
+            request.count(inline=True)
+        begin = timer()
+        with self._controller.request(entity_type.name):
+            entity_list = request.next_url(next_url).execute()
+        fetched = timer()
+        type_names = {p.name: p.typ.name for p in entity_type.proprties()}
+        rows = RowBatch.from_columns([[getattr(entity, n) for entity in entity_list] for n in property_names],
+                                     [type_names[n] for n in property_names])
+        return RowPage(rows, entity_list.total_count if inline_count else None, entity_list.next_url,
+                       {'fetch': fetched - begin, 'extract': timer() - fetched})
+
+
+class JsonPageFetcher:
+    """Fetch pages as JSON documents and map their entities straight into rows, bypassing pyodata. The raw documents
+    get added to @archive, if given."""
+
+    def __init__(self, context: Context, controller: ConcurrencyController, archive: Optional[PageArchive] = None):
+        self._context = context
+        self._controller = controller
+        self._archive = archive
+        self._loads = json_parser(context.settings.json_parser)
+        self._decoders: Dict[tuple, RowDecoder] = {}
+
+    def _decoder(self, entity_type: EntityType, property_names: List[str]) -> RowDecoder:
+        key = (entity_type.name, tuple(property_names))
+        if key not in self._decoders:
+            self._decoders[key] = RowDecoder(entity_type, property_names)
+        return self._decoders[key]
+
+    def fetch(self, entity_type: EntityType, property_names: List[str], odata_filter: Optional[str],
+              next_url: Optional[str], inline_count: bool) -> RowPage:
+        url = next_url or self._context.entity_set_url(entity_type, odata_filter, property_names, inline_count)
+        begin = timer()
+        with self._controller.request(entity_type.name):
+            response = self._context.client.connection.get(url, headers={'Accept': 'application/json'})
+            response.raise_for_status()
+        if self._archive:
+            self._archive.append(entity_type.name, response.content)
+        fetched = timer()
+        page = parse_page(self._loads(response.content))
+        decoded = timer()
+        rows = self._decoder(entity_type, property_names).batch(page.results)
+        return RowPage(rows, page.total_count, page.next_url,
+                       {'fetch': fetched - begin, 'decode': decoded - fetched, 'extract': timer() - decoded})
+
+
 class Shutdown:
     """Sentinel to shut down worker threads"""
     pass
@@ -72,17 +183,26 @@ class Shutdown:
 class WorkItemFetchByEntityType:
     """Fetch all items of an OData entity type"""
 
-    def __init__(self, entity_type: EntityType, context: Context):
+    def __init__(self, entity_type: EntityType, context: Context, additional_filter: Optional[str] = None,
+                 resume_next_url: Optional[str] = None, key_range: Optional[KeyRange] = None):
+        """If given, start from @resume_next_url instead of the first page. Limited to @key_range, if given."""
         self._entity_type_name = entity_type.name
-        self._odata_filter = context.odata_filter_for_entity_type(entity_type)
+        self._key_range = key_range
+        self._odata_filter = odata_filter_conjunction(context.odata_filter_for_entity_type(entity_type),
+                                                      additional_filter, key_range.odata_filter() if key_range else None)
         self._selected_properties_names = context.odata_selected_properties(entity_type)
+        self._resume_next_url = resume_next_url
         self.done_count = 0
+        # URL of the page following the one most recently yielded by run()
+        self.next_url = resume_next_url
 
     def __str__(self):
+        if self._key_range:
+            return f'Sync by entity name: {self._entity_type_name} ({self._key_range})'
         return f'Sync by entity name: {self._entity_type_name}'
 
     def __eq__(self, other: 'WorkItemFetchByEntityType'):
-        return self._entity_type_name == other._entity_type_name
+        return self.checkpoint_key == other.checkpoint_key
 
     @cached_property
     def selected_property_names(self):
@@ -92,39 +212,53 @@ class WorkItemFetchByEntityType:
     def entity_type_name(self):
         return self._entity_type_name
 
-    def run(self, context) -> Generator:
-        entity_set = getattr(context.client.entity_sets, self._entity_type_name)
+    @property
+    def key_range(self) -> Optional[KeyRange]:
+        return self._key_range
 
-        next_url = None
+    @property
+    def checkpoint_key(self) -> Optional[str]:
+        """Identify this work item's paging progress across sync runs"""
+        return page_checkpoint_key(self._entity_type_name, self._key_range)
+
+    def run(self, context: Context, fetcher, property_names: List[str]) -> Generator[RowPage, None, None]:
+        entity_type = context.get_entity_type_by_name(self._entity_type_name)
+
+        self.next_url = self._resume_next_url
         self.done_count = 0
         expected_count = None
         while keep_working:
-            request = entity_set.get_entities()
-            if self._odata_filter:
-                request.filter(self._odata_filter)
-            if self._selected_properties_names:
-                request.select(','.join(self._selected_properties_names))
-            entity_list = request.next_url(next_url).count(inline=True).execute()
-            self.done_count += len(entity_list)
-            log.debug(f'{self._entity_type_name}: Got {self.done_count} out of {entity_list.total_count} items')
+            page = fetcher.fetch(entity_type, property_names, self._odata_filter, self.next_url, True)
+            self.done_count += len(page.rows)
+            log.debug(f'{self._entity_type_name}: Got {self.done_count} out of {page.total_count} items')
             if expected_count is None:
-                expected_count = entity_list.total_count
-            elif expected_count != entity_list.total_count:
+                expected_count = page.total_count
+            elif expected_count != page.total_count:
                 # Seen for Curia Vistas 'Business' entities
                 log.error(
-                    f'{self._entity_type_name}: Total count has changed from {expected_count} to {entity_list.total_count}')
-                expected_count = entity_list.total_count
-            yield entity_list
-            if entity_list.next_url is None:
+                    f'{self._entity_type_name}: Total count has changed from {expected_count} to {page.total_count}')
+                expected_count = page.total_count
+            self.next_url = context.adjust_next_url(page.next_url) if page.next_url else None
+            yield page
+            if self.next_url is None:
                 break
-            next_url = context.adjust_next_url(entity_list.next_url)
-            log.debug(f'{self._entity_type_name}: Fetching next chunk from {next_url}')
+            log.debug(f'{self._entity_type_name}: Fetching next chunk from {self.next_url}')
+        if self._resume_next_url:
+            # Entities of previous runs are unaccounted for
+            return
         if self.done_count != expected_count:
             # Seen for MemberCouncilHistory
             log.error(
                 f'{self._entity_type_name}: Mismatch of expected and actual number of elements: {expected_count} vs {self.done_count}')
 
 
+def page_checkpoint_key(entity_type_name: str, key_range: Optional[KeyRange]) -> str:
+    """Identify the paging progress of fetching the entities of @entity_type_name within @key_range"""
+    if key_range:
+        return f'{entity_type_name}:{key_range}'
+    return entity_type_name
+
+
 class WorkItemFetchByPrincipal:
     """Fetch items of an OData entity type by a foreign key. Mainly a workaround for buggy servers.
 
@@ -139,60 +273,156 @@ class WorkItemFetchByPrincipal:
     strategy, it can be parallelized.
     """
 
-    def __init__(self, ref: ReferentialConstraint, foreign_key_property_values: List[str], context: Context):
-        if (len(ref.dependent.property_names) != len(foreign_key_property_values)) or len(
-                ref.dependent.property_names) == 0:
-            raise ValueError(
-                '{}: Foreign key properties ({}) mismatch their supposed values ({})'.format(ref.dependent.name,
-                                                                                             ', '.join(
-                                                                                                 ref.dependent.property_names),
-                                                                                             ', '.join(
-                                                                                                 foreign_key_property_values)))
-        self._entity_type_name = ref.dependent.name
-        foreign_key_property_values_as_quoted_string = [str(v) if type(v) == int else f"'{v}'" for v in
-                                                        foreign_key_property_values]
-        self._odata_filter = " and ".join(
-            [f"{k} eq {v}" for k, v in zip(ref.dependent.property_names, foreign_key_property_values_as_quoted_string)])
-        if existing_filter := context.odata_filter_for_entity_type(ref.dependent):
-            self._odata_filter = f'({existing_filter}) and ({self._odata_filter})'
-
-        try:
-            self._selected_properties_names = context.odata_selected_properties(ref.dependent)
-        except KeyError:
-            self._selected_properties_names = None
+    def __init__(self, ref: ReferentialConstraint, foreign_keys: List[Sequence], context: Context, attempt: int = 1):
+        """Fetch all entities referencing any of the @foreign_keys, each being the values of the FK properties"""
+        if not foreign_keys:
+            raise ValueError(f'{ref.dependent.name}: No foreign keys given')
+        for foreign_key_property_values in foreign_keys:
+            if (len(ref.dependent.property_names) != len(foreign_key_property_values)) or len(
+                    ref.dependent.property_names) == 0:
+                raise ValueError('{}: Foreign key properties ({}) mismatch their supposed values ({})'.format(
+                    ref.dependent.name, ', '.join(ref.dependent.property_names),
+                    ', '.join(str(v) for v in foreign_key_property_values)))
+        dependant = context.get_entity_type_by_name(ref.dependent.name)
+        self._entity_type_name = dependant.name
+        self._foreign_keys = [tuple(fk) for fk in foreign_keys]
+        self._odata_filter = odata_filter_conjunction(context.odata_filter_for_entity_type(dependant),
+                                                      odata_filter_by_foreign_keys(ref, self._foreign_keys))
+        self._selected_properties_names = context.odata_selected_properties(dependant)
         self._principal_name = ref.principal.name
+        self.attempt = attempt
         self.done_count = 0
+        # Progress is tracked by foreign keys, not by pages
+        self.next_url = None
+        # Slowest single request, used to adapt the number of foreign keys per work item
+        self.max_request_seconds = 0.0
+        self.failed = False
 
     @cached_property
     def selected_property_names(self):
         return self._selected_properties_names
 
     def __str__(self):
-        return f'Sync by FK on "{self._principal_name}": "{self._entity_type_name}"'
+        return f'Sync by FK on "{self._principal_name}": "{self._entity_type_name}" ({len(self._foreign_keys)} keys)'
 
-    def __eq__(self, other: 'WorkItemFetchByEntityType'):
-        return self._entity_type_name == other.entity_type_name
+    def __eq__(self, other: 'WorkItemFetchByPrincipal'):
+        # Many work items of the same entity type are in flight at once, telling them apart by their keys
+        return type(other) is WorkItemFetchByPrincipal and (
+                (self._entity_type_name, self._foreign_keys) == (other.entity_type_name, other.foreign_keys))
 
     @property
     def entity_type_name(self):
         return self._entity_type_name
 
-    def run(self, context) -> Generator:
-        entity_set = getattr(context.client.entity_sets, self._entity_type_name)
-        request = entity_set.get_entities().filter(self._odata_filter)
-        # TODO: handle partial responses
-        entity_list = request.execute()
-        self.done_count += len(entity_list)
-        yield entity_list
+    @property
+    def foreign_keys(self) -> List[tuple]:
+        return self._foreign_keys
+
+    @property
+    def checkpoint_key(self) -> Optional[str]:
+        return None
 
+    def run(self, context: Context, fetcher, property_names: List[str]) -> Generator[RowPage, None, None]:
+        entity_type = context.get_entity_type_by_name(self._entity_type_name)
+        next_url = None
+        while keep_working:
+            request_begin = timer()
+            page = fetcher.fetch(entity_type, property_names, self._odata_filter, next_url, False)
+            self.max_request_seconds = max(self.max_request_seconds, timer() - request_begin)
+            self.done_count += len(page.rows)
+            yield page
+            if page.next_url is None:
+                break
+            next_url = context.adjust_next_url(page.next_url)
 
-class WorkItemDbPersisting:
-    """Describe rows to be put in a database"""
 
-    def __init__(self, entity_type_name: str, rows: List[List[str]], columns: List[str]):
+def next_attempt(attempt: int, failed_count: int, retry_count: int) -> int:
+    """Attempt number of retrying @retry_count of the @failed_count foreign keys which failed at @attempt. Isolating a
+    single key from a batch does not count against its attempts."""
+    return 1 if retry_count == 1 < failed_count else attempt + 1
+
+
+def odata_filter_by_foreign_keys(ref: ReferentialConstraint, foreign_keys: List[Sequence]) -> str:
+    """$filter expression matching entities referencing any of the @foreign_keys.
+
+    Keys sharing all but their first value (e.g. the language) get grouped to keep the URL short.
+    """
+
+    def quote(v):
+        return str(v) if type(v) == int else f"'{v}'"
+
+    first_property_name, *other_property_names = ref.dependent.property_names
+    groups: Dict[tuple, List] = {}
+    for first_value, *other_values in foreign_keys:
+        groups.setdefault(tuple(other_values), []).append(first_value)
+    clauses = []
+    for other_values, first_values in groups.items():
+        clause = " or ".join(f"{first_property_name} eq {quote(v)}" for v in first_values)
+        if other_property_names:
+            common = " and ".join(f"{k} eq {quote(v)}" for k, v in zip(other_property_names, other_values))
+            clause = f"{common} and ({clause})" if len(first_values) > 1 else f"{common} and {clause}"
+        clauses.append(clause)
+    if len(clauses) == 1:
+        return clauses[0]
+    return " or ".join(f'({c})' for c in clauses)
+
+
+class AdaptiveBatchSize:
+    """Number of foreign keys to request at once when syncing by principal.
+
+    Grows as long as requests are answered well below @target_seconds, shrinks on slow or failed requests. This keeps
+    requests clear of the server's tendency to hang when asked for too much at once, while still cutting down the
+    number of round trips.
+    """
+
+    def __init__(self, initial: int, maximum: int, target_seconds: float = 10.0):
+        self._size = initial
+        self._maximum = maximum
+        self._target_seconds = target_seconds
+
+    def __int__(self):
+        return self._size
+
+    def succeeded(self, key_count: int, seconds: float):
+        if key_count < self._size:
+            # Too few keys to tell anything about the current size
+            return
+        if seconds > self._target_seconds:
+            size = max(1, min(self._size - 1, int(self._size * self._target_seconds / seconds)))
+        elif seconds < self._target_seconds / 2:
+            size = min(self._maximum, max(self._size + 1, int(self._size * 1.5)))
+        else:
+            return
+        if size != self._size:
+            log.info(f'Adjusting foreign keys per request from {self._size} to {size} ({seconds:.1f}s per request)')
+            self._size = size
+
+    def failed(self):
+        size = max(1, self._size // 2)
+        if size != self._size:
+            log.info(f'Adjusting foreign keys per request from {self._size} to {size} due to failure')
+            self._size = size
+
+
+class WorkItemDbPersisting:
+    """Describe rows to be put in a database. Usually a RowBatch, which COPY encodes column by column."""
+    __slots__ = ('_entity_type_name', '_columns', '_rows', '_payload_bytes', 'checkpoint_key', 'next_url',
+                 'stage_seconds', 'created_at', 'upsert_counts')
+
+    def __init__(self, entity_type_name: str, rows: Union[RowBatch, List[Sequence]], columns: List[str],
+                 checkpoint_key: Optional[str] = None, next_url: Optional[str] = None,
+                 stage_seconds: Optional[Dict[str, float]] = None):
+        """Once persisted, the work item identified by @checkpoint_key may resume at @next_url. @stage_seconds
+        gets completed by update_db, which records the outcome in upsert_counts."""
         self._entity_type_name = entity_type_name
         self._columns = columns
         self._rows = rows
+        self._payload_bytes = None
+        self.checkpoint_key = checkpoint_key
+        self.next_url = next_url
+        self.stage_seconds = dict(stage_seconds or {})
+        self.created_at = timer()
+        self.upsert_counts: Optional[UpsertCounts] = None
 
     @property
     def entity_type_name(self):
@@ -206,6 +436,14 @@ class WorkItemDbPersisting:
     def rows(self):
         return self._rows
 
+    @property
+    def payload_bytes(self) -> int:
+        """Approximate memory used by the rows"""
+        if self._payload_bytes is None:
+            self._payload_bytes = self._rows.nbytes if isinstance(self._rows, RowBatch) else estimate_payload_bytes(
+                self._rows)
+        return self._payload_bytes
+
     @property
     def columns(self):
         return self._columns
@@ -218,15 +456,22 @@ class WorkItemDbPersisting:
     def pk_name(self):
         return to_pg_name(self._entity_type_name + '_pkey')
 
+    @property
+    def staging_table_name(self):
+        return to_pg_name('Staging' + self._entity_type_name)
+
 
 class BacklogInProgressItem:
     """Keep track of work getting done (i.e. work items enqueued, completed entities)"""
 
     def __init__(self, context: Context, entity_type: EntityType,
-                 work_items: List[Union[WorkItemFetchByEntityType, WorkItemFetchByPrincipal]]):
-        self.total_count = context.get_entity_type_total_count(entity_type)
+                 work_items: List[Union[WorkItemFetchByEntityType, WorkItemFetchByPrincipal]],
+                 additional_filter: Optional[str] = None, pending_foreign_keys: Optional[List[Sequence]] = None):
+        self.total_count = context.get_entity_type_total_count(entity_type, additional_filter)
         self.done_count = 0
         self.work_items = work_items
+        # Foreign keys not yet turned into work items, see WorkScheduler._enqueue_pending_foreign_keys
+        self.pending_foreign_keys = pending_foreign_keys or []
         self.entity_type = entity_type
         self.time_begin = timer()
 
@@ -237,7 +482,7 @@ class BacklogInProgressItem:
         Please note: Can not check done_count for equality with work_items because certain servers (i.e. Curia Vista)
         actually return a different number of items than what they indicate when using $inlinecount.
         """
-        return self.done_count > 0 and len(self.work_items) == 0
+        return len(self.work_items) == 0 and len(self.pending_foreign_keys) == 0
 
     def remove_completed_work_item(self, work_item: Union[WorkItemFetchByEntityType, WorkItemFetchByPrincipal]):
         self.done_count += work_item.done_count
@@ -258,11 +503,44 @@ class WorkSchedulerProgressState:
 
 
 class WorkScheduler:
-    def __init__(self, context: Context, db_connection):
+    # Provides the queues between scheduler and fetchers, see _start_fetchers. Fetcher threads share the scheduler's
+    # process, hence items get handed over as they are, without pickling them.
+    _queues = queue
+
+    def __init__(self, context: Context, db_connection, watermarks: Optional[Dict[str, datetime.datetime]] = None,
+                 checkpoint: Optional[Checkpoint] = None, connection_factory: Optional[Callable[[], ContextManager]] = None):
+        """Fetch all entity types included in @context. Those with a @watermarks entry are fetched incrementally,
+        i.e. only entities modified after their watermark. Progress recorded in @checkpoint gets skipped.
+
+        If @connection_factory is given, entities get persisted by a pool of writers, each using its own connection.
+        Otherwise, they get persisted one after another using @db_connection."""
         self._context = context
         self._db_connection = db_connection
-        self._odata_work_queue = multiprocessing.Queue()  # Single writer, multiple consumer
-        self._odata_result_queue = multiprocessing.Queue()  # Multiple writer, single consumer
+        self._watermarks = watermarks or {}
+        self._checkpoint = checkpoint or Checkpoint(db_connection, context.session_id)
+        self._max_modified: Dict[str, datetime.datetime] = {}
+        self._started_at: Dict[str, datetime.datetime] = {}
+        self.upsert_counts: Dict[str, UpsertCounts] = {}
+        self._odata_work_queue = self._queues.Queue()  # Single writer, multiple consumer
+        self._odata_result_queue = self._queues.Queue()  # Multiple writer, single consumer
+        # Bounds the memory used by fetched entities in _odata_result_queue and the writer pool's queues
+        self._budget = InFlightBudget(context.settings.max_in_flight_rows, context.settings.max_in_flight_bytes)
+        self._flow_logged_at = timer()
+        max_connections = context.settings.odata_server_max_connections
+        self._controller = ConcurrencyController(max_connections, max(1, max_connections // 4),
+                                                 context.settings.odata_max_connections,
+                                                 context.settings.adaptive_concurrency)
+        self._request_statistics = RequestStatistics(context.settings.hedge_percentile)
+        self.stage_timings = StageTimings()
+        self._register_metrics()
+        self._archive = None
+        if context.settings.page_archive_directory:
+            self._archive = PageArchive(context.settings.page_archive_directory, context.session_id)
+        self._writer_pool = None
+        if connection_factory:
+            self._writer_pool = DbWriterPool(connection_factory, functools.partial(update_db, context),
+                                             self._odata_result_queue, context.settings.db_writers,
+                                             context.settings.db_writer_queue_depth)
         self._backlog_in_progress: Dict[str, BacklogInProgressItem] = {}
         self._backlog_wait_for_dependencies: Dict[str, Optional[str]] = {}
         for et in context.include:
@@ -270,8 +548,28 @@ class WorkScheduler:
                 self._backlog_wait_for_dependencies[et.name] = principal.name
             else:
                 self._backlog_wait_for_dependencies[et.name] = None
-        self._backlog_done: Dict[str, BacklogInProgressItem] = {}
+        self._backlog_done: Dict[str, Optional[BacklogInProgressItem]] = {}
+        for entity_type_name in self._checkpoint.completed_entity_types & set(self._backlog_wait_for_dependencies):
+            log.info(f'Skipping entity type "{entity_type_name}", completed in a previous run')
+            del self._backlog_wait_for_dependencies[entity_type_name]
+            self._backlog_done[entity_type_name] = None
+        for entity_type_name, principal_name in self._backlog_wait_for_dependencies.items():
+            if principal_name in self._backlog_done:
+                self._backlog_wait_for_dependencies[entity_type_name] = None
         self._progress = None
+        self._fk_batch_size = AdaptiveBatchSize(context.settings.fk_batch_size, context.settings.fk_batch_size_max)
+
+    def _register_metrics(self):
+        """Expose the state of this scheduler's building blocks"""
+        metrics.WORK_QUEUE_DEPTH.set_function(lambda: _queue_size(self._odata_work_queue))
+        metrics.RESULT_QUEUE_DEPTH.set_function(lambda: _queue_size(self._odata_result_queue))
+        metrics.ROWS_IN_FLIGHT.set_function(lambda: self._budget.rows)
+        metrics.BYTES_IN_FLIGHT.set_function(lambda: self._budget.bytes)
+        metrics.ODATA_REQUESTS_IN_FLIGHT.set_function(lambda: self._controller.in_flight)
+        metrics.ODATA_REQUEST_LIMIT.set_function(lambda: self._controller.limit)
+        metrics.ODATA_REQUEST_BACK_OFFS.set_function(lambda: self._controller.back_offs)
+        metrics.ODATA_REQUESTS_HEDGED.set_function(lambda: self._request_statistics.stuck)
+        metrics.ODATA_REQUEST_TIMEOUTS.set_function(lambda: self._request_statistics.timeouts)
 
     def _create_progress_state(self):
         pass
@@ -287,23 +585,109 @@ class WorkScheduler:
         entity_type = self._context.get_entity_type_by_name(entity_type_name)
         if entity_type_name in self._backlog_wait_for_dependencies:
             del self._backlog_wait_for_dependencies[entity_type_name]
-        if principal := self._context.odata_sync_by_fk(entity_type):
+        # Before the first request, bounding the watermark
+        self._started_at[entity_type_name] = self._checkpoint.entity_type_started(entity_type_name)
+        modified_filter = None
+        pending_foreign_keys = None
+        if (watermark := self._watermarks.get(entity_type_name)) and has_modified_property(self._context, entity_type):
+            # Only a few entities changed, so there is no need to work around the server by syncing via the FK
+            modified_filter = odata_filter_modified_since(watermark)
+            work_items = [WorkItemFetchByEntityType(entity_type, self._context, modified_filter,
+                                                    self._checkpoint.next_urls.get(entity_type_name))]
+        elif principal := self._context.odata_sync_by_fk(entity_type):
             rc = self._context.get_referential_constrain(entity_type, principal)
             with self._db_connection.cursor() as cursor:
                 principal_fk_column_names = " ,".join([to_pg_name(n) for n in rc.principal.property_names])
                 cursor.execute(f'SELECT {principal_fk_column_names} FROM odata.{to_pg_name(principal.name)}')
-                all_fk = cursor.fetchall()
-                # TODO: Request more than just one FK per work item
-                work_items = [WorkItemFetchByPrincipal(rc, fk, self._context) for fk in all_fk]
+                pending_foreign_keys = [fk for fk in cursor.fetchall() if
+                                        not self._checkpoint.is_foreign_key_completed(entity_type_name, fk)]
+                # Work items get created step by step, allowing to adapt the number of keys per work item
+                work_items = []
         else:
-            work_items = [WorkItemFetchByEntityType(entity_type, self._context)]
+            # Created once the total count is known
+            work_items = None
         backlog_item = self._backlog_in_progress[entity_type_name] = BacklogInProgressItem(self._context, entity_type,
-                                                                                           work_items)
+                                                                                           work_items or [],
+                                                                                           modified_filter,
+                                                                                           pending_foreign_keys)
+        if work_items is None:
+            for range_ in self._plan_key_ranges(entity_type, backlog_item.total_count):
+                resume_next_url = self._checkpoint.next_urls.get(page_checkpoint_key(entity_type_name, range_))
+                backlog_item.work_items.append(
+                    WorkItemFetchByEntityType(entity_type, self._context, resume_next_url=resume_next_url,
+                                              key_range=range_))
+            work_items = backlog_item.work_items
+        if pending_foreign_keys:
+            log.info(f'Enqueue work for fetching {backlog_item.total_count} entities of type "{entity_type_name}"'
+                     f' by {len(pending_foreign_keys)} foreign keys of "{principal.name}"')
+            self._enqueue_pending_foreign_keys(backlog_item)
+            return
         log.info(
-            f'Enqueue work for fetching {backlog_item.total_count} entities of type "{entity_type_name}" using {len(work_items)} work items')
+            f'Enqueue work for fetching {backlog_item.total_count} entities of type "{entity_type_name}" using {len(work_items)} work items'
+            + (f' ({modified_filter})' if modified_filter else ''))
+        if not work_items:
+            self._complete_entity_type(entity_type_name)
         for work_item in work_items:
             self._odata_work_queue.put(work_item)
 
+    def _plan_key_ranges(self, entity_type: EntityType, total_count: int) -> List[Optional[KeyRange]]:
+        """Split large entity sets into key ranges, allowing to fetch them using multiple connections. Boundaries get
+        derived from the entities synced by previous runs, otherwise from the lowest and highest key on the server.
+        Ranges already completed by a previous run of the same session get skipped."""
+        key_property = range_key_property(entity_type)
+        if planned := self._checkpoint.key_ranges.get(entity_type.name):
+            log.info(f'Resuming "{entity_type.name}" using {len(planned)} key ranges of a previous run')
+            return [key_range(key_property, lower, upper) for lower, upper, completed in planned if not completed]
+        size = self._context.settings.key_range_size
+        if not key_property or not size or total_count < 2 * size:
+            return [None]
+        count = min(self._context.settings.odata_server_max_connections, total_count // size)
+        boundaries = boundaries_from_database(self._db_connection, entity_type, key_property, count, total_count // 2)
+        if not boundaries:
+            boundaries = boundaries_from_server(self._context, entity_type, key_property, count)
+        ranges = key_ranges(key_property, boundaries)
+        if len(ranges) == 1:
+            return [None]
+        log.info(f'Splitting {total_count} entities of type "{entity_type.name}" into {len(ranges)} key ranges:'
+                 f' {", ".join(str(r) for r in ranges)}')
+        self._checkpoint.key_ranges_planned(entity_type.name, [(r.lower, r.upper) for r in ranges])
+        return ranges
+
+    def _enqueue_pending_foreign_keys(self, backlog_item: BacklogInProgressItem):
+        """Turn pending foreign keys into work items, sized as currently suggested. Only a few work items get
+        enqueued at once, so the size can adapt to the server's response times."""
+        rc = self._get_referential_constraint(backlog_item.entity_type)
+        max_work_items = 2 * self._context.settings.odata_server_max_connections
+        while backlog_item.pending_foreign_keys and len(backlog_item.work_items) < max_work_items:
+            size = int(self._fk_batch_size)
+            foreign_keys = backlog_item.pending_foreign_keys[:size]
+            del backlog_item.pending_foreign_keys[:size]
+            self._enqueue_work_item(backlog_item, WorkItemFetchByPrincipal(rc, foreign_keys, self._context))
+
+    def _get_referential_constraint(self, dependant: EntityType) -> ReferentialConstraint:
+        return self._context.get_referential_constrain(dependant, self._context.odata_sync_by_fk(dependant))
+
+    def _enqueue_work_item(self, backlog_item: BacklogInProgressItem, work_item: WorkItemFetchByPrincipal):
+        backlog_item.work_items.append(work_item)
+        self._odata_work_queue.put(work_item)
+
+    def _retry_failed_work_item(self, work_item: WorkItemFetchByPrincipal):
+        """Split failed @work_item in halves and enqueue them again. A single foreign key gets MAX_ATTEMPTS attempts of
+        its own, regardless of how many splits it took to isolate it."""
+        if work_item.attempt >= MAX_ATTEMPTS and len(work_item.foreign_keys) == 1:
+            raise RuntimeError(f'{work_item}: Giving up after {work_item.attempt} attempts')
+        metrics.FOREIGN_KEY_RETRIES.inc(entity_type=work_item.entity_type_name)
+        self._fk_batch_size.failed()
+        backlog_item = self._backlog_in_progress[work_item.entity_type_name]
+        backlog_item.work_items.remove(work_item)
+        rc = self._get_referential_constraint(backlog_item.entity_type)
+        half = (len(work_item.foreign_keys) + 1) // 2
+        for foreign_keys in (work_item.foreign_keys[:half], work_item.foreign_keys[half:]):
+            if foreign_keys:
+                attempt = next_attempt(work_item.attempt, len(work_item.foreign_keys), len(foreign_keys))
+                self._enqueue_work_item(backlog_item, WorkItemFetchByPrincipal(rc, foreign_keys, self._context,
+                                                                               attempt))
+
     def _work_item_done(self, work_item_done: 'WorkItemFetchByEntityType'):
         """Remove @work_item, which is finished by now, from all backlog items. Backlog items without any work items
         left get remove from the backlog."""
@@ -312,18 +696,31 @@ class WorkScheduler:
             if work_item_done not in backlog_item.work_items:
                 continue
             backlog_item.remove_completed_work_item(work_item_done)
-            if not backlog_item.done:
-                continue
-            del self._backlog_in_progress[backlog_item_name]
-            self._backlog_done[backlog_item_name] = backlog_item
-            log.info(
-                f'Completed entity type "{backlog_item_name}" with {backlog_item.done_count} items after {timer() - backlog_item.time_begin} seconds')
-            # Try to enqueue work items which are no longer blocked
-            for waiting_entity_type_name in list(self._backlog_wait_for_dependencies.keys()):
-                if backlog_item_name == self._backlog_wait_for_dependencies[waiting_entity_type_name]:
-                    self._enqueue_entity_type(waiting_entity_type_name)
+            if type(work_item_done) is WorkItemFetchByEntityType and (range_ := work_item_done.key_range):
+                self._checkpoint.key_range_completed(work_item_done.entity_type_name, range_.lower, range_.upper)
+            if type(work_item_done) is WorkItemFetchByPrincipal:
+                self._checkpoint.foreign_keys_completed(work_item_done.entity_type_name, work_item_done.foreign_keys)
+                self._fk_batch_size.succeeded(len(work_item_done.foreign_keys), work_item_done.max_request_seconds)
+                self._enqueue_pending_foreign_keys(backlog_item)
+            if backlog_item.done:
+                self._complete_entity_type(backlog_item_name)
         self._log_progress_conditionally()
 
+    def _complete_entity_type(self, entity_type_name: str):
+        """Move @entity_type_name from in progress to done, enqueue entity types waiting for it"""
+        backlog_item = self._backlog_done[entity_type_name] = self._backlog_in_progress.pop(entity_type_name)
+        log.info(
+            f'Completed entity type "{entity_type_name}" with {backlog_item.done_count} items after {timer() - backlog_item.time_begin} seconds'
+            f' ({self.upsert_counts.get(entity_type_name, UpsertCounts())})')
+        if modified := self._max_modified.get(entity_type_name):
+            store_watermark(self._db_connection, self._context, backlog_item.entity_type,
+                            next_watermark(modified, self._started_at[entity_type_name]))
+        self._checkpoint.entity_type_completed(entity_type_name)
+        # Try to enqueue work items which are no longer blocked
+        for waiting_entity_type_name in list(self._backlog_wait_for_dependencies.keys()):
+            if entity_type_name == self._backlog_wait_for_dependencies[waiting_entity_type_name]:
+                self._enqueue_entity_type(waiting_entity_type_name)
+
     def _backlog_size(self):
         return len(self._backlog_wait_for_dependencies) + len(self._backlog_in_progress)
 
@@ -347,72 +744,271 @@ class WorkScheduler:
             total_entities += self._context.get_entity_type_total_count(entity_type)
         return total_entities
 
-    def run(self):
+    def flow_statistics(self) -> str:
+        """Fill level of the queues between fetchers and writers"""
+        statistics = (f'{_queue_size(self._odata_work_queue)} work items queued,'
+                      f' {_queue_size(self._odata_result_queue)} results queued')
+        if self._writer_pool:
+            statistics += f', writer queues {self._writer_pool.queue_depths()}'
+        return f'{statistics}, {self._budget}, {self._controller}, {self._request_statistics}'
+
+    def _log_flow_conditionally(self):
+        if timer() - self._flow_logged_at >= FLOW_LOG_INTERVAL:
+            log.info(f'Flow: {self.flow_statistics()}')
+            self._flow_logged_at = timer()
+
+    def _work_item_persisted(self, persisted: WorkItemPersisted):
+        self._budget.release(persisted.total, persisted.payload_bytes)
+        self.stage_timings.record(persisted.entity_type_name, persisted.total, persisted.stage_seconds)
+        if persisted.upsert_counts:
+            self.upsert_counts[persisted.entity_type_name] = (
+                    self.upsert_counts.get(persisted.entity_type_name, UpsertCounts()) + persisted.upsert_counts)
+        if persisted.max_modified:
+            current = self._max_modified.get(persisted.entity_type_name)
+            self._max_modified[persisted.entity_type_name] = max(persisted.max_modified, current or persisted.max_modified)
+        if persisted.checkpoint_key and persisted.next_url:
+            self._checkpoint.page_persisted(persisted.checkpoint_key, persisted.next_url)
+
+    def _start_fetchers(self):
+        """Start consuming work items from _odata_work_queue, putting results on _odata_result_queue"""
         for i in range(self._context.settings.odata_server_max_connections):
             Thread(target=do_odata_fetch,
-                   args=(self._context.settings, self._odata_work_queue, self._odata_result_queue),
+                   args=(self._context, self._odata_work_queue, self._odata_result_queue, self._budget,
+                         self._controller, self._request_statistics, self._archive),
                    daemon=True, name=f'OData worker thread #{i}').start()
 
+    def _stop_fetchers(self):
+        """Worker threads are daemons, hence left alone"""
+        pass
+
+    def run(self):
+        self._start_fetchers()
+        if self._writer_pool:
+            self._writer_pool.start()
+
         self._enqueue_ready_entity_types()
         self._log_progress_conditionally()
 
         try:
             with alive_bar(self.total_entities_count(), title='Processed items', enrich_print=False) as bar:
                 while self._backlog_size():
+                    self._log_flow_conditionally()
                     work_item = self._odata_result_queue.get()
                     # The following block relies on DbPersisting items being inserted *before* the WorkItemFetch ones!
                     if type(work_item) is WorkItemDbPersisting:
-                        update_db(self._context, self._db_connection, work_item)
                         log.debug(
                             f'Writing {work_item.total} entities of type {work_item.entity_type_name} to database')
+                        if self._writer_pool:
+                            self._writer_pool.submit(work_item)
+                            continue
+                        update_db(self._context, self._db_connection, work_item)
+                        work_item = WorkItemPersisted(work_item)
+                    if type(work_item) is WorkItemPersisted:
+                        self._work_item_persisted(work_item)
                         bar(work_item.total)
                         continue
+                    if type(work_item) is WorkItemFetchByPrincipal and work_item.failed:
+                        self._retry_failed_work_item(work_item)
+                        continue
                     if type(work_item) in (WorkItemFetchByPrincipal, WorkItemFetchByEntityType):
-                        self._work_item_done(work_item)
+                        if self._writer_pool:
+                            # Wait for the writer to persist all of the work item's entities
+                            self._writer_pool.barrier(work_item)
+                            continue
+                        work_item = WorkItemDurable(work_item)
+                    if type(work_item) is WorkItemDurable:
+                        self._work_item_done(work_item.work_item)
                         continue
-                    if type(work_item) is Exception:
+                    if isinstance(work_item, Exception):
                         log.error(f'Error from worker thread: {work_item}')
                         log.error('Shutting down')
-                        return
+                        raise work_item
                     log.error(f'Can not process work item {work_item}')
                     break
         except Exception as e:
             while not self._odata_work_queue.empty():
                 self._odata_work_queue.get_nowait()
             raise e
+        finally:
+            self._stop_fetchers()
+            if self._writer_pool:
+                self._writer_pool.shutdown()
+            if self._archive:
+                self._archive.close()
+                log.info(f'Archive: {self._archive}')
+            log.info(f'Flow: {self.flow_statistics()}')
+
+
+def _queue_size(q: multiprocessing.Queue) -> Optional[int]:
+    """Approximate size of @q, None where the platform does not tell (i.e. macOS)"""
+    try:
+        return q.qsize()
+    except NotImplementedError:
+        return None
+
+
+@dataclasses.dataclass
+class UpsertCounts:
+    """Outcome of upserting rows. Rows are unchanged if identical to the stored ones (see odata2sql.row_hash)."""
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+    def __add__(self, other: 'UpsertCounts') -> 'UpsertCounts':
+        return UpsertCounts(self.inserted + other.inserted, self.updated + other.updated,
+                            self.unchanged + other.unchanged)
+
+    def __str__(self):
+        return f'{self.inserted} inserted, {self.updated} updated, {self.unchanged} unchanged'
+
+
+@dataclasses.dataclass(frozen=True)
+class _Upsert:
+    """What update_db actually writes for a WorkItemDbPersisting: Its columns, plus the row hash if supported"""
+    columns: List[str]
+    column_types: List[str]
+    rows: Sequence[Sequence]
+    hashed: bool
+
+
+def _prepare_upsert(context: Context, db_connection, work_item: WorkItemDbPersisting) -> _Upsert:
+    entity_type = context.get_entity_type_by_name(work_item.entity_type_name)
+    column_types = get_edm_type_names_of_columns(entity_type, work_item.columns)
+    if not has_row_hash_column(db_connection, work_item.table_name):
+        return _Upsert(work_item.columns, column_types, work_item.rows, False)
+    return _Upsert(work_item.columns + [ROW_HASH_COLUMN], column_types + [ROW_HASH_TYPE],
+                   with_row_hashes(work_item.rows, column_types), True)
+
+
+def _upsert_statement_suffix(work_item: WorkItemDbPersisting, upsert: _Upsert) -> str:
+    """Tells inserted from updated rows. Rows with an unchanged hash are left alone, sparing dead tuples, WAL and
+    index maintenance, hence not returned at all."""
+    suffix = (f' ON CONFLICT ON CONSTRAINT {work_item.pk_name}'
+              f' DO UPDATE SET {", ".join([f"{c} = EXCLUDED.{c}" for c in upsert.columns])}')
+    if upsert.hashed:
+        suffix += (f' WHERE odata.{work_item.table_name}.{ROW_HASH_COLUMN}'
+                   f' IS DISTINCT FROM EXCLUDED.{ROW_HASH_COLUMN}')
+    return suffix + ' RETURNING (xmax = 0) AS inserted'
 
 
 def update_db(context: Context, db_connection, work_item: WorkItemDbPersisting):
-    """Update multiple values at one. On error, start bisecting until the offending entry(s) got found."""
-    table_name_pkey = work_item.pk_name
-    statement = (f'INSERT INTO odata.{work_item.table_name} ({", ".join(work_item.columns)})'
-                 f' VALUES ({", ".join(["%s"] * len(work_item.columns))}) '
-                 f' ON CONFLICT ON CONSTRAINT {table_name_pkey} DO UPDATE SET {", ".join([f"{c} = EXCLUDED.{c}" for c in work_item.columns])};')
-    log.debug(f'Running "{statement} on {len(work_item.rows)} rows')
+    """Persist @work_item using the configured database loader, recording the outcome in its upsert_counts"""
+    begin = timer()
+    work_item.stage_seconds['queue'] = begin - work_item.created_at
+    upsert = _prepare_upsert(context, db_connection, work_item)
+    if context.settings.db_loader == 'copy-text':
+        counts = update_db_copy(context, db_connection, work_item, upsert, 'text')
+    elif context.settings.db_loader == 'copy-binary':
+        counts = update_db_copy(context, db_connection, work_item, upsert, 'binary')
+    else:
+        counts = update_db_execute_batch(context, db_connection, work_item, upsert)
+    work_item.upsert_counts = counts
+    work_item.stage_seconds['persist'] = timer() - begin
+    metrics.UPDATE_DB_SECONDS.observe(work_item.stage_seconds['persist'], table=work_item.table_name)
+    metrics.ROWS_PERSISTED.inc(work_item.total, table=work_item.table_name)
+    metrics.BYTES_PERSISTED.inc(work_item.payload_bytes, table=work_item.table_name)
+    for outcome, count in dataclasses.asdict(counts).items():
+        metrics.ROWS_UPSERTED.inc(count, table=work_item.table_name, outcome=outcome)
+    metrics.LAST_PERSISTED.set(time.time())
+
+
+def update_db_copy(context: Context, db_connection, work_item: WorkItemDbPersisting, upsert: _Upsert,
+                   copy_format: str) -> UpsertCounts:
+    """Stream all rows into a temporary staging table using COPY, then merge them using a single upsert.
+
+    If anything goes wrong, fall back to update_db_execute_batch, which is able to isolate the offending row(s).
+    """
+    entity_type = context.get_entity_type_by_name(work_item.entity_type_name)
+    key_indexes = [upsert.columns.index(c) for c in get_gp_column_names_from_keys(entity_type)]
+    # A single upsert must not affect the same row twice, let the last one win (as execute_batch would)
+    rows = last_per_key(upsert.rows, key_indexes)
+    columns = ", ".join(upsert.columns)
+    statement = (f'WITH upserted AS (INSERT INTO odata.{work_item.table_name} ({columns})'
+                 f' SELECT {columns} FROM {work_item.staging_table_name}' + _upsert_statement_suffix(work_item, upsert) +
+                 ') SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted')
+    log.debug(f'Running "{statement}" on {len(rows)} rows copied in {copy_format} format')
+    db_connection.commit()
+    try:
+        with db_connection.cursor() as cur:
+            cur.execute(f'CREATE TEMPORARY TABLE IF NOT EXISTS {work_item.staging_table_name}'
+                        f' (LIKE odata.{work_item.table_name} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS')
+            copy_rows(cur, work_item.staging_table_name, upsert.columns, upsert.column_types, rows, copy_format)
+            cur.execute(statement)
+            inserted, updated = cur.fetchone()
+        db_connection.commit()
+        return UpsertCounts(inserted, updated, len(rows) - inserted - updated)
+    except psycopg2.Error as e:
+        db_connection.rollback()
+        log.warning(f'Bulk loading {len(rows)} rows into "{work_item.table_name}" failed, bisecting: {e}')
+        metrics.COPY_FALLBACKS.inc(table=work_item.table_name)
+        return update_db_execute_batch(context, db_connection, work_item, upsert)
+
+
+def update_db_execute_batch(context: Context, db_connection, work_item: WorkItemDbPersisting,
+                            upsert: _Upsert) -> UpsertCounts:
+    """Update multiple values at once, within a single transaction. On error, bisect using savepoints until the
+    offending entries got isolated, which end up in quarantine."""
+    statement = (f'INSERT INTO odata.{work_item.table_name} ({", ".join(upsert.columns)}) VALUES %s' +
+                 _upsert_statement_suffix(work_item, upsert))
+    entity_type = context.get_entity_type_by_name(work_item.entity_type_name)
+    key_columns = get_gp_column_names_from_keys(entity_type)
+    # Multiple rows per statement, which must not affect the same row twice. Let the last one win.
+    rows = last_per_key(upsert.rows, [upsert.columns.index(c) for c in key_columns])
+    log.debug(f'Running "{statement} on {len(rows)} rows')
+    counts = UpsertCounts()
     db_connection.commit()
     with db_connection.cursor() as cur:
-        def do_many(rows):
+        def apply(rows_):
+            cur.execute('SAVEPOINT bisect')
             try:
-                execute_batch(cur, statement, rows, page_size=1000)
-                db_connection.commit()
-                return
+                results = execute_values(cur, statement, rows_, page_size=1000, fetch=True)
             except ProgrammingError as e:
                 db_connection.rollback()
                 log.fatal(e)
                 log.fatal(f"Failed statement: {statement}")
                 sys.exit(-1)
-            except psycopg2.Error as e:
-                db_connection.rollback()
-                if len(rows) == 1:
-                    log.error(
-                        f'Error when inserting data {str(rows[0])} using columns {str(work_item.columns)} to "{work_item.table_name}" : {e}')
-                    db_connection.commit()
-                    return
-            # On failure, retry one by one
-            for row in rows:
-                do_many([row])
+            except psycopg2.Error:
+                cur.execute('ROLLBACK TO SAVEPOINT bisect')
+                cur.execute('RELEASE SAVEPOINT bisect')
+                raise
+            cur.execute('RELEASE SAVEPOINT bisect')
+            inserted = sum(1 for (i,) in results if i)
+            counts.inserted += inserted
+            counts.updated += len(results) - inserted
+            counts.unchanged += len(rows_) - len(results)
+
+        def reject(row, e: psycopg2.Error):
+            log.error(f'Error when inserting data {str(row)} using columns {str(upsert.columns)}'
+                      f' to "{work_item.table_name}" : {e}')
+            quarantine_row(cur, context.session_id, work_item.entity_type_name, work_item.columns, key_columns, row,
+                           str(e).strip())
+            metrics.ROWS_QUARANTINED.inc(table=work_item.table_name)
+
+        rejected = apply_bisecting(rows, apply, reject, psycopg2.Error)
+    db_connection.commit()
+    if rejected:
+        log.warning(f'Quarantined {rejected} out of {len(rows)} rows of "{work_item.table_name}"')
+    return counts
 
-        do_many(work_item.rows)
+
+def apply_bisecting(rows: Sequence, apply: Callable[[Sequence], None], reject: Callable[[Any, Exception], None],
+                    errors=Exception) -> int:
+    """Pass all @rows to @apply at once. If that raises one of @errors, split them in halves and try again,
+    recursively, until the offending rows got isolated. Those get passed to @reject, along with their error.
+
+    @apply must not leave any effects behind when failing. A single bad row costs O(log n) extra calls.
+    Returns the number of rejected rows.
+    """
+    try:
+        apply(rows)
+        return 0
+    except errors as e:
+        if len(rows) == 1:
+            reject(rows[0], e)
+            return 1
+    half = len(rows) // 2
+    return (apply_bisecting(rows[:half], apply, reject, errors) +
+            apply_bisecting(rows[half:], apply, reject, errors))
 
 
 def get_gp_column_names_from_entity_type(entity_type: EntityType) -> List[str]:
@@ -420,19 +1016,75 @@ def get_gp_column_names_from_entity_type(entity_type: EntityType) -> List[str]:
     return [to_pg_name(n) for n in get_property_names_of_entity_type(entity_type)]
 
 
-def work(context: Context, args):
-    """Sync of OData into our own database. On conflict, existing data will be overwritten"""
+def get_gp_column_names_from_keys(entity_type: EntityType) -> List[str]:
+    """SQL column names of the primary key derived from an entity type"""
+    return [to_pg_name(p.name) for p in entity_type.key_proprties]
+
+
+def get_edm_type_names_of_columns(entity_type: EntityType, columns: List[str]) -> List[str]:
+    """Edm type names (e.g. Edm.Int32) of the SQL @columns derived from an entity type"""
+    type_names = {to_pg_name(p.name): p.typ.name for p in entity_type.proprties()}
+    return [type_names[c] for c in columns]
+
+
+def work(context: Context, args, incremental: bool = False):
+    """Sync of OData into our own database. On conflict, existing data will be overwritten.
+
+    If @incremental, only entities modified since the last sync are fetched (given their entity type provides the
+    Modified property, otherwise all of them). Unless @incremental, secondary indexes may get deferred until all
+    entities are stored, see Settings.defer_indexes. Returns the scheduler, e.g. to inspect its stage_timings.
+    """
 
     # Print what we are about to do
     log.info(f'Entity types to sync: {", ".join(e.name for e in context.include)}')
     if context.skip:
         log.warning(f'Entity types to skip: {", ".join(e.name for e in context.skip)}')
 
-    with database_connection(args) as db_connection:
-        # Configure logging to database
-        db_logger = LogDbHandler(context.session_id, db_connection)
-        log.addHandler(db_logger)
-
-        # Add all entity types to WorkManager
-        scheduler = WorkScheduler(context, db_connection)
+    with database_connection(args) as db_connection, \
+            log_to_database(log, context.session_id, functools.partial(database_connection, args)), \
+            metrics.expose_metrics(getattr(args, 'metrics_port', None), getattr(args, 'metrics_file', None)):
+        watermarks = load_watermarks(db_connection, context) if incremental else {}
+        for entity_type in sorted(context.include, key=lambda et: et.name):
+            if incremental and entity_type.name not in watermarks:
+                log.info(f'No watermark for entity type "{entity_type.name}", falling back to fetching all entities')
+
+        checkpoint = Checkpoint(db_connection, context.session_id)
+        if getattr(args, 'resume', None):
+            checkpoint.load()
+
+        connection_factory = functools.partial(database_connection, args)
+        table_names = [to_snake_case(entity_type.name) for entity_type in context.include]
+        defer = context.settings.defer_indexes and not incremental
+        if defer:
+            defer_indexes(db_connection, table_names, context.session_id)
+        else:
+            # Left behind by an interrupted full sync, if any
+            rebuild_indexes(db_connection, connection_factory, context.settings.db_writers,
+                            context.settings.maintenance_work_mem)
+
+        if context.settings.sync_engine == 'asyncio':
+            # Optional dependency
+            from odata2sql.sync_asyncio import AsyncWorkScheduler
+            scheduler = AsyncWorkScheduler(context, db_connection, watermarks, checkpoint)
+        elif context.settings.sync_engine == 'multiprocessing':
+            from odata2sql.sync_multiprocessing import ProcessWorkScheduler
+            scheduler = ProcessWorkScheduler(context, db_connection, watermarks, checkpoint, connection_factory)
+        else:
+            # Add all entity types to WorkManager
+            scheduler = WorkScheduler(context, db_connection, watermarks, checkpoint, connection_factory)
         scheduler.run()
+        if defer:
+            rebuild_indexes(db_connection, connection_factory, context.settings.db_writers,
+                            context.settings.maintenance_work_mem, analyze=table_names)
+        run_post_sync_scripts(db_connection)
+        return scheduler
+
+
+def run_post_sync_scripts(db_connection):
+    """Refresh what is derived from the synced entities, e.g. stable.vote, by running the post-sync scripts"""
+    log.info(f'Run post-sync scripts')
+    with db_connection.cursor() as cur:
+        run_sql_scripts(cur, Path(__file__).parent.joinpath('post-sync.d'))
+        log.info(f'Run service specific post-sync scripts')
+        run_sql_scripts(cur, Path(__file__).parent.joinpath('../post-sync.d'))
+    db_connection.commit()
@@ -0,0 +1,137 @@
+import contextlib
+import functools
+import logging
+import threading
+from timeit import default_timer as timer
+from typing import Dict, Optional, Callable
+
+import requests
+from pyodata.exceptions import HttpError
+
+from odata2sql.metrics import ODATA_REQUEST_SECONDS, ODATA_REQUEST_FAILURES
+
+log = logging.getLogger(__name__)
+
+
+def is_overload(e: Exception) -> bool:
+    """Whether @e hints at the OData server being overloaded: Timeouts, resets or server side errors"""
+    if isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    if isinstance(e, (requests.exceptions.HTTPError, HttpError)) and e.response is not None:
+        return e.response.status_code >= 500
+    return False
+
+
+class ConcurrencyController:
+    """Limit the number of concurrent requests towards the OData server, adapting the limit to the server's health.
+
+    Additive increase, multiplicative decrease (AIMD): Every request answered within @target_seconds raises the limit
+    by 1/limit, i.e. by one per round of requests, up to @maximum. Slow requests lower the limit by one. Requests failing
+    due to overload (see is_overload) halve it, at most once per @cooldown_seconds, as requests in flight at the time of
+    the overload tend to fail together.
+
+    Additionally, requests for an entity type never exceed its cap given by @caps (if any). If not @adaptive, the limit
+    stays at @maximum. Thread-safe.
+    """
+
+    def __init__(self, maximum: int, initial: Optional[int] = None, caps: Optional[Callable[[str], Optional[int]]] = None,
+                 adaptive: bool = True, target_seconds: float = 10.0, cooldown_seconds: float = 5.0,
+                 minimum: int = 1):
+        self._maximum = maximum
+        self._minimum = min(minimum, maximum)
+        self._limit = float(maximum if not adaptive or initial is None else max(self._minimum, min(initial, maximum)))
+        self._caps = caps or (lambda key: None)
+        self._adaptive = adaptive
+        self._target_seconds = target_seconds
+        self._cooldown_seconds = cooldown_seconds
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._in_flight_by_key: Dict[str, int] = {}
+        self._decreased_at = None
+        # Key of the request the current thread is in, if any (see try_acquire)
+        self._local = threading.local()
+        self.peak_limit = int(self._limit)
+        self.back_offs = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _may_start(self, key: str) -> bool:
+        if self._in_flight >= self.limit:
+            return False
+        cap = self._caps(key)
+        return cap is None or self._in_flight_by_key.get(key, 0) < cap
+
+    def _set_limit(self, limit: float, reason: str):
+        limit = max(self._minimum, min(self._maximum, limit))
+        if int(limit) != int(self._limit):
+            log.info(f'Adjusting concurrent requests from {int(self._limit)} to {int(limit)}: {reason}')
+        self._limit = limit
+        self.peak_limit = max(self.peak_limit, int(limit))
+        self._condition.notify_all()
+
+    def _succeeded(self, seconds: float):
+        if seconds > self._target_seconds:
+            self._set_limit(self._limit - 1, f'slow request ({seconds:.1f}s)')
+        else:
+            self._set_limit(self._limit + 1 / self._limit, f'healthy requests ({seconds:.1f}s)')
+
+    def _overloaded(self, e: Exception):
+        now = timer()
+        if self._decreased_at is not None and now - self._decreased_at < self._cooldown_seconds:
+            return
+        self._decreased_at = now
+        self.back_offs += 1
+        self._set_limit(self._limit / 2, f'server overloaded ({e!r})')
+
+    @contextlib.contextmanager
+    def request(self, key: str):
+        """Wrap a single request concerning @key (i.e. an entity type name), blocks until it may start"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._may_start(key))
+            self._in_flight += 1
+            self._in_flight_by_key[key] = self._in_flight_by_key.get(key, 0) + 1
+        self._local.key = key
+        begin = timer()
+        try:
+            yield
+        except Exception as e:
+            ODATA_REQUEST_FAILURES.inc(entity_type=key)
+            if self._adaptive and is_overload(e):
+                with self._condition:
+                    self._overloaded(e)
+            raise
+        else:
+            seconds = timer() - begin
+            ODATA_REQUEST_SECONDS.observe(seconds, entity_type=key)
+            if self._adaptive:
+                with self._condition:
+                    self._succeeded(seconds)
+        finally:
+            self._local.key = None
+            self._release(key)
+
+    def _release(self, key: str):
+        with self._condition:
+            self._in_flight -= 1
+            self._in_flight_by_key[key] -= 1
+            self._condition.notify_all()
+
+    def try_acquire(self) -> Optional[Callable[[], None]]:
+        """Take another slot for the key of the request the current thread is in (see request), e.g. to hedge it. Does
+        not block, returns the function to release the slot with or None if no slot is available."""
+        key = getattr(self._local, 'key', None)
+        with self._condition:
+            if key is None or not self._may_start(key):
+                return None
+            self._in_flight += 1
+            self._in_flight_by_key[key] += 1
+        return functools.partial(self._release, key)
+
+    def __str__(self):
+        return f'{self._in_flight} requests in flight, limit {self.limit} (peak {self.peak_limit}), {self.back_offs} back-offs'
@@ -0,0 +1,107 @@
+import logging
+import queue
+from threading import Thread
+from typing import Callable, ContextManager, Dict, List, Any
+
+from odata2sql.sql import to_pg_name
+from odata2sql.watermark import track_modified
+
+log = logging.getLogger(__name__)
+
+
+class WorkItemPersisted:
+    """Acknowledge @work_item (a WorkItemDbPersisting) to be durable. Retains only what is needed to track progress."""
+    __slots__ = ('entity_type_name', 'total', 'payload_bytes', 'checkpoint_key', 'next_url', 'stage_seconds',
+                 'max_modified', 'upsert_counts')
+
+    def __init__(self, work_item):
+        self.entity_type_name = work_item.entity_type_name
+        self.total = work_item.total
+        self.payload_bytes = work_item.payload_bytes
+        self.checkpoint_key = work_item.checkpoint_key
+        self.next_url = work_item.next_url
+        self.stage_seconds = work_item.stage_seconds
+        self.upsert_counts = work_item.upsert_counts
+        max_modified = {}
+        track_modified(max_modified, work_item)
+        self.max_modified = max_modified.get(work_item.entity_type_name)
+
+
+class WorkItemDurable:
+    """Acknowledge all rows produced by @work_item (a WorkItemFetch*) to be durable"""
+    __slots__ = ('work_item',)
+
+    def __init__(self, work_item):
+        self.work_item = work_item
+
+
+class _Barrier:
+    def __init__(self, work_item):
+        self.work_item = work_item
+
+
+class DbWriterPool:
+    """Apply WorkItemDbPersisting items concurrently, each writer thread using its own database connection.
+
+    All items of a table are handled by the same writer, which keeps ON CONFLICT contention between writers low and
+    retains the order of items per table. Acknowledgements are put on @output: WorkItemPersisted for every persisted
+    item and WorkItemDurable once all items submitted before the corresponding barrier() are durable.
+    """
+
+    def __init__(self, connection_factory: Callable[[], ContextManager], apply: Callable[[Any, Any], None],
+                 output, writer_count: int, queue_depth: int):
+        """@apply gets called with a connection and a WorkItemDbPersisting"""
+        self._connection_factory = connection_factory
+        self._apply = apply
+        self._output = output
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=queue_depth) for _ in range(writer_count)]
+        self._threads: List[Thread] = []
+        self._table_to_writer: Dict[str, int] = {}
+
+    def start(self):
+        for i, input_ in enumerate(self._queues):
+            thread = Thread(target=self._write, args=(input_,), daemon=True, name=f'Database writer thread #{i}')
+            thread.start()
+            self._threads.append(thread)
+
+    def _writer_queue(self, table_name: str) -> queue.Queue:
+        """Queue of the writer responsible for @table_name, assigned round-robin on first use"""
+        if table_name not in self._table_to_writer:
+            self._table_to_writer[table_name] = len(self._table_to_writer) % len(self._queues)
+        return self._queues[self._table_to_writer[table_name]]
+
+    def submit(self, work_item):
+        """Enqueue @work_item for persisting, blocks if the responsible writer is too far behind"""
+        self._writer_queue(work_item.table_name).put(work_item)
+
+    def barrier(self, work_item):
+        """Acknowledge @work_item once everything submitted before for its entity type is durable"""
+        self._writer_queue(to_pg_name(work_item.entity_type_name)).put(_Barrier(work_item))
+
+    def queue_depths(self) -> List[int]:
+        return [q.qsize() for q in self._queues]
+
+    def _write(self, input_: queue.Queue):
+        try:
+            with self._connection_factory() as connection:
+                while True:
+                    item = input_.get()
+                    if item is None:
+                        break
+                    if type(item) is _Barrier:
+                        self._output.put(WorkItemDurable(item.work_item))
+                        continue
+                    self._apply(connection, item)
+                    self._output.put(WorkItemPersisted(item))
+        except (Exception, SystemExit) as e:
+            log.error(f'Database writer failed: {e!r}')
+            self._output.put(RuntimeError(f'Database writer failed: {e!r}'))
+            # Keep consuming, so neither submit() nor shutdown() block forever
+            while input_.get() is not None:
+                pass
+
+    def shutdown(self):
+        for input_ in self._queues:
+            input_.put(None)
+        for thread in self._threads:
+            thread.join()
@@ -0,0 +1,91 @@
+import concurrent.futures
+import logging
+import uuid
+from timeit import default_timer as timer
+from typing import Callable, ContextManager, Dict, Iterable, List, Optional, Tuple
+
+from odata2sql.sql import to_pg_name
+
+log = logging.getLogger(__name__)
+
+# Indexes of the odata schema maintained for the sake of queries only, i.e. neither enforcing uniqueness (which upserts
+# rely on) nor backing a constraint. Indexes of partitions are covered by the one of their partitioned table.
+_SECONDARY_INDEXES = """
+    SELECT format('%%I.%%I', n.nspname, c.relname), t.relname, pg_get_indexdef(i.indexrelid)
+    FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_class t ON t.oid = i.indrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+    WHERE n.nspname = 'odata' AND t.relname = ANY(%s) AND NOT t.relispartition AND NOT i.indisunique
+        AND NOT EXISTS (SELECT FROM pg_constraint WHERE conindid = i.indexrelid)
+    ORDER BY t.relname, c.relname"""
+
+
+def defer_indexes(db_connection, table_names: Iterable[str], session_id: uuid.UUID) -> int:
+    """Drop the secondary indexes of the tables named @table_names (unquoted), keeping their definitions in
+    private.deferred_index for rebuild_indexes. Returns the number of indexes dropped."""
+    with db_connection.cursor() as cur:
+        cur.execute(_SECONDARY_INDEXES, (sorted(table_names),))
+        indexes = cur.fetchall()
+        for index_name, table_name, definition in indexes:
+            cur.execute('INSERT INTO private.deferred_index (index_name, table_name, definition, session_id)'
+                        ' VALUES (%s, %s, %s, %s)', (index_name, table_name, definition, str(session_id)))
+            cur.execute(f'DROP INDEX {index_name}')
+    # Definitions and drops are committed together, so an interrupted sync can not lose an index
+    db_connection.commit()
+    log.info(f'Deferred {len(indexes)} secondary indexes until the sync is done')
+    return len(indexes)
+
+
+def load_deferred_indexes(db_connection) -> Dict[str, List[Tuple[str, str]]]:
+    """Names and definitions of the indexes dropped by defer_indexes (including those of interrupted syncs) per table"""
+    with db_connection.cursor() as cur:
+        cur.execute('SELECT table_name, index_name, definition FROM private.deferred_index'
+                    ' ORDER BY table_name, index_name')
+        deferred = {}
+        for table_name, index_name, definition in cur.fetchall():
+            deferred.setdefault(table_name, []).append((index_name, definition))
+        return deferred
+
+
+def _rebuild_table(connection_factory: Callable[[], ContextManager], table_name: str,
+                   indexes: List[Tuple[str, str]], maintenance_work_mem: Optional[str], analyze: bool):
+    start = timer()
+    with connection_factory() as db_connection:
+        with db_connection.cursor() as cur:
+            if maintenance_work_mem:
+                cur.execute("SELECT set_config('maintenance_work_mem', %s, false)", (maintenance_work_mem,))
+            for index_name, definition in indexes:
+                cur.execute(definition)
+                cur.execute('DELETE FROM private.deferred_index WHERE index_name = %s', (index_name,))
+                db_connection.commit()
+            if analyze:
+                cur.execute(f'ANALYZE odata.{to_pg_name(table_name)}')
+                db_connection.commit()
+    log.info(f'Rebuilt {len(indexes)} indexes{" and analyzed" if analyze else ""} table "{table_name}"'
+             f' in {timer() - start:.1f}s')
+
+
+def rebuild_indexes(db_connection, connection_factory: Callable[[], ContextManager], workers: int,
+                    maintenance_work_mem: Optional[str] = None, analyze: Iterable[str] = ()):
+    """Recreate all indexes recorded in private.deferred_index and ANALYZE the tables named @analyze (unquoted), using
+    up to @workers connections created by @connection_factory in parallel, one table at a time each.
+
+    Building an index at once is cheaper than maintaining it row by row and yields a compact one. As the planner's
+    statistics are outdated after a bulk load, the tables loaded get analyzed right away rather than by autovacuum.
+    """
+    deferred = load_deferred_indexes(db_connection)
+    tables = sorted(set(deferred) | set(analyze))
+    if not tables:
+        return
+    analyze = set(analyze)
+    log.info(f'Rebuild {sum(len(i) for i in deferred.values())} deferred indexes and analyze {len(analyze)} tables')
+    start = timer()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='index-builder') as executor:
+        # Tables with the most indexes to build first, as they probably take longest
+        futures = [executor.submit(_rebuild_table, connection_factory, table_name, deferred.get(table_name, []),
+                                   maintenance_work_mem, table_name in analyze)
+                   for table_name in sorted(tables, key=lambda t: -len(deferred.get(t, [])))]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+    log.info(f'Rebuilt deferred indexes in {timer() - start:.1f}s')
@@ -0,0 +1,101 @@
+import sys
+import threading
+from timeit import default_timer as timer
+from typing import Optional, Sequence
+
+# Rows to look at when estimating the memory used by a page
+_SAMPLE_SIZE = 100
+
+
+def estimate_payload_bytes(rows: Sequence[Sequence]) -> int:
+    """Approximate memory used by @rows, extrapolated from the first few of them"""
+    if not rows:
+        return 0
+    sample = rows[:_SAMPLE_SIZE]
+    sample_bytes = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in sample)
+    return sample_bytes * len(rows) // len(sample)
+
+
+class InFlightBudget:
+    """Limit the rows and bytes fetched, but not yet persisted.
+
+    Fetchers acquire() the budget of a page before handing it on and block while the budget is exhausted, the page gets
+    release()-d once persisted. A single page gets admitted regardless of its size, otherwise a page exceeding the
+    budget on its own would block forever.
+
+    Thread-safe. Counters are meant to be read for monitoring purposes.
+    """
+
+    def __init__(self, max_rows: Optional[int] = None, max_bytes: Optional[int] = None):
+        """None means unlimited"""
+        self._max_rows = max_rows
+        self._max_bytes = max_bytes
+        self._condition = threading.Condition()
+        self.pages = 0
+        self.rows = 0
+        self.bytes = 0
+        self.peak_rows = 0
+        self.peak_bytes = 0
+        # Total time fetchers spent waiting for the budget
+        self.blocked_seconds = 0.0
+
+    def _exhausted(self, rows: int, bytes_: int) -> bool:
+        if not self.pages:
+            return False
+        if self._max_rows is not None and self.rows + rows > self._max_rows:
+            return True
+        if self._max_bytes is not None and self.bytes + bytes_ > self._max_bytes:
+            return True
+        return False
+
+    def acquire(self, rows: int, bytes_: int):
+        with self._condition:
+            if self._exhausted(rows, bytes_):
+                begin = timer()
+                self._condition.wait_for(lambda: not self._exhausted(rows, bytes_))
+                self.blocked_seconds += timer() - begin
+            self.pages += 1
+            self.rows += rows
+            self.bytes += bytes_
+            self.peak_rows = max(self.peak_rows, self.rows)
+            self.peak_bytes = max(self.peak_bytes, self.bytes)
+
+    def release(self, rows: int, bytes_: int):
+        with self._condition:
+            self.pages -= 1
+            self.rows -= rows
+            self.bytes -= bytes_
+            self._condition.notify_all()
+
+    def __str__(self):
+        return (f'{self.pages} pages with {self.rows} rows ({self.bytes / 2 ** 20:.1f} MiB) in flight,'
+                f' peak {self.peak_rows} rows ({self.peak_bytes / 2 ** 20:.1f} MiB),'
+                f' fetchers blocked for {self.blocked_seconds:.1f}s')
+
+
+def _shared_counter(index: int, type_: type = int) -> property:
+    def get(self):
+        return type_(self._counters[index])
+
+    def set_(self, value):
+        self._counters[index] = value
+
+    return property(get, set_)
+
+
+class SharedInFlightBudget(InFlightBudget):
+    """InFlightBudget shared by the processes of @mp_context (e.g. fetchers in worker processes acquiring it and the
+    scheduler releasing it). Gets passed to the processes when starting them."""
+
+    pages = _shared_counter(0)
+    rows = _shared_counter(1)
+    bytes = _shared_counter(2)
+    peak_rows = _shared_counter(3)
+    peak_bytes = _shared_counter(4)
+    blocked_seconds = _shared_counter(5, float)
+
+    def __init__(self, mp_context, max_rows: Optional[int] = None, max_bytes: Optional[int] = None):
+        # Guarded by the condition's lock, hence none of its own. Doubles represent integers up to 2^53 exactly.
+        self._counters = mp_context.Array('d', 6, lock=False)
+        super().__init__(max_rows, max_bytes)
+        self._condition = mp_context.Condition()
@@ -0,0 +1,128 @@
+import collections
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from timeit import default_timer as timer
+from typing import Optional, Tuple
+
+import requests
+
+from odata2sql.concurrency import ConcurrencyController
+
+log = logging.getLogger(__name__)
+
+# Requests to observe before hedging, as there is no telling what is unusually slow before
+HEDGE_MIN_SAMPLES = 20
+# Never hedge requests answered faster than this
+HEDGE_MIN_DELAY_SECONDS = 1.0
+
+
+class RequestStatistics:
+    """Latencies and outcome of requests towards the OData server, shared by all sessions. Thread-safe."""
+
+    def __init__(self, hedge_percentile: Optional[float] = None, window: int = 200):
+        """Requests taking longer than @hedge_percentile of the latest @window ones get hedged, None to never hedge"""
+        self._hedge_percentile = hedge_percentile
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.requests = 0
+        # Requests exceeding the hedge delay, each of them resulting in a hedged request
+        self.stuck = 0
+        self.hedges_won = 0
+        self.timeouts = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a request is considered stuck, None if not hedging (yet)"""
+        with self._lock:
+            if self._hedge_percentile is None or len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self._hedge_percentile / 100))
+        return max(HEDGE_MIN_DELAY_SECONDS, latencies[index])
+
+    def succeeded(self, seconds: float):
+        with self._lock:
+            self.requests += 1
+            self._latencies.append(seconds)
+
+    def timed_out(self):
+        with self._lock:
+            self.requests += 1
+            self.timeouts += 1
+
+    def hedged(self, won: bool = False):
+        with self._lock:
+            if won:
+                self.hedges_won += 1
+            else:
+                self.stuck += 1
+
+    def __str__(self):
+        return (f'{self.requests} requests, {self.stuck} stuck ({self.hedges_won} answered by the hedged request first),'
+                f' {self.timeouts} timed out')
+
+
+class DeadlineSession(requests.Session):
+    """Session applying connect and read deadlines to every request (as pyodata does not pass a timeout).
+
+    GET requests taking longer than usual (see RequestStatistics.hedge_delay) get hedged: The same request gets issued
+    again using another connection of this session's pool and the first answer wins. The other request gets abandoned,
+    its deadlines limiting the resources it may hold on to. Given a @controller, a hedged request takes a slot of its
+    own and requests are not hedged while none is available, the server being slow already.
+    """
+
+    def __init__(self, timeout: Tuple[float, float], statistics: RequestStatistics,
+                 controller: Optional[ConcurrencyController] = None):
+        """@timeout being the (connect, read) deadlines in seconds"""
+        super().__init__()
+        self._timeout = timeout
+        self._statistics = statistics
+        self._controller = controller
+        self._executor = None
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self._timeout)
+        delay = self._statistics.hedge_delay() if method.upper() == 'GET' else None
+        begin = timer()
+        try:
+            if delay is None:
+                response = super().request(method, url, **kwargs)
+            else:
+                response = self._hedged_request(delay, method, url, **kwargs)
+        except requests.exceptions.Timeout:
+            self._statistics.timed_out()
+            raise
+        self._statistics.succeeded(timer() - begin)
+        return response
+
+    def _hedged_request(self, delay: float, method, url, **kwargs):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='Hedged request')
+        primary = self._executor.submit(super().request, method, url, **kwargs)
+        if wait([primary], timeout=delay).done:
+            return primary.result()
+        release = self._controller.try_acquire() if self._controller else (lambda: None)
+        if release is None:
+            log.debug(f'Not hedging request stuck for more than {delay:.1f}s, no request slot available: {url}')
+            return primary.result()
+        log.info(f'Hedging request stuck for more than {delay:.1f}s: {url}')
+        self._statistics.hedged()
+        # The stuck request's connection being in use, the pool hands out another one
+        hedge = self._executor.submit(super().request, method, url, **kwargs)
+        hedge.add_done_callback(lambda _: release())
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._statistics.hedged(won=True)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=False)
+        super().close()
@@ -0,0 +1,163 @@
+import dataclasses
+import logging
+from typing import List, Tuple, Dict, Iterable
+
+from pyodata.v2.model import EntityType
+
+from odata2sql import sql
+from odata2sql.odata import Context
+
+log = logging.getLogger(__name__)
+
+
+def _column_list(property_names: Iterable[str]) -> str:
+    return ', '.join(sql.to_pg_name(n) for n in property_names)
+
+
+class IndexAdvisor:
+    """
+    Derive indexes and statistics from the OData schema, complementing the tables created by LeanAndMean
+
+    - A btree index on the dependent side of every referential constraint, as joining principals and dependents is what
+      the normalized views do. The dependent's remaining key columns are included, allowing index-only scans when
+      looking up the keys of dependents.
+    - Extended statistics on keys and foreign keys made of two columns, e.g. (id, language), which are correlated.
+      Otherwise, the planner multiplies their selectivities, underestimating the number of rows joined.
+
+    Foreign keys whose columns do not get synced or lead the primary key are skipped.
+    """
+
+    def __init__(self, context: Context):
+        self._context = context
+
+    def __str__(self):
+        return "Index advisor"
+
+    def _foreign_keys(self) -> Dict[str, List[Tuple[str, ...]]]:
+        """Property names of the foreign keys per dependent entity type name, in a stable order"""
+        foreign_keys = {}
+        for association in sorted(self._context.associations, key=lambda a: a.name):
+            rc = association.referential_constraint
+            property_names = tuple(rc.dependent.property_names)
+            if property_names not in (dependent := foreign_keys.setdefault(rc.dependent.name, [])):
+                dependent.append(property_names)
+        return foreign_keys
+
+    def _foreign_key_indexes(self, entity_type: EntityType, foreign_keys: List[Tuple[str, ...]]) -> List[str]:
+        key_property_names = [p.name for p in entity_type.key_proprties]
+        selected = set(self._context.odata_selected_properties(entity_type))
+        table_name = sql.to_pg_name(entity_type.name)
+        statements = []
+        for property_names in foreign_keys:
+            if not selected.issuperset(property_names):
+                log.debug(f'Skipping index on {property_names} of "{entity_type.name}": Not synced')
+                continue
+            if list(property_names) == key_property_names[:len(property_names)]:
+                continue
+            index_name = sql.to_pg_name(entity_type.name + 'Idx' + ''.join(property_names))
+            statement = f"CREATE INDEX {index_name} ON odata.{table_name} ({_column_list(property_names)})"
+            if included := [n for n in key_property_names if n not in property_names]:
+                statement += f" INCLUDE ({_column_list(included)})"
+            statements.append(statement + ";")
+        return statements
+
+    @staticmethod
+    def _statistics(entity_type: EntityType, column_groups: Iterable[Tuple[str, ...]]) -> List[str]:
+        table_name = sql.to_pg_name(entity_type.name)
+        return [f"CREATE STATISTICS odata.{sql.to_pg_name(entity_type.name + 'Stat' + ''.join(property_names))}"
+                f" (ndistinct, dependencies) ON {_column_list(property_names)} FROM odata.{table_name};"
+                for property_names in column_groups if len(property_names) == 2]
+
+    def odata_to_ddl(self) -> str:
+        foreign_keys = self._foreign_keys()
+        sections = []
+        for entity_type in sorted(self._context.client.schema.entity_types, key=lambda et: et.name):
+            dependent = foreign_keys.get(entity_type.name, [])
+            indexes = self._foreign_key_indexes(entity_type, dependent)
+            key = tuple(p.name for p in entity_type.key_proprties)
+            selected = set(self._context.odata_selected_properties(entity_type))
+            statistics = self._statistics(entity_type, [key] + [fk for fk in dependent if
+                                                                fk != key and selected.issuperset(fk)])
+            if statements := indexes + statistics:
+                sections.append('\n'.join(statements))
+        return '\n\n'.join(sections)
+
+
+@dataclasses.dataclass(frozen=True)
+class IndexUsage:
+    """An index of a table in the odata schema, as seen by pg_index and pg_stat_user_indexes"""
+    table_name: str
+    index_name: str
+    unique: bool
+    # Attribute numbers of the key columns, respectively columns added using INCLUDE
+    key_columns: Tuple[int, ...]
+    included_columns: Tuple[int, ...]
+    # Whether the index covers a subset of rows only or is based on expressions
+    partial: bool
+    # Since the statistics were reset, summed up over all partitions
+    scans: int
+    size_bytes: int
+
+    def covers(self, other: 'IndexUsage') -> bool:
+        """Whether this index serves any query @other does, making the latter redundant"""
+        return (not other.unique and not other.partial and not self.partial and self.table_name == other.table_name and
+                self.key_columns[:len(other.key_columns)] == other.key_columns and
+                set(other.included_columns) <= set(self.key_columns + self.included_columns))
+
+
+def load_index_usage(db_connection) -> List[IndexUsage]:
+    """Indexes of all tables in the odata schema. Partitions are accounted to their partitioned table."""
+    with db_connection.cursor() as cur:
+        cur.execute("""
+            SELECT t.relname, c.relname, i.indisunique, i.indnkeyatts, i.indkey::text,
+                   i.indexprs IS NOT NULL OR i.indpred IS NOT NULL,
+                   (SELECT COALESCE(sum(s.idx_scan), 0) FROM pg_partition_tree(i.indexrelid) p
+                        JOIN pg_stat_user_indexes s ON s.indexrelid = p.relid),
+                   (SELECT COALESCE(sum(pg_relation_size(p.relid)), 0) FROM pg_partition_tree(i.indexrelid) p)
+            FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_class t ON t.oid = i.indrelid
+                JOIN pg_namespace n ON n.oid = t.relnamespace
+            WHERE n.nspname = 'odata' AND NOT t.relispartition
+            ORDER BY t.relname, c.relname""")
+        usage = []
+        for table_name, index_name, unique, key_count, columns, partial, scans, size_bytes in cur.fetchall():
+            columns = tuple(int(c) for c in columns.split())
+            usage.append(IndexUsage(table_name, index_name, unique, columns[:key_count], columns[key_count:], partial,
+                                    int(scans), int(size_bytes)))
+        return usage
+
+
+def unused_indexes(usage: List[IndexUsage]) -> List[IndexUsage]:
+    """Indexes never scanned, except for those enforcing uniqueness"""
+    return [u for u in usage if not u.unique and u.scans == 0]
+
+
+def redundant_indexes(usage: List[IndexUsage]) -> List[Tuple[IndexUsage, IndexUsage]]:
+    """Pairs of an index and another one covering it. Of identical indexes, all but the first one are redundant."""
+    redundant = []
+    for i, index in enumerate(usage):
+        for j, other in enumerate(usage):
+            if i == j or not other.covers(index):
+                continue
+            if index.covers(other) and i < j:
+                # Identical, let the later one be the redundant one
+                continue
+            redundant.append((index, other))
+            break
+    return redundant
+
+
+def _mib(size_bytes: int) -> str:
+    return f'{size_bytes / 2 ** 20:.1f} MiB'
+
+
+def index_report(usage: List[IndexUsage]) -> List[str]:
+    """Human readable findings about @usage: Redundant indexes first, followed by unused ones"""
+    redundant = redundant_indexes(usage)
+    lines = [f'Redundant index odata.{index.index_name} ({_mib(index.size_bytes)}, {index.scans} scans):'
+             f' Covered by {other.index_name} on {index.table_name}' for index, other in redundant]
+    redundant_names = {index.index_name for index, _ in redundant}
+    lines += [f'Unused index odata.{index.index_name} ({_mib(index.size_bytes)}) on {index.table_name}'
+              for index in unused_indexes(usage) if index.index_name not in redundant_names]
+    return lines
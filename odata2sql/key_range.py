@@ -0,0 +1,90 @@
+import dataclasses
+import logging
+from typing import Optional, List
+
+from pyodata.v2.model import EntityType, StructTypeProperty
+
+from odata2sql.odata import Context
+from odata2sql.odata_json import parse_page, RowDecoder
+from odata2sql.sql import to_pg_name
+
+log = logging.getLogger(__name__)
+
+# Key property types allowing to split an entity set into ranges, along with their literal suffix in $filter expressions
+_INTEGER_TYPE_SUFFIXES = {
+    'Edm.Int16': '',
+    'Edm.Int32': '',
+    'Edm.Int64': 'L',
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class KeyRange:
+    """Entities whose @property_name is within [@lower, @upper), None meaning unbounded"""
+    property_name: str
+    lower: Optional[int]
+    upper: Optional[int]
+    # Suffix of literals in $filter expressions, i.e. 'L' for Edm.Int64
+    suffix: str = ''
+
+    def odata_filter(self) -> Optional[str]:
+        filters = []
+        if self.lower is not None:
+            filters.append(f'{self.property_name} ge {self.lower}{self.suffix}')
+        if self.upper is not None:
+            filters.append(f'{self.property_name} lt {self.upper}{self.suffix}')
+        return ' and '.join(filters) or None
+
+    def __str__(self):
+        return f'{self.property_name}[{"" if self.lower is None else self.lower},{"" if self.upper is None else self.upper})'
+
+
+def range_key_property(entity_type: EntityType) -> Optional[StructTypeProperty]:
+    """Key property to split @entity_type's entity set by, if there is a suitable one"""
+    first_key_property = entity_type.key_proprties[0]
+    if first_key_property.typ.name in _INTEGER_TYPE_SUFFIXES:
+        return first_key_property
+
+
+def key_range(key_property: StructTypeProperty, lower: Optional[int], upper: Optional[int]) -> KeyRange:
+    return KeyRange(key_property.name, lower, upper, _INTEGER_TYPE_SUFFIXES[key_property.typ.name])
+
+
+def key_ranges(key_property: StructTypeProperty, boundaries: List[int]) -> List[KeyRange]:
+    """Disjoint ranges covering all values of @key_property, split at @boundaries"""
+    limits = [None] + sorted(set(boundaries)) + [None]
+    return [key_range(key_property, lower, upper) for lower, upper in zip(limits, limits[1:])]
+
+
+def boundaries_from_database(db_connection, entity_type: EntityType, key_property: StructTypeProperty, count: int,
+                             min_rows: int) -> List[int]:
+    """Boundaries splitting the entities synced by previous runs into @count equally sized ranges. None unless there
+    are at least @min_rows of them, as too few entities do not tell much about the distribution of keys."""
+    fractions = [i / count for i in range(1, count)]
+    with db_connection.cursor() as cur:
+        cur.execute(f'SELECT count(*),'
+                    f' percentile_disc(%s::float8[]) WITHIN GROUP (ORDER BY {to_pg_name(key_property.name)})'
+                    f' FROM odata.{to_pg_name(entity_type.name)}', (fractions,))
+        row_count, boundaries = cur.fetchone()
+    db_connection.commit()
+    if row_count < min_rows:
+        return []
+    return boundaries or []
+
+
+def boundaries_from_server(context: Context, entity_type: EntityType, key_property: StructTypeProperty,
+                           count: int) -> List[int]:
+    """Boundaries splitting the range from the lowest to the highest key on the server into @count equally wide
+    ranges, assuming keys are spread evenly"""
+    limits = []
+    for order_by in (key_property.name, f'{key_property.name} desc'):
+        url = context.entity_set_url(entity_type, context.odata_filter_for_entity_type(entity_type),
+                                     [key_property.name], order_by=order_by, top=1)
+        response = context.client.connection.get(url, headers={'Accept': 'application/json'})
+        response.raise_for_status()
+        rows = RowDecoder(entity_type, [key_property.name]).rows(parse_page(response.json()).results)
+        if not rows:
+            return []
+        limits.append(rows[0][0])
+    lowest, highest = limits
+    return sorted({lowest + (highest - lowest) * i // count for i in range(1, count)} - {lowest})
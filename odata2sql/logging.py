@@ -1,21 +1,127 @@
+import contextlib
+import datetime
 import logging
+import queue
+import sys
+import threading
 import uuid
 from logging import LogRecord
+from typing import Callable, ContextManager, List, Optional
 
 import psycopg2
+import psycopg2.extras
+
+
+class _Flush:
+    def __init__(self):
+        self.done = threading.Event()
 
 
 class LogDbHandler(logging.Handler):
-    """ Persist logging messages to database """
+    """ Persist logging messages to database
 
-    def emit(self, record: LogRecord) -> None:
-        with self._connection.cursor() as cursor:
-            statement = (f'INSERT INTO private.import_log (session_id, level_number, level_name, message)'
-                         f' VALUES (%s, %s, %s, %s)')
-            cursor.execute(statement, (self._session_id, record.levelno, record.levelname, record.getMessage()))
+    Records are buffered and inserted in batches of up to @batch_size by a background thread, using a connection of its
+    own obtained from @connection_factory. Batches get flushed once full or @flush_seconds after their first record.
+    Logging never blocks: If more than @capacity records are waiting, further ones get dropped (and counted). close()
+    flushes all records buffered.
+    """
 
-    def __init__(self, session_id: uuid, connection, *args, **kwargs):
+    def __init__(self, session_id: uuid, connection_factory: Callable[[], ContextManager], *args,
+                 batch_size: int = 500, flush_seconds: float = 1.0, capacity: int = 10000, **kwargs):
         psycopg2.extras.register_uuid()
         super().__init__(*args, **kwargs)
         self._session_id = session_id
-        self._connection = connection
+        self._connection_factory = connection_factory
+        self._batch_size = batch_size
+        self._flush_seconds = flush_seconds
+        self._queue = queue.Queue(maxsize=capacity)
+        self._dropped_lock = threading.Lock()
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._write, daemon=True, name='Database log writer')
+        self._thread.start()
+
+    def emit(self, record: LogRecord) -> None:
+        try:
+            self._queue.put_nowait((self._session_id, datetime.datetime.fromtimestamp(record.created),
+                                    record.levelno, record.levelname, record.getMessage()))
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        """Block until all records emitted so far are persisted"""
+        if self._thread.is_alive():
+            marker = _Flush()
+            self._queue.put(marker)
+            while not marker.done.wait(0.1) and self._thread.is_alive():
+                pass
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        super().close()
+
+    def _insert(self, connection, rows: List[tuple]):
+        with connection.cursor() as cursor:
+            psycopg2.extras.execute_values(
+                cursor, 'INSERT INTO private.import_log (session_id, occurence_at, level_number, level_name, message)'
+                        ' VALUES %s', rows, page_size=len(rows))
+        connection.commit()
+
+    def _take_dropped(self) -> Optional[tuple]:
+        """Record telling about dropped records, if any"""
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            return (self._session_id, datetime.datetime.now(), logging.WARNING, logging.getLevelName(logging.WARNING),
+                    f'Dropped {dropped} log records, logging faster than they could be persisted')
+
+    def _write(self):
+        with self._connection_factory() as connection:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                rows, markers = [], []
+                deadline = datetime.datetime.now() + datetime.timedelta(seconds=self._flush_seconds)
+                # Collect a batch, flushing early if asked to
+                while True:
+                    if item is None:
+                        stopping = True
+                    elif type(item) is _Flush:
+                        markers.append(item)
+                    else:
+                        rows.append(item)
+                    if stopping or markers or len(rows) >= self._batch_size:
+                        break
+                    remaining = (deadline - datetime.datetime.now()).total_seconds()
+                    try:
+                        item = self._queue.get(timeout=max(0.0, remaining)) if remaining > 0 else \
+                            self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if dropped := self._take_dropped():
+                    rows.append(dropped)
+                if rows:
+                    try:
+                        self._insert(connection, rows)
+                    except Exception as e:
+                        with contextlib.suppress(Exception):
+                            connection.rollback()
+                        print(f'Failed to persist {len(rows)} log records: {e!r}', file=sys.stderr)
+                for marker in markers:
+                    marker.done.set()
+
+
+@contextlib.contextmanager
+def log_to_database(logger: logging.Logger, session_id: uuid, connection_factory: Callable[[], ContextManager]):
+    """Persist messages of @logger while in the context, flushing all of them when leaving it"""
+    handler = LogDbHandler(session_id, connection_factory)
+    logger.addHandler(handler)
+    try:
+        yield handler
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
@@ -0,0 +1,96 @@
+import hashlib
+import logging
+import os
+from typing import Optional
+
+import requests
+
+log = logging.getLogger(__name__)
+
+
+def default_cache_directory() -> str:
+    """Per-user cache directory for OData $metadata documents, following the XDG base directory specification"""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'curia-vista', 'metadata')
+
+
+def content_hash(metadata: bytes) -> str:
+    return hashlib.sha256(metadata).hexdigest()
+
+
+class MetadataCache:
+    """Persistent store of $metadata documents.
+
+    Documents get stored by their content hash (<hash>.xml). For every service URL, a small reference file points to the
+    most recent document seen for it, hence identical documents are stored once only.
+    """
+
+    def __init__(self, directory: str):
+        self._directory = directory
+
+    def _reference_path(self, url: str) -> str:
+        return os.path.join(self._directory, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.ref')
+
+    def _document_path(self, hash_: str) -> str:
+        return os.path.join(self._directory, hash_ + '.xml')
+
+    def get(self, url: str) -> Optional[bytes]:
+        """Most recent document stored for @url, None if unknown or damaged"""
+        try:
+            with open(self._reference_path(url), 'r') as reference_file:
+                hash_ = reference_file.read().strip()
+            with open(self._document_path(hash_), 'rb') as document_file:
+                metadata = document_file.read()
+        except FileNotFoundError:
+            return None
+        if content_hash(metadata) != hash_:
+            log.warning(f'Ignoring damaged cached metadata {self._document_path(hash_)}')
+            return None
+        return metadata
+
+    def put(self, url: str, metadata: bytes) -> str:
+        """Store @metadata as the most recent document of @url, returns its content hash"""
+        hash_ = content_hash(metadata)
+        os.makedirs(self._directory, exist_ok=True)
+        _write_atomically(self._document_path(hash_), metadata)
+        _write_atomically(self._reference_path(url), hash_.encode('ascii'))
+        return hash_
+
+
+def _write_atomically(path: str, content: bytes):
+    """Concurrent readers either see the previous or the new content, never a partial one"""
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as f:
+        f.write(content)
+    os.replace(temporary_path, path)
+
+
+def fetch_metadata(url: str, session: requests.Session) -> bytes:
+    """Download the $metadata document of the OData service at @url"""
+    log.info(f'Fetching metadata from {url}')
+    response = session.get(f'{url}/$metadata')
+    response.raise_for_status()
+    return response.content
+
+
+def load_metadata(url: str, session: requests.Session, metadata_file: Optional[str] = None,
+                  cache_directory: Optional[str] = None, refresh: bool = False) -> bytes:
+    """$metadata document of the OData service at @url.
+
+    Preference is given to @metadata_file, followed by the cache (unless @refresh is set) and finally the server. Both
+    the content of @metadata_file and documents downloaded get stored in the cache, if there is one.
+    """
+    cache = MetadataCache(cache_directory) if cache_directory else None
+    if metadata_file:
+        with open(metadata_file, 'rb') as f:
+            metadata = f.read()
+        log.info(f'Using metadata from {metadata_file} ({content_hash(metadata)})')
+    elif cache and not refresh and (metadata := cache.get(url)) is not None:
+        log.info(f'Using cached metadata ({content_hash(metadata)})')
+        return metadata
+    else:
+        metadata = fetch_metadata(url, session)
+        log.info(f'Fetched metadata ({content_hash(metadata)})')
+    if cache:
+        cache.put(url, metadata)
+    return metadata
@@ -0,0 +1,242 @@
+"""Metrics of sync internals in the Prometheus text exposition format, served via HTTP or written to a file.
+
+Metrics get recorded all the time (which is cheap) and are exposed on demand only, see expose_metrics().
+"""
+import contextlib
+import http.server
+import logging
+import math
+import os
+import tempfile
+import threading
+from typing import Dict, Tuple, Callable, Optional, List, Iterator, Sequence
+
+log = logging.getLogger(__name__)
+
+# Seconds between rewrites of the metrics file
+METRICS_FILE_INTERVAL = 15
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """Counter or gauge, optionally distinguished by labels. Thread-safe."""
+
+    def __init__(self, name: str, help_: str, type_: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help_
+        self.type = type_
+        self._label_names = tuple(label_names)
+        self._values: Dict[tuple, float] = {}
+        self._function: Optional[Callable[[], Optional[float]]] = None
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        if set(labels) != set(self._label_names):
+            raise ValueError(f'{self.name}: Expected labels {self._label_names}, got {tuple(labels)}')
+        return tuple(str(labels[n]) for n in self._label_names)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Optional[Callable[[], Optional[float]]]):
+        """Compute the (unlabelled) value by calling @function on exposition, None meaning unknown"""
+        self._function = function
+
+    def samples(self) -> Iterator[Tuple[str, Sequence[Tuple[str, str]], float]]:
+        if self._function is not None:
+            if (value := self._function()) is not None:
+                yield self.name, (), value
+            return
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, tuple(zip(self._label_names, key)), value
+
+
+class Histogram(Metric):
+    """Distribution of observed values, counted into cumulative @buckets (upper bounds)"""
+
+    def __init__(self, name: str, help_: str, buckets: Sequence[float], label_names: Sequence[str] = ()):
+        super().__init__(name, help_, 'histogram', label_names)
+        self._buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Labels -> (count per bucket, sum, count)
+        self._histograms: Dict[tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = ([0] * len(self._buckets), [0.0, 0.0])
+            counts, totals = self._histograms[key]
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            totals[0] += value
+            totals[1] += 1
+
+    def samples(self) -> Iterator[Tuple[str, Sequence[Tuple[str, str]], float]]:
+        with self._lock:
+            histograms = sorted((key, (list(counts), list(totals))) for key, (counts, totals) in
+                                self._histograms.items())
+        for key, (counts, (sum_, count)) in histograms:
+            labels = tuple(zip(self._label_names, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self._buckets, counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', labels + (('le', _format_value(bound)),), cumulative
+            yield f'{self.name}_sum', labels, sum_
+            yield f'{self.name}_count', labels, count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def _register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_: str, label_names: Sequence[str] = ()) -> Metric:
+        return self._register(Metric(name, help_, 'counter', label_names))
+
+    def gauge(self, name: str, help_: str, label_names: Sequence[str] = ()) -> Metric:
+        return self._register(Metric(name, help_, 'gauge', label_names))
+
+    def histogram(self, name: str, help_: str, buckets: Sequence[float], label_names: Sequence[str] = ()) -> Histogram:
+        return self._register(Histogram(name, help_, buckets, label_names))
+
+    def exposition(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+ODATA_REQUEST_SECONDS = REGISTRY.histogram('curia_vista_odata_request_duration_seconds',
+                                           'Duration of successful requests towards the OData server',
+                                           _LATENCY_BUCKETS, ['entity_type'])
+ODATA_REQUEST_FAILURES = REGISTRY.counter('curia_vista_odata_request_failures_total',
+                                          'Requests towards the OData server which failed', ['entity_type'])
+ODATA_REQUESTS_IN_FLIGHT = REGISTRY.gauge('curia_vista_odata_requests_in_flight',
+                                          'Requests towards the OData server currently in flight')
+ODATA_REQUEST_LIMIT = REGISTRY.gauge('curia_vista_odata_request_limit',
+                                     'Concurrent requests currently allowed towards the OData server')
+ODATA_REQUEST_BACK_OFFS = REGISTRY.counter('curia_vista_odata_request_back_offs_total',
+                                           'Times the number of concurrent requests got halved due to overload')
+ODATA_REQUESTS_HEDGED = REGISTRY.counter('curia_vista_odata_requests_hedged_total',
+                                         'Requests which got stuck and were issued once more')
+ODATA_REQUEST_TIMEOUTS = REGISTRY.counter('curia_vista_odata_request_timeouts_total',
+                                          'Requests which exceeded their connect or read deadline')
+WORK_QUEUE_DEPTH = REGISTRY.gauge('curia_vista_work_queue_depth', 'Work items waiting for a fetcher')
+RESULT_QUEUE_DEPTH = REGISTRY.gauge('curia_vista_result_queue_depth',
+                                    'Pages and acknowledgements waiting for the scheduler')
+ROWS_IN_FLIGHT = REGISTRY.gauge('curia_vista_rows_in_flight', 'Rows fetched, but not yet persisted')
+BYTES_IN_FLIGHT = REGISTRY.gauge('curia_vista_bytes_in_flight', 'Approximate memory of rows fetched, but not yet persisted')
+ROWS_PERSISTED = REGISTRY.counter('curia_vista_rows_persisted_total', 'Rows written to the database', ['table'])
+BYTES_PERSISTED = REGISTRY.counter('curia_vista_bytes_persisted_total',
+                                   'Approximate memory of the rows written to the database', ['table'])
+UPDATE_DB_SECONDS = REGISTRY.histogram('curia_vista_update_db_duration_seconds', 'Duration of persisting a page',
+                                       (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60), ['table'])
+LAST_PERSISTED = REGISTRY.gauge('curia_vista_last_persisted_timestamp_seconds',
+                                'Point in time a page got persisted the last time, to alert on stalls')
+COPY_FALLBACKS = REGISTRY.counter('curia_vista_copy_fallbacks_total',
+                                  'Pages which failed to load using COPY and got bisected instead', ['table'])
+ROWS_UPSERTED = REGISTRY.counter('curia_vista_rows_upserted_total',
+                                 'Rows written to the database by outcome (inserted, updated or unchanged)',
+                                 ['table', 'outcome'])
+ROWS_QUARANTINED = REGISTRY.counter('curia_vista_rows_quarantined_total', 'Rows rejected by the database',
+                                    ['table'])
+FOREIGN_KEY_RETRIES = REGISTRY.counter('curia_vista_foreign_key_retries_total',
+                                       'Failed requests for entities by foreign keys, retried in halves',
+                                       ['entity_type'])
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    registry: Registry
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.exposition().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format_, *args):
+        pass
+
+
+def write_metrics_file(filename: str, registry: Registry = REGISTRY):
+    """Replace @filename atomically, so readers (e.g. node_exporter's textfile collector) never see partial content"""
+    directory = os.path.dirname(os.path.abspath(filename))
+    with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.metrics', delete=False) as f:
+        f.write(registry.exposition())
+    os.replace(f.name, filename)
+
+
+@contextlib.contextmanager
+def expose_metrics(port: Optional[int] = None, filename: Optional[str] = None, registry: Registry = REGISTRY):
+    """Serve metrics at http://127.0.0.1:@port/metrics and/or rewrite @filename periodically while in the context.
+    Yields the port actually bound (relevant if @port is 0), None if not serving."""
+    server = None
+    stop = threading.Event()
+    writer = None
+    if port is not None:
+        handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', port), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True, name='Metrics server').start()
+        log.info(f'Serving metrics at http://127.0.0.1:{server.server_port}/metrics')
+    if filename is not None:
+        def rewrite():
+            while not stop.wait(METRICS_FILE_INTERVAL):
+                write_metrics_file(filename, registry)
+
+        write_metrics_file(filename, registry)
+        writer = threading.Thread(target=rewrite, daemon=True, name='Metrics file writer')
+        writer.start()
+        log.info(f'Writing metrics to {filename} every {METRICS_FILE_INTERVAL}s')
+    try:
+        yield server.server_port if server else None
+    finally:
+        stop.set()
+        if writer:
+            writer.join()
+            # Final state, e.g. to tell a completed sync from a stalled one
+            write_metrics_file(filename, registry)
+        if server:
+            server.shutdown()
+            server.server_close()
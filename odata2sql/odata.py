@@ -1,18 +1,38 @@
 #!/usr/bin/env python3
 import dataclasses
+import datetime
+import importlib.util
 import logging
+import os
 import re
 import uuid
 from functools import cached_property
 from typing import Optional, List, Iterable, Set, Dict, Union
+from urllib.parse import urlencode, quote
 
 import pyodata
 import requests
 from pyodata.v2.model import EntityType, Association, EndRole, Config, ReferentialConstraint
+from pyodata.v2.service import Service
 from toposort import toposort
 
+from odata2sql.http_session import DeadlineSession, RequestStatistics
+from odata2sql.metadata import load_metadata
+from odata2sql.odata_json import JSON_PARSERS
+
 log = logging.getLogger(__name__)
 
+# Strategies to persist fetched entities: Row-by-row upsert or streaming via COPY into a staging table
+DB_LOADERS = ('execute-batch', 'copy-text', 'copy-binary')
+# Ways to turn responses into rows: Using pyodata's entity proxies or mapping the JSON documents straight into rows
+ODATA_DECODERS = ('pyodata', 'json')
+# Concurrency models to fetch entities: Worker threads using pyodata or a single asyncio event loop using aiohttp
+SYNC_ENGINES = ('threading', 'asyncio', 'multiprocessing')
+# Declarative partitioning of an entity type's table: A partition per value or between consecutive bounds
+PARTITIONING_METHODS = ('list', 'range')
+# Memory setting as understood by PostgreSQL, e.g. 512MB or 2GB
+MAINTENANCE_WORK_MEM_PATTERN = r'\d+ ?(kB|MB|GB|TB)?'
+
 
 @dataclasses.dataclass(frozen=True)
 class Multiplicity:
@@ -38,6 +58,12 @@ class Settings:
     #             'sync': True,
     #             'sync_by': 'REFERENCED_ENTITY_TYPE_NAME',
     #             'filter': 'ODATA_FILTER_EXPRESSION',
+    #             'max_connections': 4, # Cap on simultaneous requests for this entity type, defaults to None
+    #             'partition': { # Partition the entity type's table, defaults to None (see schema_generator)
+    #                 'by': 'list', # One of PARTITIONING_METHODS
+    #                 'property': 'Language', # One of the key properties, so the primary key stays the same
+    #                 'values': ['DE', 'FR'], # Values (list) or bounds in ascending order (range) of partitions
+    #             },
     #             'selected_properties': {
     #                 '<Property Name #1>',
     #                 '<Property Name #2>',
@@ -48,11 +74,49 @@ class Settings:
     sync_config: Dict[str, Union[Dict, bool]]
     # URL to the OData service
     url: str
-    # Session ID
-    # TODO: Allow specifying session_id, resume interrupted sync
+    # Session ID, specify an existing one to resume an interrupted sync
     session_id: uuid.UUID
     # Maximal number of simultaneous requests towards the OData server
     odata_server_max_connections: int
+    # Whether to adapt the number of simultaneous requests (up to the maximum) to the health of the OData server
+    adaptive_concurrency: bool
+    # Seconds to wait for a connection to the OData server to be established, respectively for (more) response data
+    odata_connect_timeout: float
+    odata_read_timeout: float
+    # Requests taking longer than this percentile of recent ones get hedged, i.e. issued once more (None to disable)
+    hedge_percentile: Optional[float]
+    # Directory to archive the raw JSON pages fetched to (None to not archive them), allowing to replay them later on
+    page_archive_directory: Optional[str]
+    # Strategy to write entities to the database, one of DB_LOADERS
+    db_loader: str
+    # Initial and maximal number of foreign keys per request when syncing by principal (see WorkItemFetchByPrincipal)
+    fk_batch_size: int
+    fk_batch_size_max: int
+    # Entity sets with at least twice as many entities get split into key ranges of this size (at most one per
+    # connection) fetched in parallel, None to disable
+    key_range_size: Optional[int]
+    # Concurrency model of the sync, one of SYNC_ENGINES
+    sync_engine: str
+    # Worker processes to fetch and decode entities in, if using the multiprocessing engine
+    sync_processes: int
+    # Way to decode responses of the OData server, one of ODATA_DECODERS, and the JSON parser to use, one of JSON_PARSERS
+    odata_decoder: str
+    json_parser: str
+    # Number of database connections persisting entities in parallel and work items each of them may queue up
+    db_writers: int
+    db_writer_queue_depth: int
+    # Whether a full sync drops secondary indexes, recreating them (and analyzing the tables) once loading is done, and
+    # the maintenance_work_mem used to recreate them (None for the server's default)
+    defer_indexes: bool
+    maintenance_work_mem: Optional[str]
+    # Rows and bytes of fetched entities waiting to be persisted, before fetching pauses (None for unlimited)
+    max_in_flight_rows: Optional[int]
+    max_in_flight_bytes: Optional[int]
+    # $metadata document to use instead of fetching it from the server, see odata2sql.metadata.load_metadata
+    metadata_file: Optional[str]
+    # Directory to cache $metadata documents in (None to disable caching) and whether to refresh the cached one
+    metadata_cache_directory: Optional[str]
+    metadata_refresh: bool
 
     @cached_property
     def sync_unconfigured_entities(self) -> bool:
@@ -92,9 +156,7 @@ class Settings:
         global_filter = self.sync_config.get('filter', None)
         try:
             entity_filter = self.sync_config['entities'][entity_type_name]['filter']
-            if global_filter:
-                return f'({global_filter}) and ({entity_filter})'
-            return entity_filter
+            return odata_filter_conjunction(global_filter, entity_filter)
         except KeyError:
             return global_filter
 
@@ -105,6 +167,13 @@ class Settings:
         except KeyError:
             pass
 
+    def odata_max_connections(self, entity_type_name: str) -> Optional[int]:
+        """If configured, maximal number of simultaneous requests for entities of @entity_type_name"""
+        try:
+            return self.sync_config['entities'][entity_type_name]['max_connections']
+        except KeyError:
+            pass
+
     def odata_selected_properties(self, entity_type_name: str) -> Optional[List[str]]:
         """If configured, @entity_type_name's properties to select, retrieve their values from the OData server"""
         try:
@@ -112,12 +181,41 @@ class Settings:
         except KeyError:
             pass
 
+    def partitioning(self, entity_type_name: str) -> Optional[Dict]:
+        """If configured, how to partition the table of @entity_type_name"""
+        try:
+            return self.sync_config['entities'][entity_type_name]['partition']
+        except KeyError:
+            pass
+
 
 class SettingsBuilder:
     def __init__(self, url=None):
         self._settings = {
             'sync_config': {},
             'odata_server_max_connections': 20,
+            'adaptive_concurrency': True,
+            'odata_connect_timeout': 10.0,
+            'odata_read_timeout': 60.0,
+            'hedge_percentile': 95.0,
+            'page_archive_directory': None,
+            'db_loader': 'copy-text',
+            'fk_batch_size': 10,
+            'fk_batch_size_max': 50,
+            'key_range_size': 20000,
+            'sync_engine': 'threading',
+            'sync_processes': os.cpu_count() or 1,
+            'odata_decoder': 'json',
+            'json_parser': 'json',
+            'db_writers': 4,
+            'db_writer_queue_depth': 4,
+            'defer_indexes': False,
+            'maintenance_work_mem': None,
+            'max_in_flight_rows': None,
+            'max_in_flight_bytes': 256 * 2 ** 20,
+            'metadata_file': None,
+            'metadata_cache_directory': None,
+            'metadata_refresh': False,
             'session_id': uuid.uuid4(),
             'url': url,
         }
@@ -138,6 +236,75 @@ class SettingsBuilder:
         self._settings['odata_server_max_connections'] = odata_server_max_connections
         return self
 
+    def adaptive_concurrency(self, adaptive_concurrency: bool) -> 'SettingsBuilder':
+        self._settings['adaptive_concurrency'] = adaptive_concurrency
+        return self
+
+    def odata_timeouts(self, odata_connect_timeout: float, odata_read_timeout: float) -> 'SettingsBuilder':
+        self._settings['odata_connect_timeout'] = odata_connect_timeout
+        self._settings['odata_read_timeout'] = odata_read_timeout
+        return self
+
+    def hedge_percentile(self, hedge_percentile: Optional[float]) -> 'SettingsBuilder':
+        self._settings['hedge_percentile'] = hedge_percentile
+        return self
+
+    def page_archive(self, page_archive_directory: Optional[str]) -> 'SettingsBuilder':
+        self._settings['page_archive_directory'] = page_archive_directory
+        return self
+
+    def db_loader(self, db_loader: str) -> 'SettingsBuilder':
+        self._settings['db_loader'] = db_loader
+        return self
+
+    def fk_batch_size(self, fk_batch_size: int, fk_batch_size_max: Optional[int] = None) -> 'SettingsBuilder':
+        self._settings['fk_batch_size'] = fk_batch_size
+        if fk_batch_size_max is not None:
+            self._settings['fk_batch_size_max'] = fk_batch_size_max
+        return self
+
+    def key_range_size(self, key_range_size: Optional[int]) -> 'SettingsBuilder':
+        self._settings['key_range_size'] = key_range_size
+        return self
+
+    def sync_engine(self, sync_engine: str) -> 'SettingsBuilder':
+        self._settings['sync_engine'] = sync_engine
+        return self
+
+    def sync_processes(self, sync_processes: int) -> 'SettingsBuilder':
+        self._settings['sync_processes'] = sync_processes
+        return self
+
+    def odata_decoder(self, odata_decoder: str, json_parser: Optional[str] = None) -> 'SettingsBuilder':
+        self._settings['odata_decoder'] = odata_decoder
+        if json_parser is not None:
+            self._settings['json_parser'] = json_parser
+        return self
+
+    def db_writers(self, db_writers: int, db_writer_queue_depth: Optional[int] = None) -> 'SettingsBuilder':
+        self._settings['db_writers'] = db_writers
+        if db_writer_queue_depth is not None:
+            self._settings['db_writer_queue_depth'] = db_writer_queue_depth
+        return self
+
+    def defer_indexes(self, defer_indexes: bool, maintenance_work_mem: Optional[str] = None) -> 'SettingsBuilder':
+        self._settings['defer_indexes'] = defer_indexes
+        self._settings['maintenance_work_mem'] = maintenance_work_mem
+        return self
+
+    def max_in_flight(self, max_in_flight_rows: Optional[int],
+                      max_in_flight_bytes: Optional[int]) -> 'SettingsBuilder':
+        self._settings['max_in_flight_rows'] = max_in_flight_rows
+        self._settings['max_in_flight_bytes'] = max_in_flight_bytes
+        return self
+
+    def metadata(self, metadata_file: Optional[str] = None, metadata_cache_directory: Optional[str] = None,
+                 metadata_refresh: bool = False) -> 'SettingsBuilder':
+        self._settings['metadata_file'] = metadata_file
+        self._settings['metadata_cache_directory'] = metadata_cache_directory
+        self._settings['metadata_refresh'] = metadata_refresh
+        return self
+
     def build(self) -> Settings:
         if not self._settings['url']:
             raise ValueError('URL not specified!')
@@ -145,16 +312,57 @@ class SettingsBuilder:
             raise ValueError('Expecting OData URLs to end with /odata.svc')
         if (count := self._settings['odata_server_max_connections']) <= 0:
             raise ValueError(f'Invalid connection count: {count}')
+        for name in ('odata_connect_timeout', 'odata_read_timeout'):
+            if (timeout := self._settings[name]) <= 0:
+                raise ValueError(f'Invalid timeout: {timeout}')
+        if (percentile := self._settings['hedge_percentile']) is not None and not 0 < percentile < 100:
+            raise ValueError(f'Invalid hedge percentile: {percentile}')
+        if (db_loader := self._settings['db_loader']) not in DB_LOADERS:
+            raise ValueError(f'Invalid database loader: {db_loader}')
+        if (size := self._settings['key_range_size']) is not None and size <= 0:
+            raise ValueError(f'Invalid key range size: {size}')
+        if (sync_engine := self._settings['sync_engine']) not in SYNC_ENGINES:
+            raise ValueError(f'Invalid sync engine: {sync_engine}')
+        if (count := self._settings['sync_processes']) <= 0:
+            raise ValueError(f'Invalid process count: {count}')
+        if (odata_decoder := self._settings['odata_decoder']) not in ODATA_DECODERS:
+            raise ValueError(f'Invalid OData decoder: {odata_decoder}')
+        if (json_parser := self._settings['json_parser']) not in JSON_PARSERS:
+            raise ValueError(f'Invalid JSON parser: {json_parser}')
+        if importlib.util.find_spec(json_parser) is None:
+            raise ValueError(f'JSON parser not installed: {json_parser}')
+        if self._settings['page_archive_directory'] and odata_decoder != 'json':
+            raise ValueError(f'Archiving pages requires the json decoder, not {odata_decoder}')
+        if self._settings['page_archive_directory'] and sync_engine == 'multiprocessing':
+            raise ValueError(f'Archiving pages is not supported by the {sync_engine} engine')
+        if (count := self._settings['db_writers']) <= 0:
+            raise ValueError(f'Invalid database writer count: {count}')
+        if (depth := self._settings['db_writer_queue_depth']) <= 0:
+            raise ValueError(f'Invalid database writer queue depth: {depth}')
+        if (memory := self._settings['maintenance_work_mem']) is not None and \
+                not re.fullmatch(MAINTENANCE_WORK_MEM_PATTERN, memory):
+            raise ValueError(f'Invalid maintenance_work_mem: {memory}')
+        if (rows := self._settings['max_in_flight_rows']) is not None and rows <= 0:
+            raise ValueError(f'Invalid maximal number of rows in flight: {rows}')
+        if (bytes_ := self._settings['max_in_flight_bytes']) is not None and bytes_ <= 0:
+            raise ValueError(f'Invalid maximal number of bytes in flight: {bytes_}')
+        if not 0 < self._settings['fk_batch_size'] <= self._settings['fk_batch_size_max']:
+            raise ValueError(f'Invalid foreign key batch size: {self._settings["fk_batch_size"]}'
+                             f' (maximum {self._settings["fk_batch_size_max"]})')
         return Settings(**self._settings)
 
 
 class Context:
-    def __init__(self, client: pyodata.Client, settings: Settings):
+    def __init__(self, client: pyodata.Client, settings: Settings, metadata: Optional[bytes] = None):
+        """@metadata is the $metadata document @client is based on, if known"""
         self._client = client
         self._settings = settings
+        self.metadata = metadata
         self._validate_settings_entity_type_names()
         self._validate_settings_sync_by_fk()
         self._validate_settings_selected_properties()
+        self._validate_settings_max_connections()
+        self._validate_settings_partitioning()
 
     def _validate_settings_entity_type_names(self):
         for et_name in self._settings.configured_entities:
@@ -203,10 +411,50 @@ class Context:
                     'Entity type "{}" requires non-nullable properties: "{}"'.format(entity_type_name, '", "'.join(
                         missing_non_nullable_property_names)))
 
+    def _validate_settings_max_connections(self):
+        for entity_type_name in self._settings.configured_entities:
+            max_connections = self._settings.odata_max_connections(entity_type_name)
+            if max_connections is not None and (type(max_connections) is not int or max_connections <= 0):
+                raise ValueError(f'Entity type "{entity_type_name}" has an invalid connection cap: {max_connections}')
+
+    def _validate_settings_partitioning(self):
+        for entity_type_name in self._settings.configured_entities:
+            if not (partitioning := self._settings.partitioning(entity_type_name)):
+                continue
+            if (method := partitioning.get('by')) not in PARTITIONING_METHODS:
+                raise ValueError(f'Entity type "{entity_type_name}" has an invalid partitioning method: {method}')
+            entity_type = self.get_entity_type_by_name(entity_type_name)
+            if (property_name := partitioning.get('property')) not in self.odata_selected_properties(entity_type):
+                raise ValueError(f'Entity type "{entity_type_name}" can not be partitioned by "{property_name}"')
+            # Partitioning by other properties would require extending the primary key by them, changing the identity
+            # of entities: Once the value changes, upserts would store another row rather than updating the existing one
+            if property_name not in (p.name for p in entity_type.key_proprties):
+                raise ValueError(f'Entity type "{entity_type_name}" can not be partitioned by "{property_name}",'
+                                 f' as it is not part of the key')
+            if not (values := partitioning.get('values')):
+                raise ValueError(f'Entity type "{entity_type_name}" lacks values to partition by')
+            if any(type(v) not in (str, int) for v in values):
+                raise ValueError(f'Entity type "{entity_type_name}" has partition values of unsupported types')
+            if method == 'range' and any(a >= b for a, b in zip(values, values[1:])):
+                raise ValueError(f'Entity type "{entity_type_name}" has partition bounds not in ascending order')
+
     @classmethod
-    def from_settings(cls, settings: Settings):
-        client = pyodata.Client(settings.url, requests.Session(), config=Config(retain_null=True))
-        return Context(client, settings)
+    def from_settings(cls, settings: Settings, metadata: Optional[bytes] = None):
+        """Unless given, @metadata gets loaded as configured by @settings"""
+        session = DeadlineSession((settings.odata_connect_timeout, settings.odata_read_timeout), RequestStatistics())
+        if metadata is None:
+            metadata = load_metadata(settings.url, session, settings.metadata_file, settings.metadata_cache_directory,
+                                     settings.metadata_refresh)
+        client = pyodata.Client(settings.url, session, config=Config(retain_null=True), metadata=metadata)
+        return Context(client, settings, metadata)
+
+    def with_new_session(self, session: Optional[requests.Session] = None) -> 'Context':
+        """Context sharing the parsed schema, but using a HTTP @session of its own (e.g. one per worker thread)"""
+        if session is None:
+            session = DeadlineSession((self._settings.odata_connect_timeout, self._settings.odata_read_timeout),
+                                      RequestStatistics())
+        service = Service(self.client.url, self.client.schema, session, config=Config(retain_null=True))
+        return Context(service, self._settings, self.metadata)
 
     @cached_property
     def client(self) -> pyodata.Client:
@@ -319,10 +567,29 @@ class Context:
     def get_entity_types_by_names(self, entity_type_names: Iterable[str]) -> Set[EntityType]:
         return {self.get_entity_type_by_name(entity_type_name) for entity_type_name in entity_type_names}
 
-    def get_entity_type_total_count(self, entity_type: EntityType) -> int:
+    def entity_set_url(self, entity_type: EntityType, odata_filter: Optional[str] = None,
+                       property_names: Optional[Iterable[str]] = None, inline_count: bool = False,
+                       order_by: Optional[str] = None, top: Optional[int] = None) -> str:
+        """URL to request the entities of @entity_type, optionally limited by @odata_filter and @property_names"""
+        query = {}
+        if inline_count:
+            query['$inlinecount'] = 'allpages'
+        if property_names:
+            query['$select'] = ','.join(property_names)
+        if odata_filter:
+            query['$filter'] = odata_filter
+        if order_by:
+            query['$orderby'] = order_by
+        if top is not None:
+            query['$top'] = top
+        if not query:
+            return f'{self.url}/{entity_type.name}'
+        return f'{self.url}/{entity_type.name}?{urlencode(query, quote_via=quote, safe=",")}'
+
+    def get_entity_type_total_count(self, entity_type: EntityType, additional_filter: Optional[str] = None) -> int:
         """Total number of entities of type @entity_type the remote server stores"""
         request = getattr(self.client.entity_sets, entity_type.name).get_entities()
-        if filter_ := self.odata_filter_for_entity_type(entity_type):
+        if filter_ := odata_filter_conjunction(self.odata_filter_for_entity_type(entity_type), additional_filter):
             request.filter(filter_)
         return request.count().execute()
 
@@ -333,3 +600,18 @@ def get_property_names_of_entity_type(entity_type: EntityType) -> List[str]:
     Returning a list in order to retain the original ordering, which can be important.
     """
     return [p.name for p in entity_type.proprties()]
+
+
+def odata_filter_conjunction(*filters: Optional[str]) -> Optional[str]:
+    """Combine $filter expressions using "and", ignoring missing ones"""
+    filters = [f for f in filters if f]
+    if len(filters) <= 1:
+        return filters[0] if filters else None
+    return ' and '.join(f'({f})' for f in filters)
+
+
+def odata_filter_modified_since(modified: datetime.datetime) -> str:
+    """$filter expression for entities modified after @modified"""
+    if modified.tzinfo is not None:
+        modified = modified.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return f"Modified gt datetime'{modified.isoformat(timespec='milliseconds')}'"
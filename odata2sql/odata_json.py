@@ -0,0 +1,125 @@
+import dataclasses
+import datetime
+import importlib
+import re
+from typing import List, Optional, Callable, Any, Iterable, Union, Sequence
+
+from pyodata.v2.model import EntityType
+
+from odata2sql.row_batch import RowBatch
+
+_DATE_PATTERN = re.compile(r'^/Date\((?P<milliseconds_since_epoch>-?\d+)(?P<offset_in_minutes>[+-]\d+)?\)/$')
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _date_match(value: str) -> re.Match:
+    if not (match := _DATE_PATTERN.match(value)):
+        raise ValueError(f'Malformed date value: "{value}"')
+    return match
+
+
+def decode_datetime(value: Optional[str]) -> Optional[datetime.datetime]:
+    """Edm.DateTime from its JSON representation /Date(<ticks>[±<offset>])/, same as pyodata does"""
+    if value is None:
+        return None
+    match = _date_match(value)
+    return _EPOCH + datetime.timedelta(milliseconds=int(match.group('milliseconds_since_epoch')),
+                                       minutes=int(match.group('offset_in_minutes') or 0))
+
+
+def decode_datetime_offset(value: Optional[str]) -> Optional[datetime.datetime]:
+    """Edm.DateTimeOffset from its JSON representation /Date(<ticks>[±<offset>])/, same as pyodata does"""
+    if value is None:
+        return None
+    match = _date_match(value)
+    tzinfo = datetime.timezone(datetime.timedelta(minutes=int(match.group('offset_in_minutes') or 0)))
+    return datetime.datetime(1970, 1, 1, tzinfo=tzinfo) + datetime.timedelta(
+        milliseconds=int(match.group('milliseconds_since_epoch')))
+
+
+def decode_int64(value: Optional[str]) -> Optional[int]:
+    """Edm.Int64, represented as (optionally L suffixed) string in JSON"""
+    if value is None:
+        return None
+    return int(value[:-1] if value.endswith('L') else value)
+
+
+# Edm types not represented by their native JSON type. Everything else gets used as is.
+DECODERS = {
+    'Edm.DateTime': decode_datetime,
+    'Edm.DateTimeOffset': decode_datetime_offset,
+    'Edm.Int64': decode_int64,
+}
+
+
+def decode_batch(decoder: Callable[[Any], Any], values: List) -> List:
+    """Decode all @values using @decoder, converting each distinct value once only.
+
+    Pays off for dates, as many entities of a page share e.g. their Modified timestamp.
+    """
+    decoded = {value: decoder(value) for value in set(values)}
+    return [decoded[value] for value in values]
+
+
+# Parsers to decode JSON responses with, all but the one of the standard library being optional dependencies
+JSON_PARSERS = ('json', 'orjson', 'ujson')
+
+
+def json_parser(name: str) -> Callable[[Union[bytes, str]], Any]:
+    """loads() function of the JSON parser @name, one of JSON_PARSERS"""
+    if name not in JSON_PARSERS:
+        raise ValueError(f'Invalid JSON parser: {name}')
+    return importlib.import_module(name).loads
+
+
+@dataclasses.dataclass(frozen=True)
+class Page:
+    """One response of an entity set request"""
+    results: List[dict]
+    next_url: Optional[str]
+    total_count: Optional[int]
+
+
+def parse_page(document: dict) -> Page:
+    """Extract the interesting parts of a (verbose) OData 2.0 JSON response"""
+    d = document['d']
+    if isinstance(d, list):
+        return Page(d, None, None)
+    total_count = int(d['__count']) if '__count' in d else None
+    return Page(d['results'], d.get('__next'), total_count)
+
+
+class RowDecoder:
+    """Turn entities of a JSON response into rows, one value per property of @property_names"""
+
+    def __init__(self, entity_type: EntityType, property_names: Iterable[str]):
+        type_names = {p.name: p.typ.name for p in entity_type.proprties()}
+        self._property_names = list(property_names)
+        self._type_names = [type_names[n] for n in self._property_names]
+        self._decoders: List[Optional[Callable[[Any], Any]]] = [DECODERS.get(type_names[n]) for n in
+                                                                self._property_names]
+
+    @property
+    def property_names(self) -> List[str]:
+        return self._property_names
+
+    @property
+    def type_names(self) -> List[str]:
+        """Edm type names of the properties"""
+        return self._type_names
+
+    def _columns(self, results: List[dict]) -> List[List]:
+        """Decoding happens column by column, so each decoder processes a whole page at once"""
+        columns = []
+        for property_name, decoder in zip(self._property_names, self._decoders):
+            values = [entity.get(property_name) for entity in results]
+            columns.append(decode_batch(decoder, values) if decoder else values)
+        return columns
+
+    def rows(self, results: List[dict]) -> List[Sequence]:
+        """One tuple per entity"""
+        return list(zip(*self._columns(results)))
+
+    def batch(self, results: List[dict]) -> RowBatch:
+        """Entities as RowBatch, built straight from the decoded columns"""
+        return RowBatch.from_columns(self._columns(results), self._type_names)
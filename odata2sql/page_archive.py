@@ -0,0 +1,94 @@
+import gzip
+import logging
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = '.jsonl.gz'
+
+
+def session_directory(directory: str, session_id: uuid.UUID) -> Path:
+    return Path(directory) / str(session_id)
+
+
+def latest_session(directory: str) -> Optional[uuid.UUID]:
+    """Session which archived pages most recently, None if there is none"""
+    if not Path(directory).is_dir():
+        return None
+    sessions = []
+    for path in Path(directory).iterdir():
+        try:
+            sessions.append((path.stat().st_mtime, uuid.UUID(path.name)))
+        except ValueError:
+            continue
+    return max(sessions)[1] if sessions else None
+
+
+def archived_entity_types(directory: str, session_id: uuid.UUID) -> List[str]:
+    return sorted(p.name[:-len(ARCHIVE_SUFFIX)] for p in session_directory(directory, session_id).glob(
+        f'*{ARCHIVE_SUFFIX}'))
+
+
+def read_pages(directory: str, session_id: uuid.UUID, entity_type_name: str) -> Iterator[bytes]:
+    """Raw JSON documents archived for @entity_type_name, in the order they were fetched"""
+    path = session_directory(directory, session_id) / f'{entity_type_name}{ARCHIVE_SUFFIX}'
+    if not path.exists():
+        return
+    with gzip.open(path, 'rb') as f:
+        try:
+            for line in f:
+                # Lacking the newline, the last page got cut off
+                if line.endswith(b'\n'):
+                    yield line
+        except EOFError:
+            log.warning(f'{path}: Archive got truncated (interrupted sync?), ignoring the incomplete last page')
+
+
+class PageArchive:
+    """Append raw OData pages to a gzip compressed file per entity type, one JSON document per line.
+
+    Resuming a session appends to its files, resulting in gzip files consisting of multiple members. Thread-safe.
+    """
+
+    def __init__(self, directory: str, session_id: uuid.UUID, compresslevel: int = 6):
+        self._directory = session_directory(directory, session_id)
+        self._compresslevel = compresslevel
+        self._lock = threading.Lock()
+        self._files: Dict[str, gzip.GzipFile] = {}
+        self._file_locks: Dict[str, threading.Lock] = {}
+        self.pages = 0
+        self.bytes = 0
+
+    def _file(self, entity_type_name: str) -> gzip.GzipFile:
+        with self._lock:
+            if entity_type_name not in self._files:
+                self._directory.mkdir(parents=True, exist_ok=True)
+                self._files[entity_type_name] = gzip.open(
+                    self._directory / f'{entity_type_name}{ARCHIVE_SUFFIX}', 'ab', self._compresslevel)
+                self._file_locks[entity_type_name] = threading.Lock()
+            return self._files[entity_type_name]
+
+    def append(self, entity_type_name: str, content: bytes):
+        """Archive the response body @content. Line breaks within JSON strings are escaped, hence all others are
+        insignificant whitespace."""
+        line = content.replace(b'\r', b' ').replace(b'\n', b' ') + b'\n'
+        f = self._file(entity_type_name)
+        # Compress outside the global lock, so pages of distinct entity types get archived in parallel
+        with self._file_locks[entity_type_name]:
+            f.write(line)
+        with self._lock:
+            self.pages += 1
+            self.bytes += len(line)
+
+    def close(self):
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+            self._file_locks.clear()
+
+    def __str__(self):
+        return f'{self.pages} pages ({self.bytes / 2 ** 20:.1f} MiB uncompressed) archived to {self._directory}'
@@ -0,0 +1,164 @@
+import datetime
+import io
+import struct
+import uuid
+from typing import List, Iterable, Sequence, Callable, Any, Dict
+
+from odata2sql.row_batch import RowBatch
+
+_BINARY_HEADER = b'PGCOPY\n\377\r\n\0' + struct.pack('!ii', 0, 0)
+_BINARY_TRAILER = struct.pack('!h', -1)
+_POSTGRES_EPOCH = datetime.datetime(2000, 1, 1)
+_TEXT_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _to_naive_utc(value: datetime.datetime) -> datetime.datetime:
+    """Timestamps get stored without time zone, normalize them to UTC"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _text_datetime(value) -> str:
+    return _to_naive_utc(value).isoformat(' ')
+
+
+def _text_boolean(value) -> str:
+    return 't' if value else 'f'
+
+
+def _text_binary(value) -> str:
+    # bytea in hex format, its backslash escaped
+    return '\\\\x' + value.hex()
+
+
+def _text_default(value) -> str:
+    return str(value).translate(_TEXT_ESCAPES)
+
+
+_TEXT_ENCODERS: Dict[str, Callable[[Any], str]] = {
+    'Edm.Binary': _text_binary,
+    'Edm.Boolean': _text_boolean,
+    'Edm.DateTime': _text_datetime,
+    'Edm.DateTimeOffset': _text_datetime,
+    'Edm.Guid': str,
+    'Edm.Int16': str,
+    'Edm.Int32': str,
+    'Edm.Int64': str,
+}
+
+
+def _binary_boolean(value) -> bytes:
+    return b'\x01' if value else b'\x00'
+
+
+def _binary_datetime(value) -> bytes:
+    delta = _to_naive_utc(value) - _POSTGRES_EPOCH
+    return struct.pack('!q', (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+
+
+def _binary_guid(value) -> bytes:
+    return value.bytes if isinstance(value, uuid.UUID) else uuid.UUID(value).bytes
+
+
+def _binary_string(value) -> bytes:
+    return str(value).encode('utf-8')
+
+
+_BINARY_ENCODERS: Dict[str, Callable[[Any], bytes]] = {
+    'Edm.Binary': bytes,
+    'Edm.Boolean': _binary_boolean,
+    'Edm.DateTime': _binary_datetime,
+    'Edm.DateTimeOffset': _binary_datetime,
+    'Edm.Guid': _binary_guid,
+    'Edm.Int16': struct.Struct('!h').pack,
+    'Edm.Int32': struct.Struct('!i').pack,
+    'Edm.Int64': struct.Struct('!q').pack,
+    'Edm.String': _binary_string,
+}
+
+
+def encode_text(rows: Iterable[Sequence], column_types: List[str]) -> bytes:
+    """Rows in the (tab separated) text format of COPY, @column_types being the Edm type names of the columns"""
+    encoders = [_TEXT_ENCODERS.get(t, _text_default) for t in column_types]
+    lines = []
+    for row in rows:
+        lines.append('\t'.join('\\N' if v is None else e(v) for e, v in zip(encoders, row)))
+    lines.append('')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def encode_binary(rows: Iterable[Sequence], column_types: List[str]) -> bytes:
+    """Rows in the binary format of COPY, @column_types being the Edm type names of the columns"""
+    try:
+        encoders = [_BINARY_ENCODERS[t] for t in column_types]
+    except KeyError as e:
+        raise ValueError(f'Binary COPY does not support type {e}')
+    field_count = struct.pack('!h', len(column_types))
+    null = struct.pack('!i', -1)
+    buffer = io.BytesIO()
+    buffer.write(_BINARY_HEADER)
+    for row in rows:
+        buffer.write(field_count)
+        for encoder, value in zip(encoders, row):
+            if value is None:
+                buffer.write(null)
+                continue
+            data = encoder(value)
+            buffer.write(struct.pack('!i', len(data)))
+            buffer.write(data)
+    buffer.write(_BINARY_TRAILER)
+    return buffer.getvalue()
+
+
+def encode_text_lines(columns: List[List], column_types: List[str]) -> List[str]:
+    """One line of the text format of COPY per row, taking the values column by column (e.g. of a RowBatch), which
+    encodes every column using a single comprehension"""
+    encoded = []
+    for values, column_type in zip(columns, column_types):
+        encoder = _TEXT_ENCODERS.get(column_type, _text_default)
+        encoded.append(['\\N' if v is None else encoder(v) for v in values])
+    return ['\t'.join(fields) for fields in zip(*encoded)]
+
+
+def encode_text_columns(columns: List[List], column_types: List[str]) -> bytes:
+    """Same as encode_text, but taking the values column by column"""
+    lines = encode_text_lines(columns, column_types)
+    lines.append('')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def encode_binary_columns(columns: List[List], column_types: List[str]) -> bytes:
+    """Same as encode_binary, but taking the values column by column (e.g. of a RowBatch)"""
+    try:
+        encoders = [_BINARY_ENCODERS[t] for t in column_types]
+    except KeyError as e:
+        raise ValueError(f'Binary COPY does not support type {e}')
+    null = struct.pack('!i', -1)
+    length = struct.Struct('!i').pack
+    encoded = []
+    for values, encoder in zip(columns, encoders):
+        fields = []
+        for value in values:
+            if value is None:
+                fields.append(null)
+                continue
+            data = encoder(value)
+            fields.append(length(len(data)) + data)
+        encoded.append(fields)
+    field_count = struct.pack('!h', len(column_types))
+    return b''.join([_BINARY_HEADER, *(field_count + b''.join(fields) for fields in zip(*encoded)), _BINARY_TRAILER])
+
+
+def copy_rows(cursor, table_name: str, columns: List[str], column_types: List[str], rows: Iterable[Sequence],
+              copy_format: str):
+    """Stream @rows into @table_name using COPY FROM STDIN. A RowBatch gets encoded column by column."""
+    if copy_format not in ('text', 'binary'):
+        raise ValueError(f'Invalid COPY format: "{copy_format}"')
+    if isinstance(rows, RowBatch):
+        values = [rows.column(i) for i in range(len(columns))]
+        data = (encode_text_columns if copy_format == 'text' else encode_binary_columns)(values, column_types)
+    else:
+        data = (encode_text if copy_format == 'text' else encode_binary)(rows, column_types)
+    cursor.copy_expert(f'COPY {table_name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT {copy_format})',
+                       io.BytesIO(data))
@@ -0,0 +1,9 @@
+CREATE TABLE private.sync_watermark(
+    entity_type TEXT NOT NULL,
+    odata_filter TEXT NOT NULL,
+    modified timestamp NOT NULL,
+    session_id uuid NOT NULL,
+    updated_at timestamp DEFAULT NOW(),
+    PRIMARY KEY (entity_type, odata_filter)
+);
+COMMENT ON TABLE private.sync_watermark IS 'Most recent value of the Modified property seen per entity type and $filter, used by incremental updates';
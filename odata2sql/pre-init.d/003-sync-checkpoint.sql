@@ -0,0 +1,36 @@
+CREATE TABLE private.sync_checkpoint_entity_type(
+    session_id uuid NOT NULL,
+    entity_type TEXT NOT NULL,
+    started_at timestamp NOT NULL,
+    completed_at timestamp,
+    PRIMARY KEY (session_id, entity_type)
+);
+COMMENT ON TABLE private.sync_checkpoint_entity_type IS 'Entity types started (started_at in UTC, bounding their watermark) and completely synced, allows resuming an interrupted sync session';
+
+CREATE TABLE private.sync_checkpoint_page(
+    session_id uuid NOT NULL,
+    work_item TEXT NOT NULL,
+    next_url TEXT NOT NULL,
+    updated_at timestamp DEFAULT NOW(),
+    PRIMARY KEY (session_id, work_item)
+);
+COMMENT ON TABLE private.sync_checkpoint_page IS 'URL of the next page to fetch per work item, allows resuming an interrupted sync session';
+
+CREATE TABLE private.sync_checkpoint_foreign_key(
+    session_id uuid NOT NULL,
+    entity_type TEXT NOT NULL,
+    foreign_key TEXT NOT NULL,
+    PRIMARY KEY (session_id, entity_type, foreign_key)
+);
+COMMENT ON TABLE private.sync_checkpoint_foreign_key IS 'Foreign keys (as JSON array) whose entities got synced, allows resuming an interrupted sync session';
+
+CREATE TABLE private.sync_checkpoint_key_range(
+    session_id uuid NOT NULL,
+    entity_type TEXT NOT NULL,
+    position INT NOT NULL,
+    lower_bound BIGINT,
+    upper_bound BIGINT,
+    completed_at timestamp,
+    PRIMARY KEY (session_id, entity_type, position)
+);
+COMMENT ON TABLE private.sync_checkpoint_key_range IS 'Key ranges large entity sets got split into (NULL meaning unbounded) and whether they got synced, allows resuming an interrupted sync session using the same ranges';
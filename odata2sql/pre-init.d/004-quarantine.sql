@@ -0,0 +1,10 @@
+CREATE TABLE inconsistent.quarantine(
+    id SERIAL PRIMARY KEY,
+    session_id uuid NOT NULL,
+    quarantined_at timestamp DEFAULT NOW(),
+    entity_type TEXT NOT NULL,
+    entity_key jsonb NOT NULL,
+    entity jsonb NOT NULL,
+    error TEXT NOT NULL
+);
+COMMENT ON TABLE inconsistent.quarantine IS 'Entities the database refused to store (e.g. due to violated constraints), along with the reason';
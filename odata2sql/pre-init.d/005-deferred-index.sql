@@ -0,0 +1,8 @@
+CREATE TABLE private.deferred_index(
+    index_name TEXT PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    definition TEXT NOT NULL,
+    session_id uuid NOT NULL,
+    dropped_at timestamp DEFAULT NOW()
+);
+COMMENT ON TABLE private.deferred_index IS 'Secondary indexes dropped for the duration of a full sync, to be recreated once it is done (or by the next sync if it got interrupted)';
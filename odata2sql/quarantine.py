@@ -0,0 +1,20 @@
+import json
+import uuid
+from typing import List, Sequence
+
+from psycopg2.extras import Json
+
+
+def _to_json(value) -> Json:
+    # Dates and the like get stored using their string representation
+    return Json(value, dumps=lambda v: json.dumps(v, default=str))
+
+
+def quarantine_row(cursor, session_id: uuid.UUID, entity_type_name: str, columns: List[str], key_columns: List[str],
+                   row: Sequence, error: str):
+    """Record @row, which the database refused to store due to @error, in inconsistent.quarantine"""
+    entity = dict(zip(columns, row))
+    cursor.execute('INSERT INTO inconsistent.quarantine (session_id, entity_type, entity_key, entity, error)'
+                   ' VALUES (%s, %s, %s, %s, %s)',
+                   (session_id, entity_type_name, _to_json([entity.get(c) for c in key_columns]), _to_json(entity),
+                    error))
@@ -0,0 +1,276 @@
+import array
+import datetime
+import itertools
+from collections.abc import Sequence as SequenceABC
+from typing import List, Sequence, Any, Optional, Iterable, Dict
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+# Edm types stored in typed arrays, by their array type code
+_ARRAY_TYPE_CODES = {
+    'Edm.Boolean': 'b',
+    'Edm.Byte': 'B',
+    'Edm.SByte': 'b',
+    'Edm.Int16': 'h',
+    'Edm.Int32': 'i',
+    'Edm.Int64': 'q',
+}
+
+
+class _Column:
+    """Values of a single column. Subclasses store them compactly, None being represented by a mask (if any)."""
+    __slots__ = ('_nulls',)
+
+    def __init__(self, nulls: Optional[bytes]):
+        self._nulls = nulls
+
+    def values(self) -> List:
+        raise NotImplementedError()
+
+    def get(self, index: int) -> Any:
+        raise NotImplementedError()
+
+    def take(self, indexes: Sequence[int]) -> '_Column':
+        raise NotImplementedError()
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._nulls) if self._nulls else 0
+
+
+def _nulls_of(values: Sequence) -> Optional[bytes]:
+    """Mask telling which of @values are None, None if there are none"""
+    if None not in values:
+        return None
+    return bytes(value is None for value in values)
+
+
+def _mask(values: List, nulls: Optional[bytes]) -> List:
+    return [None if null else value for value, null in zip(values, nulls)] if nulls else values
+
+
+class _ObjectColumn(_Column):
+    """Python objects as they are, for types lacking a compact representation"""
+    __slots__ = ('_values',)
+
+    def __init__(self, values: List):
+        super().__init__(None)
+        self._values = values
+
+    def values(self) -> List:
+        return self._values
+
+    def get(self, index: int) -> Any:
+        return self._values[index]
+
+    def take(self, indexes: Sequence[int]) -> '_ObjectColumn':
+        return _ObjectColumn([self._values[i] for i in indexes])
+
+    @property
+    def nbytes(self) -> int:
+        # Rough guess, in line with estimate_payload_bytes
+        return 8 * len(self._values) + sum(50 for v in self._values if v is not None)
+
+
+class _ArrayColumn(_Column):
+    """Numbers (and booleans) in a typed array"""
+    __slots__ = ('_array', '_boolean')
+
+    def __init__(self, values: array.array, nulls: Optional[bytes], boolean: bool = False):
+        super().__init__(nulls)
+        self._array = values
+        self._boolean = boolean
+
+    @classmethod
+    def from_values(cls, type_code: str, values: List, boolean: bool = False) -> '_ArrayColumn':
+        nulls = _nulls_of(values)
+        return cls(array.array(type_code, [0 if v is None else v for v in values] if nulls else values), nulls,
+                   boolean)
+
+    def values(self) -> List:
+        values = self._array.tolist()
+        if self._boolean:
+            values = [bool(v) for v in values]
+        return _mask(values, self._nulls)
+
+    def get(self, index: int) -> Any:
+        if self._nulls and self._nulls[index]:
+            return None
+        return bool(self._array[index]) if self._boolean else self._array[index]
+
+    def take(self, indexes: Sequence[int]) -> '_ArrayColumn':
+        nulls = bytes(self._nulls[i] for i in indexes) if self._nulls else None
+        return _ArrayColumn(array.array(self._array.typecode, [self._array[i] for i in indexes]), nulls, self._boolean)
+
+    @property
+    def nbytes(self) -> int:
+        return super().nbytes + self._array.itemsize * len(self._array)
+
+
+class _DateTimeColumn(_ArrayColumn):
+    """Time zone aware points in time as microseconds since the epoch, restored in UTC. Same as decode_batch, each
+    distinct value gets converted once only, as many entities of a page tend to share e.g. their Modified timestamp."""
+    __slots__ = ()
+
+    @classmethod
+    def from_datetimes(cls, values: List[Optional[datetime.datetime]],
+                       distinct: Optional[set] = None) -> '_DateTimeColumn':
+        converted = {v: 0 if v is None else (v - _EPOCH) // _MICROSECOND for v in distinct or set(values)}
+        return cls(array.array('q', [converted[v] for v in values]), _nulls_of(values))
+
+    def values(self) -> List:
+        converted = {v: _EPOCH + datetime.timedelta(microseconds=v) for v in set(self._array)}
+        return _mask([converted[v] for v in self._array], self._nulls)
+
+    def get(self, index: int) -> Any:
+        if self._nulls and self._nulls[index]:
+            return None
+        return _EPOCH + datetime.timedelta(microseconds=self._array[index])
+
+    def take(self, indexes: Sequence[int]) -> '_DateTimeColumn':
+        nulls = bytes(self._nulls[i] for i in indexes) if self._nulls else None
+        return _DateTimeColumn(array.array('q', [self._array[i] for i in indexes]), nulls)
+
+
+class _StringColumn(_Column):
+    """Strings concatenated into a single buffer, delimited by offsets"""
+    __slots__ = ('_buffer', '_offsets')
+
+    def __init__(self, buffer: str, offsets: array.array, nulls: Optional[bytes]):
+        super().__init__(nulls)
+        self._buffer = buffer
+        self._offsets = offsets
+
+    @classmethod
+    def from_strings(cls, values: List[Optional[str]]) -> '_StringColumn':
+        nulls = _nulls_of(values)
+        strings = [v or '' for v in values] if nulls else values
+        offsets = array.array('I', [0])
+        offsets.extend(itertools.accumulate(len(s) for s in strings))
+        return cls(''.join(strings), offsets, nulls)
+
+    def values(self) -> List:
+        buffer, offsets = self._buffer, self._offsets
+        return _mask([buffer[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)], self._nulls)
+
+    def get(self, index: int) -> Any:
+        if self._nulls and self._nulls[index]:
+            return None
+        return self._buffer[self._offsets[index]:self._offsets[index + 1]]
+
+    def take(self, indexes: Sequence[int]) -> '_StringColumn':
+        return _StringColumn.from_strings([self.get(i) for i in indexes])
+
+    @property
+    def nbytes(self) -> int:
+        return super().nbytes + len(self._buffer) + self._offsets.itemsize * len(self._offsets)
+
+
+def _is_utc_datetime(value) -> bool:
+    return value is None or (type(value) is datetime.datetime and value.utcoffset() == datetime.timedelta(0))
+
+
+def _column(values: List, type_name: str) -> _Column:
+    """Most compact representation of @values, all of Edm type @type_name. Values not matching their type (e.g.
+    integers beyond its range) are kept as they are."""
+    try:
+        if type_code := _ARRAY_TYPE_CODES.get(type_name):
+            return _ArrayColumn.from_values(type_code, values, type_name == 'Edm.Boolean')
+        if type_name in ('Edm.DateTime', 'Edm.DateTimeOffset'):
+            distinct = set(values)
+            if all(_is_utc_datetime(v) for v in distinct):
+                return _DateTimeColumn.from_datetimes(values, distinct)
+        if type_name == 'Edm.String' and all(v is None or type(v) is str for v in values):
+            return _StringColumn.from_strings(values)
+    except (TypeError, OverflowError):
+        pass
+    return _ObjectColumn(values)
+
+
+class RowBatch(SequenceABC):
+    """Rows of a single page, stored column by column in typed arrays and string buffers.
+
+    Compared to a list of rows, this saves a Python object per value, both in memory and when pickled (i.e. handed to
+    another process). Behaves like a sequence of row tuples, while writers able to process columns (e.g. COPY) use
+    column() instead.
+    """
+    __slots__ = ('_columns', '_length')
+
+    def __init__(self, columns: List[_Column], length: int):
+        self._columns = columns
+        self._length = length
+
+    @classmethod
+    def from_columns(cls, columns: List[List], type_names: List[str]) -> 'RowBatch':
+        """Batch of @columns, each a list of the values of one column, of Edm types @type_names"""
+        return cls([_column(values, type_name) for values, type_name in zip(columns, type_names)],
+                   len(columns[0]) if columns else 0)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence], type_names: List[str]) -> 'RowBatch':
+        rows = list(rows)
+        if not rows:
+            return cls.from_columns([[] for _ in type_names], type_names)
+        return cls.from_columns([list(column) for column in zip(*rows)], type_names)
+
+    def column(self, index: int) -> List:
+        """Values of the column at @index"""
+        return self._columns[index].values()
+
+    def with_column(self, values: List, type_name: str) -> 'RowBatch':
+        """Batch with @values (of Edm type @type_name) appended as additional column"""
+        return RowBatch(self._columns + [_column(values, type_name)], self._length)
+
+    def take(self, indexes: Sequence[int]) -> 'RowBatch':
+        """Batch of the rows at @indexes"""
+        return RowBatch([c.take(indexes) for c in self._columns], len(indexes))
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the values"""
+        return sum(c.nbytes for c in self._columns)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(range(*index.indices(self._length)))
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('Row index out of range')
+        return tuple(c.get(index) for c in self._columns)
+
+    def __iter__(self):
+        return zip(*(c.values() for c in self._columns)) if self._columns else iter(())
+
+    def __eq__(self, other):
+        if not isinstance(other, SequenceABC):
+            return NotImplemented
+        return len(self) == len(other) and all(tuple(a) == tuple(b) for a, b in zip(self, other))
+
+    def __repr__(self):
+        return f'RowBatch({len(self._columns)} columns, {self._length} rows)'
+
+
+def last_per_key(rows: Sequence[Sequence], key_indexes: List[int]) -> Sequence[Sequence]:
+    """@rows without those followed by another one of the same key (at @key_indexes), which would be affected twice by
+    a single upsert. Preserves the type of @rows, given there are no duplicates."""
+    if isinstance(rows, RowBatch):
+        keys = zip(*(rows.column(i) for i in key_indexes))
+    else:
+        keys = (tuple(row[i] for i in key_indexes) for row in rows)
+    last: Dict[tuple, int] = {key: i for i, key in enumerate(keys)}
+    if len(last) == len(rows):
+        return rows
+    indexes = sorted(last.values())
+    return rows.take(indexes) if isinstance(rows, RowBatch) else [rows[i] for i in indexes]
+
+
+def column_values(rows: Sequence[Sequence], index: int) -> List[Any]:
+    """Values of the column at @index of @rows, without building rows first if given a RowBatch"""
+    if isinstance(rows, RowBatch):
+        return rows.column(index)
+    return [row[index] for row in rows]
@@ -0,0 +1,48 @@
+import hashlib
+import logging
+from typing import List, Sequence, Dict
+
+from odata2sql.pg_copy import encode_text_lines
+from odata2sql.row_batch import RowBatch, column_values
+
+log = logging.getLogger(__name__)
+
+# Column of every table holding the hash of its other columns, see row_hashes()
+ROW_HASH_COLUMN = 'row_hash'
+ROW_HASH_TYPE = 'Edm.Binary'
+
+# Tables known to have (or lack) ROW_HASH_COLUMN. The schema does not change while syncing.
+_has_row_hash: Dict[str, bool] = {}
+
+
+def row_hashes(rows: Sequence[Sequence], column_types: List[str]) -> List[bytes]:
+    """Digest of every row of @rows, columns being of Edm types @column_types.
+
+    Based on the text representation used by COPY, which normalizes e.g. time zones, hence stable across decoders and
+    sync runs. Only ever compared to the digest of another version of the same row, so 128 bits are plenty.
+    """
+    columns = [column_values(rows, i) for i in range(len(column_types))]
+    return [hashlib.blake2b(line.encode('utf-8'), digest_size=16).digest() for line in
+            encode_text_lines(columns, column_types)]
+
+
+def with_row_hashes(rows: Sequence[Sequence], column_types: List[str]) -> Sequence[Sequence]:
+    """@rows with their hash appended as additional column"""
+    hashes = row_hashes(rows, column_types)
+    if isinstance(rows, RowBatch):
+        return rows.with_column(hashes, ROW_HASH_TYPE)
+    return [tuple(row) + (hash_,) for row, hash_ in zip(rows, hashes)]
+
+
+def has_row_hash_column(db_connection, table_name: str) -> bool:
+    """Whether odata.@table_name has ROW_HASH_COLUMN, i.e. got created by a schema generator supporting it"""
+    if table_name not in _has_row_hash:
+        with db_connection.cursor() as cur:
+            cur.execute('SELECT 1 FROM information_schema.columns'
+                        ' WHERE table_schema = %s AND table_name = %s AND column_name = %s',
+                        ('odata', table_name.strip('"'), ROW_HASH_COLUMN))
+            _has_row_hash[table_name] = cur.fetchone() is not None
+        if not _has_row_hash[table_name]:
+            log.warning(f'Table "{table_name}" lacks column {ROW_HASH_COLUMN}, every row gets rewritten.'
+                        f' Run init to recreate the schema.')
+    return _has_row_hash[table_name]
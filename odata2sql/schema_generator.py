@@ -1,13 +1,41 @@
-from typing import Iterable
+import re
+from typing import Iterable, Optional, Dict, List, Union
 
 from pyodata.v2.model import StructTypeProperty, EntityType
 
 from odata2sql import sql
 from odata2sql.odata import Context
+from odata2sql.row_hash import ROW_HASH_COLUMN
 
 
-def _key_to_ddl(key_properties: Iterable[StructTypeProperty]) -> str:
-    return f"PRIMARY KEY ({', '.join(sql.to_pg_name(x.name) for x in key_properties)})"
+def _key_to_ddl(key_property_names: Iterable[str]) -> str:
+    return f"PRIMARY KEY ({', '.join(sql.to_pg_name(x) for x in key_property_names)})"
+
+
+def _literal(value: Union[str, int]) -> str:
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+
+def _partition_name(entity_type: EntityType, suffix: str) -> str:
+    return sql.to_pg_name(entity_type.name + '_' + re.sub('[^a-z0-9]+', '_', suffix.lower()).strip('_'))
+
+
+def _partitions_to_ddl(entity_type: EntityType, partitioning: Dict) -> List[str]:
+    """Partitions of @entity_type's table, as configured by @partitioning (see Settings.partitioning)"""
+    table_name = f"odata.{sql.to_pg_name(entity_type.name)}"
+    values = partitioning['values']
+    if partitioning['by'] == 'list':
+        statements = [f"CREATE TABLE odata.{_partition_name(entity_type, str(v))} PARTITION OF {table_name}"
+                      f" FOR VALUES IN ({_literal(v)});" for v in values]
+        # Catches values unknown at the time of the schema generation
+        return statements + [f"CREATE TABLE odata.{_partition_name(entity_type, 'default')} PARTITION OF"
+                             f" {table_name} DEFAULT;"]
+    bounds = ['MINVALUE'] + [_literal(v) for v in values] + ['MAXVALUE']
+    names = ['before_' + str(values[0])] + ['from_' + str(v) for v in values]
+    return [f"CREATE TABLE odata.{_partition_name(entity_type, name)} PARTITION OF {table_name}"
+            f" FOR VALUES FROM ({lower}) TO ({upper});" for name, lower, upper in zip(names, bounds, bounds[1:])]
 
 
 class LeanAndMean:
@@ -15,6 +43,10 @@ class LeanAndMean:
     Enforce derivable constrains EXCEPT for the foreign key (FK) ones
 
     The FK constraints get violated too often by Curia Vista.
+
+    Tables of entity types configured to be partitioned (see Settings.partitioning) become partitioned tables. As the
+    primary key must contain the partition key, only key properties may be partitioned by. The primary key and thus the
+    loader's ON CONFLICT ON CONSTRAINT <table>_pkey stay the same, while queries benefit from partition pruning.
     """
 
     EDM_TO_SQL_SIMPLE = {
@@ -57,15 +89,22 @@ class LeanAndMean:
         return res
 
     @classmethod
-    def _entity_type_to_ddl(cls, entity_type: EntityType) -> str:
+    def _entity_type_to_ddl(cls, entity_type: EntityType, partitioning: Optional[Dict] = None) -> str:
+        key_property_names = [p.name for p in entity_type.key_proprties]
         res = f"CREATE TABLE odata.{sql.to_pg_name(entity_type.name)} (\n  "
         res += ",\n  ".join([cls._property_to_ddl(p) for p in entity_type.proprties()]) + ","
-        res += f"\n  {_key_to_ddl(entity_type.key_proprties)}"
-        res += "\n);"
-        return res
+        # Maintained by the loader, allows skipping rows which did not change
+        res += f"\n  {ROW_HASH_COLUMN} bytea,"
+        res += f"\n  {_key_to_ddl(key_property_names)}"
+        res += "\n)"
+        if not partitioning:
+            return res + ";"
+        res += f" PARTITION BY {partitioning['by'].upper()} ({sql.to_pg_name(partitioning['property'])});"
+        return "\n".join([res] + _partitions_to_ddl(entity_type, partitioning))
 
     def odata_to_ddl(self) -> str:
         sections = []
         for entity_type in self._context.client.schema.entity_types:
-            sections.append(LeanAndMean._entity_type_to_ddl(entity_type))
+            sections.append(LeanAndMean._entity_type_to_ddl(entity_type,
+                                                            self._context.settings.partitioning(entity_type.name)))
         return '\n\n'.join(sections)
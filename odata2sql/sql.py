@@ -1,8 +1,12 @@
 import contextlib
+import logging
 import re
+from pathlib import Path
 
 import psycopg2
 
+log = logging.getLogger(__name__)
+
 # Taken from https://www.postgresql.org/docs/current/sql-keywords-appendix.html
 SQL_KEY_WORDS = [
     "A",
@@ -845,6 +849,19 @@ def database_connection(args):
         yield connection
 
 
+def run_sql_scripts(cur, directory_name: Path) -> None:
+    """Execute all *.sql files within @directory_name, ordered by name"""
+    directory_name = directory_name.resolve()  # Allow caller to be lenient
+    if not directory_name.is_dir():
+        raise ValueError(f'Not a valid path: {directory_name}')
+    for entry in sorted(directory_name.glob('*.sql')):
+        with open(entry) as f:
+            script_content = f.read()
+        log.info(f'Executing script {entry}')
+        log.debug(f'Content of {entry}: {script_content}')
+        cur.execute(script_content)
+
+
 def to_snake_case(name: str) -> str:
     """
     Convert a CamelCase string to snake_case.
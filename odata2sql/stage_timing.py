@@ -0,0 +1,60 @@
+import dataclasses
+from typing import Dict, List, Optional
+
+# Stages a page passes through, in order: HTTP request, JSON parsing, mapping entities to rows, waiting for a database
+# writer and finally update_db. Pages fetched using pyodata account for decoding as part of fetching.
+STAGES = ('fetch', 'decode', 'extract', 'queue', 'persist')
+
+
+def percentile(sorted_values: List[float], percent: float) -> Optional[float]:
+    """Nearest-rank percentile of @sorted_values, None if there are none"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, -(-len(sorted_values) * percent // 100) - 1))
+    return sorted_values[int(index)]
+
+
+@dataclasses.dataclass(frozen=True)
+class StageSummary:
+    stage: str
+    pages: int
+    rows: int
+    # Time spent in the stage, summed up over all pages (hence may exceed the wall clock time given concurrency)
+    seconds: float
+    p50: float
+    p90: float
+    p99: float
+    max: float
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        """Throughput of a single thread working on this stage"""
+        return self.rows / self.seconds if self.seconds else None
+
+
+class StageTimings:
+    """Seconds every page spent per stage (see STAGES), for performance analysis"""
+
+    def __init__(self):
+        self._seconds: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self._rows: Dict[str, int] = {stage: 0 for stage in STAGES}
+        self.pages_by_entity_type: Dict[str, int] = {}
+        self.rows_by_entity_type: Dict[str, int] = {}
+
+    def record(self, entity_type_name: str, rows: int, stage_seconds: Dict[str, float]):
+        """Account for a page of @rows entities which went through @stage_seconds"""
+        for stage, seconds in stage_seconds.items():
+            self._seconds[stage].append(seconds)
+            self._rows[stage] += rows
+        self.pages_by_entity_type[entity_type_name] = self.pages_by_entity_type.get(entity_type_name, 0) + 1
+        self.rows_by_entity_type[entity_type_name] = self.rows_by_entity_type.get(entity_type_name, 0) + rows
+
+    def summary(self) -> List[StageSummary]:
+        """One entry per stage any page went through"""
+        summaries = []
+        for stage in STAGES:
+            if not (seconds := sorted(self._seconds[stage])):
+                continue
+            summaries.append(StageSummary(stage, len(seconds), self._rows[stage], sum(seconds), percentile(seconds, 50),
+                                          percentile(seconds, 90), percentile(seconds, 99), seconds[-1]))
+        return summaries
@@ -0,0 +1,498 @@
+"""Local stand-in for an OData 2.0 server, serving generated or archived entities of a $metadata document.
+
+Implements the subset of OData used by this tool: JSON (verbose) collections with $filter, $select, $inlinecount,
+$orderby, $top, $skip and $skiptoken based server side paging, as well as $count. Latency and failures can be injected
+to measure how syncing copes with a slow or flaky server.
+"""
+import base64
+import dataclasses
+import datetime
+import http.server
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Callable, Any, Tuple
+from urllib.parse import urlsplit, parse_qsl, urlencode, quote
+
+from pyodata.v2.model import MetadataBuilder, Config, EntityType, Schema
+
+from odata2sql.odata_json import DECODERS, parse_page
+from odata2sql.page_archive import read_pages
+
+log = logging.getLogger(__name__)
+
+# Path all resources get served below, as Context.adjust_next_url expects it
+SERVICE_PATH = '/odata.svc'
+
+LANGUAGES = ('DE', 'FR', 'IT', 'RM', 'EN')
+
+# Entities generated with a Modified property were modified a minute after one another, starting at this point in time
+_MODIFIED_BASE = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class ODataError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_schema(metadata: bytes) -> Schema:
+    return MetadataBuilder(metadata, config=Config(retain_null=True)).build()
+
+
+def _date(moment: datetime.datetime, offset: Optional[str] = None) -> str:
+    milliseconds = int((moment - _EPOCH).total_seconds() * 1000)
+    return f'/Date({milliseconds}{offset or ""})/'
+
+
+def _key_value(type_name: str, entity_type_name: str, id_: int) -> Any:
+    """JSON value of a key property, derived from @id_ such that dependants can reference it"""
+    if type_name == 'Edm.Guid':
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f'{entity_type_name}/{id_}'))
+    if type_name == 'Edm.Int64':
+        return str(id_)
+    if type_name in ('Edm.Int16', 'Edm.Int32', 'Edm.Byte'):
+        return id_
+    if type_name == 'Edm.String':
+        return str(id_)
+    return _value(type_name, entity_type_name, None, id_)
+
+
+def _value(type_name: str, property_name: str, max_length: Optional[int], i: int) -> Any:
+    """JSON value of an ordinary property of the @i-th entity"""
+    if type_name == 'Edm.String':
+        value = f'{property_name} {i}'
+        return value[:max_length] if max_length and max_length > 0 else value
+    if type_name == 'Edm.DateTime':
+        if property_name == 'Modified':
+            return _date(_MODIFIED_BASE + datetime.timedelta(minutes=i))
+        return _date(_MODIFIED_BASE - datetime.timedelta(days=i % 10000))
+    if type_name == 'Edm.DateTimeOffset':
+        return _date(_MODIFIED_BASE + datetime.timedelta(minutes=i), '+0060')
+    if type_name == 'Edm.Guid':
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f'{property_name}/{i}'))
+    if type_name == 'Edm.Boolean':
+        return i % 2 == 0
+    if type_name == 'Edm.Byte':
+        return i % 256
+    if type_name == 'Edm.Int16':
+        return i % 2 ** 15
+    if type_name == 'Edm.Int32':
+        return i
+    if type_name == 'Edm.Int64':
+        return str(i)
+    if type_name == 'Edm.Decimal':
+        return f'{i // 100}.{i % 100:02d}'
+    if type_name in ('Edm.Double', 'Edm.Single'):
+        return i / 2
+    if type_name == 'Edm.Time':
+        return f'PT{i // 3600 % 24}H{i // 60 % 60}M{i % 60}S'
+    if type_name == 'Edm.Binary':
+        return base64.b64encode(i.to_bytes(4, 'big')).decode()
+    raise ValueError(f'Unsupported type: {type_name}')
+
+
+def _entities_per_id(entity_type: EntityType) -> int:
+    """Curia Vista stores one entity per ID and language"""
+    return len(LANGUAGES) if 'Language' in (p.name for p in entity_type.key_proprties) else 1
+
+
+def generate_entities(schema: Schema, entity_type: EntityType, counts: Callable[[str], int]) -> List[dict]:
+    """@counts(entity_type_name) entities of @entity_type with plausible values.
+
+    Keys are unique and foreign keys refer to entities generated for the principal, hence syncing by foreign key works.
+    Every seventh value of a nullable property is null.
+    """
+    key_names = [p.name for p in entity_type.key_proprties]
+    per_id = _entities_per_id(entity_type)
+    # Dependent property name -> (principal entity type name, principal property type name, number of principal IDs)
+    references: Dict[str, Tuple[str, str, int]] = {}
+    for association in schema.associations:
+        constraint = association.referential_constraint
+        if constraint is None or constraint.dependent.name != entity_type.name:
+            continue
+        principal = schema.entity_type(constraint.principal.name)
+        principal_ids = max(1, -(-counts(principal.name) // _entities_per_id(principal)))
+        for dependent_name, principal_name in zip(constraint.dependent.property_names,
+                                                  constraint.principal.property_names):
+            if dependent_name != 'Language':
+                references[dependent_name] = (principal.name, principal.proprty(principal_name).typ.name,
+                                              principal_ids)
+    entities = []
+    for i in range(counts(entity_type.name)):
+        id_ = i // per_id + 1
+        entity = {}
+        for p in entity_type.proprties():
+            if p.name == 'Language':
+                entity[p.name] = LANGUAGES[i % len(LANGUAGES)]
+            elif p.name in key_names:
+                entity[p.name] = _key_value(p.typ.name, entity_type.name, id_)
+            elif p.nullable and i % 7 == 6:
+                entity[p.name] = None
+            elif p.name in references:
+                principal_name, type_name, principal_ids = references[p.name]
+                entity[p.name] = _key_value(type_name, principal_name, (id_ - 1) % principal_ids + 1)
+            else:
+                entity[p.name] = _value(p.typ.name, p.name, p.max_length, i)
+        entities.append(entity)
+    return entities
+
+
+def archived_entities(directory: str, session_id: uuid.UUID, entity_type: EntityType, loads=json.loads) -> List[dict]:
+    """Entities archived by a sync (see PageArchive), the most recent version of each"""
+    key_names = [p.name for p in entity_type.key_proprties]
+    entities = {}
+    for content in read_pages(directory, session_id, entity_type.name):
+        for entity in parse_page(loads(content)).results:
+            entity.pop('__metadata', None)
+            entities[tuple(entity[n] for n in key_names)] = entity
+    return list(entities.values())
+
+
+_TOKEN_PATTERN = re.compile(r"""\s*(?:
+    (?P<typed>(?:datetime|datetimeoffset|guid|time|binary|X)'[^']*')
+    |(?P<string>'(?:[^']|'')*')
+    |(?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?[LlMmDdFf]?)
+    |(?P<paren>[()])
+    |(?P<comma>,)
+    |(?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    )""", re.VERBOSE)
+
+_COMPARISONS: Dict[str, Callable[[Any, Any], bool]] = {
+    'eq': lambda a, b: a == b,
+    'ne': lambda a, b: a != b,
+    'gt': lambda a, b: a is not None and b is not None and a > b,
+    'ge': lambda a, b: a is not None and b is not None and a >= b,
+    'lt': lambda a, b: a is not None and b is not None and a < b,
+    'le': lambda a, b: a is not None and b is not None and a <= b,
+}
+
+
+def tokenize(expression: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        if not (match := _TOKEN_PATTERN.match(expression, position)):
+            raise ODataError(400, f'Syntax error at position {position} of "{expression}"')
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        position = match.end()
+    return tokens
+
+
+def _parse_datetime(value: str) -> datetime.datetime:
+    moment = datetime.datetime.fromisoformat(value)
+    return moment.replace(tzinfo=datetime.timezone.utc) if moment.tzinfo is None else moment
+
+
+def literal_value(kind: str, text: str) -> Any:
+    """Python value of an OData literal, comparable to the values decoded by python_value()"""
+    if kind == 'string':
+        return text[1:-1].replace("''", "'")
+    if kind == 'number':
+        if text[-1] in 'LlMmDdFf':
+            text = text[:-1]
+        return float(text) if any(c in text for c in '.eE') else int(text)
+    if kind == 'typed':
+        prefix, _, value = text[:-1].partition("'")
+        if prefix in ('datetime', 'datetimeoffset'):
+            return _parse_datetime(value)
+        if prefix == 'guid':
+            return value.lower()
+        return value
+    if kind == 'word' and text in ('true', 'false'):
+        return text == 'true'
+    if kind == 'word' and text == 'null':
+        return None
+    raise ODataError(400, f'Not a literal: {text}')
+
+
+def python_value(type_name: str, value: Any) -> Any:
+    """Python value of the JSON @value of a property, comparable to literals"""
+    if value is None:
+        return None
+    if type_name == 'Edm.Guid':
+        return value.lower()
+    if type_name in ('Edm.Decimal', 'Edm.Double', 'Edm.Single'):
+        return float(value)
+    if decoder := DECODERS.get(type_name):
+        return decoder(value)
+    return value
+
+
+class _FilterParser:
+    """Recursive descent parser turning a $filter expression into a predicate on entities. Supports comparisons of
+    properties and literals, combined by and, or, not and parentheses."""
+
+    def __init__(self, entity_type: EntityType, expression: str):
+        self._types = {p.name: p.typ.name for p in entity_type.proprties()}
+        self._tokens = tokenize(expression)
+        self._position = 0
+
+    def _peek(self) -> Optional[Tuple[str, str]]:
+        return self._tokens[self._position] if self._position < len(self._tokens) else None
+
+    def _next(self) -> Tuple[str, str]:
+        if (token := self._peek()) is None:
+            raise ODataError(400, 'Unexpected end of $filter expression')
+        self._position += 1
+        return token
+
+    def _accept_word(self, word: str) -> bool:
+        if self._peek() == ('word', word):
+            self._position += 1
+            return True
+        return False
+
+    def parse(self) -> Callable[[dict], bool]:
+        predicate = self._or()
+        if self._peek() is not None:
+            raise ODataError(400, f'Unexpected token in $filter expression: {self._peek()[1]}')
+        return predicate
+
+    def _or(self) -> Callable[[dict], bool]:
+        operands = [self._and()]
+        while self._accept_word('or'):
+            operands.append(self._and())
+        return operands[0] if len(operands) == 1 else lambda e: any(o(e) for o in operands)
+
+    def _and(self) -> Callable[[dict], bool]:
+        operands = [self._unary()]
+        while self._accept_word('and'):
+            operands.append(self._unary())
+        return operands[0] if len(operands) == 1 else lambda e: all(o(e) for o in operands)
+
+    def _unary(self) -> Callable[[dict], bool]:
+        if self._accept_word('not'):
+            operand = self._unary()
+            return lambda e: not operand(e)
+        if self._peek() == ('paren', '('):
+            self._next()
+            predicate = self._or()
+            if self._next() != ('paren', ')'):
+                raise ODataError(400, 'Missing closing parenthesis in $filter expression')
+            return predicate
+        return self._comparison()
+
+    def _operand(self) -> Callable[[dict], Any]:
+        kind, text = self._next()
+        if kind == 'word' and text in self._types:
+            type_name = self._types[text]
+            return lambda e: python_value(type_name, e.get(text))
+        if kind == 'word' and text not in ('true', 'false', 'null'):
+            raise ODataError(400, f'Unknown property in $filter expression: {text}')
+        value = literal_value(kind, text)
+        return lambda e: value
+
+    def _comparison(self) -> Callable[[dict], bool]:
+        left = self._operand()
+        kind, operator = self._next()
+        if kind != 'word' or operator not in _COMPARISONS:
+            raise ODataError(400, f'Unsupported operator in $filter expression: {operator}')
+        right = self._operand()
+        compare = _COMPARISONS[operator]
+        return lambda e: compare(left(e), right(e))
+
+
+def parse_filter(entity_type: EntityType, expression: str) -> Callable[[dict], bool]:
+    return _FilterParser(entity_type, expression).parse()
+
+
+def _count_option(query: Dict[str, str], name: str) -> Optional[int]:
+    """Value of the system query option @name (e.g. $top), a non-negative integer, or None if absent"""
+    if name not in query:
+        return None
+    value = query[name]
+    if not value.isascii() or not value.isdigit():
+        raise ODataError(400, f'Invalid value of {name}: {value}')
+    return int(value)
+
+
+@dataclasses.dataclass(frozen=True)
+class Faults:
+    """Misbehaviour to inject, rates being the probability per request (not applying to $metadata)"""
+    latency_seconds: float = 0.0
+    # Additional latency, uniformly distributed up to this many seconds
+    latency_jitter_seconds: float = 0.0
+    # Answer with 503 Service Unavailable
+    error_rate: float = 0.0
+    # Close the connection without answering
+    disconnect_rate: float = 0.0
+    # Answer after stall_seconds only
+    stall_rate: float = 0.0
+    stall_seconds: float = 30.0
+
+
+def _key_literal(value: Any) -> str:
+    """Literal of a key @value as returned by python_value()"""
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    """Serve @entities (entity set name -> entities in their JSON representation) described by @metadata"""
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], metadata: bytes, entities: Dict[str, List[dict]],
+                 page_size: int = 1000, faults: Faults = Faults(), seed: Optional[int] = None):
+        super().__init__(address, _RequestHandler)
+        self.metadata = metadata
+        self.schema = parse_schema(metadata)
+        self.namespace = self.schema.namespaces[0]
+        self.page_size = page_size
+        self.faults = faults
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.entity_types: Dict[str, EntityType] = {es.name: es.entity_type for es in self.schema.entity_sets}
+        self.entities: Dict[str, List[dict]] = {}
+        self.keys: Dict[str, List[tuple]] = {}
+        for entity_set_name, entity_type in self.entity_types.items():
+            # Ordered by key, which allows for paging using the key of the last entity as $skiptoken
+            key = self._key_function(entity_type)
+            self.entities[entity_set_name] = sorted(entities.get(entity_set_name, []), key=key)
+            self.keys[entity_set_name] = [key(e) for e in self.entities[entity_set_name]]
+
+    @staticmethod
+    def _key_function(entity_type: EntityType) -> Callable[[dict], tuple]:
+        key_types = [(p.name, p.typ.name) for p in entity_type.key_proprties]
+        return lambda e: tuple(python_value(t, e[n]) for n, t in key_types)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}{SERVICE_PATH}'
+
+    def random(self) -> float:
+        with self._random_lock:
+            return self._random.random()
+
+    def serve_in_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True, name='Stand-in OData server')
+        thread.start()
+        return thread
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    server: StandInServer
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format_, *args):
+        log.debug(f'{self.address_string()} {format_ % args}')
+
+    def _send(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str):
+        body = json.dumps({'error': {'code': '', 'message': {'lang': 'en-US', 'value': message}}}).encode()
+        self._send(status, 'application/json;charset=utf-8', body)
+
+    def _inject_faults(self) -> bool:
+        """Whether the request got answered (or dropped) already"""
+        faults = self.server.faults
+        delay = faults.latency_seconds + faults.latency_jitter_seconds * self.server.random()
+        if faults.stall_rate and self.server.random() < faults.stall_rate:
+            delay += faults.stall_seconds
+        if delay:
+            time.sleep(delay)
+        if faults.disconnect_rate and self.server.random() < faults.disconnect_rate:
+            self.close_connection = True
+            return True
+        if faults.error_rate and self.server.random() < faults.error_rate:
+            self._send_error(503, 'Injected failure')
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if not url.path.startswith(SERVICE_PATH + '/'):
+            self._send_error(404, f'Not found: {url.path}')
+            return
+        resource = url.path[len(SERVICE_PATH) + 1:]
+        if resource == '$metadata':
+            self._send(200, 'application/xml;charset=utf-8', self.server.metadata)
+            return
+        if self._inject_faults():
+            return
+        entity_set_name, _, suffix = resource.partition('/')
+        try:
+            if entity_set_name not in self.server.entity_types or suffix not in ('', '$count'):
+                raise ODataError(404, f'Resource not found for the segment \'{resource}\'')
+            query = dict(parse_qsl(url.query, keep_blank_values=True))
+            if suffix == '$count':
+                self._send(200, 'text/plain;charset=utf-8', str(len(self._filtered(entity_set_name, query))).encode())
+            else:
+                body = json.dumps(self._collection(entity_set_name, query)).encode()
+                self._send(200, 'application/json;charset=utf-8', body)
+        except ODataError as e:
+            self._send_error(e.status, str(e))
+
+    def _filtered(self, entity_set_name: str, query: Dict[str, str]) -> List[int]:
+        """Indexes of the entities matching $filter, ordered by key"""
+        entities = self.server.entities[entity_set_name]
+        if not (expression := query.get('$filter')):
+            return list(range(len(entities)))
+        predicate = parse_filter(self.server.entity_types[entity_set_name], expression)
+        return [i for i, entity in enumerate(entities) if predicate(entity)]
+
+    def _collection(self, entity_set_name: str, query: Dict[str, str]) -> dict:
+        entity_type = self.server.entity_types[entity_set_name]
+        entities = self.server.entities[entity_set_name]
+        keys = self.server.keys[entity_set_name]
+        indexes = self._filtered(entity_set_name, query)
+        total_count = len(indexes)
+        if order_by := query.get('$orderby'):
+            property_name, _, direction = order_by.strip().partition(' ')
+            if not entity_type.has_proprty(property_name) or direction not in ('', 'asc', 'desc'):
+                raise ODataError(400, f'Unsupported $orderby: {order_by}')
+            type_name = entity_type.proprty(property_name).typ.name
+            # Nulls first
+            indexes.sort(key=lambda i: (entities[i][property_name] is not None,
+                                        python_value(type_name, entities[i][property_name])),
+                         reverse=direction == 'desc')
+        if skip_token := query.get('$skiptoken'):
+            if order_by:
+                raise ODataError(400, '$skiptoken in combination with $orderby is not supported')
+            token = tuple(literal_value(kind, text) for kind, text in tokenize(skip_token) if kind != 'comma')
+            indexes = [i for i in indexes if keys[i] > token]
+        skip = _count_option(query, '$skip') or 0
+        top = _count_option(query, '$top')
+        indexes = indexes[skip:]
+        if top is not None:
+            indexes = indexes[:top]
+        page = indexes[:self.server.page_size]
+        if '$select' in query:
+            property_names = [n.strip() for n in query['$select'].split(',') if n.strip()]
+            if unknown := [n for n in property_names if not entity_type.has_proprty(n)]:
+                raise ODataError(400, f'Unknown properties in $select: {", ".join(unknown)}')
+        else:
+            property_names = [p.name for p in entity_type.proprties()]
+        results = []
+        for i in page:
+            key = ','.join(f'{p.name}={_key_literal(v)}' for p, v in zip(entity_type.key_proprties, keys[i]))
+            uri = f'{self.server.url}/{entity_set_name}({key})'
+            entity = {'__metadata': {'id': uri, 'uri': uri, 'type': f'{self.server.namespace}.{entity_type.name}'}}
+            entity.update((n, entities[i][n]) for n in property_names)
+            results.append(entity)
+        d = {'results': results}
+        if query.get('$inlinecount') == 'allpages':
+            d['__count'] = str(total_count)
+        if len(indexes) > len(page):
+            next_query = {k: v for k, v in query.items() if k not in ('$skiptoken', '$skip', '$top')}
+            if top is not None:
+                next_query['$top'] = str(top - len(page))
+            if order_by:
+                next_query['$skip'] = str(skip + len(page))
+            else:
+                next_query['$skiptoken'] = ','.join(_key_literal(v) for v in keys[page[-1]])
+            d['__next'] = f'{self.server.url}/{entity_set_name}?{urlencode(next_query, quote_via=quote, safe=",$")}'
+        return {'d': d}
@@ -0,0 +1,230 @@
+import asyncio
+import dataclasses
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+from pyodata.v2.model import EntityType
+
+from odata2sql.checkpoint import Checkpoint
+from odata2sql.command_sync import WorkItemDbPersisting, update_db, odata_filter_by_foreign_keys, MAX_ATTEMPTS, \
+    UpsertCounts, next_attempt
+from odata2sql.metrics import ODATA_REQUEST_SECONDS
+from odata2sql.odata import Context, odata_filter_conjunction, odata_filter_modified_since
+from odata2sql.odata_json import RowDecoder, parse_page, Page, json_parser
+from odata2sql.page_archive import PageArchive
+from odata2sql.sql import to_pg_name
+from odata2sql.stage_timing import StageTimings
+from odata2sql.watermark import has_modified_property, store_watermark, track_modified, next_watermark
+
+log = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class ForeignKeysCompleted:
+    """Marker for the writer: All entities referencing @foreign_keys have been enqueued before"""
+    entity_type_name: str
+    foreign_keys: List[Sequence]
+
+
+@dataclasses.dataclass(frozen=True)
+class EntityTypeCompleted:
+    """Marker for the writer: All entities of @entity_type have been enqueued before"""
+    entity_type: EntityType
+    done: asyncio.Event
+
+
+class AsyncWorkScheduler:
+    """Sync all entity types within a single asyncio event loop.
+
+    Requests are issued using aiohttp, limited by the number of allowed OData server connections. Responses get decoded
+    straight from JSON. Rows are handed to a single writer task, which applies them one after another using a dedicated
+    database thread (psycopg2 offers no asyncio support), so the event loop never blocks on the database.
+
+    Same as WorkScheduler, entity types synced by a principal wait for their principal to complete.
+    """
+
+    def __init__(self, context: Context, db_connection, watermarks: Optional[Dict[str, datetime.datetime]] = None,
+                 checkpoint: Optional[Checkpoint] = None):
+        self._context = context
+        self._db_connection = db_connection
+        self._watermarks = watermarks or {}
+        self._checkpoint = checkpoint or Checkpoint(db_connection, context.session_id)
+        self._max_modified: Dict[str, datetime.datetime] = {}
+        self._started_at: Dict[str, datetime.datetime] = {}
+        self.upsert_counts: Dict[str, UpsertCounts] = {}
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Database writer')
+        self._request_semaphore: Optional[asyncio.Semaphore] = None
+        self._writer_queue: Optional[asyncio.Queue] = None
+        self._completed: Dict[str, asyncio.Event] = {}
+        self._loads = json_parser(context.settings.json_parser)
+        self.stage_timings = StageTimings()
+        self._archive = None
+        if context.settings.page_archive_directory:
+            self._archive = PageArchive(context.settings.page_archive_directory, context.session_id)
+
+    async def _in_db_thread(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._db_executor, function, *args)
+
+    async def _writer(self):
+        while True:
+            item = await self._writer_queue.get()
+            if item is None:
+                return
+            if type(item) is WorkItemDbPersisting:
+                log.debug(f'Writing {item.total} entities of type {item.entity_type_name} to database')
+                await self._in_db_thread(update_db, self._context, self._db_connection, item)
+                self.stage_timings.record(item.entity_type_name, item.total, item.stage_seconds)
+                self.upsert_counts[item.entity_type_name] = (
+                        self.upsert_counts.get(item.entity_type_name, UpsertCounts()) + item.upsert_counts)
+                track_modified(self._max_modified, item)
+                if item.checkpoint_key and item.next_url:
+                    await self._in_db_thread(self._checkpoint.page_persisted, item.checkpoint_key, item.next_url)
+            elif type(item) is ForeignKeysCompleted:
+                await self._in_db_thread(self._checkpoint.foreign_keys_completed, item.entity_type_name,
+                                         item.foreign_keys)
+            elif type(item) is EntityTypeCompleted:
+                if modified := self._max_modified.get(item.entity_type.name):
+                    await self._in_db_thread(store_watermark, self._db_connection, self._context, item.entity_type,
+                                             next_watermark(modified, self._started_at[item.entity_type.name]))
+                await self._in_db_thread(self._checkpoint.entity_type_completed, item.entity_type.name)
+                item.done.set()
+
+    def _entity_set_url(self, entity_type: EntityType, odata_filter: Optional[str]) -> str:
+        return self._context.entity_set_url(entity_type, odata_filter,
+                                            self._context.odata_selected_properties(entity_type), inline_count=True)
+
+    async def _get_page(self, session: aiohttp.ClientSession, entity_type: EntityType,
+                        url: str) -> Tuple[Page, Dict[str, float]]:
+        """Page at @url along with the seconds spent fetching and decoding it"""
+        async with self._request_semaphore:
+            begin = timer()
+            async with session.get(url, headers={'Accept': 'application/json'}) as response:
+                response.raise_for_status()
+                content = await response.read()
+        if self._archive:
+            self._archive.append(entity_type.name, content)
+        fetched = timer()
+        ODATA_REQUEST_SECONDS.observe(fetched - begin, entity_type=entity_type.name)
+        page = parse_page(self._loads(content))
+        return page, {'fetch': fetched - begin, 'decode': timer() - fetched}
+
+    async def _fetch_pages(self, session: aiohttp.ClientSession, entity_type: EntityType, url: str,
+                           checkpoint_key: Optional[str]) -> int:
+        """Fetch all pages starting at @url, enqueue their entities for persisting"""
+        decoder = RowDecoder(entity_type, self._context.odata_selected_properties(entity_type))
+        columns = [to_pg_name(n) for n in decoder.property_names]
+        done = 0
+        while url:
+            page, stage_seconds = await self._get_page(session, entity_type, url)
+            next_url = self._context.adjust_next_url(page.next_url) if page.next_url else None
+            done += len(page.results)
+            begin = timer()
+            rows = decoder.batch(page.results)
+            stage_seconds['extract'] = timer() - begin
+            await self._writer_queue.put(WorkItemDbPersisting(entity_type.name, rows, columns, checkpoint_key, next_url,
+                                                              stage_seconds))
+            url = next_url
+        return done
+
+    async def _fetch_by_foreign_keys(self, session: aiohttp.ClientSession, entity_type: EntityType,
+                                     foreign_keys: List[Sequence], attempt: int = 1) -> int:
+        """Fetch entities referencing @foreign_keys. On failure, retry in halves."""
+        rc = self._context.get_referential_constrain(entity_type, self._context.odata_sync_by_fk(entity_type))
+        odata_filter = odata_filter_conjunction(self._context.odata_filter_for_entity_type(entity_type),
+                                                odata_filter_by_foreign_keys(rc, foreign_keys))
+        try:
+            done = await self._fetch_pages(session, entity_type, self._entity_set_url(entity_type, odata_filter), None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            log.warning(f'{entity_type.name}: Attempt #{attempt} for {len(foreign_keys)} foreign keys failed: {e}')
+            if attempt >= MAX_ATTEMPTS and len(foreign_keys) == 1:
+                raise RuntimeError(f'{entity_type.name}: Giving up on foreign key {foreign_keys[0]}')
+            half = (len(foreign_keys) + 1) // 2
+            retries = [(keys, next_attempt(attempt, len(foreign_keys), len(keys)))
+                       for keys in (foreign_keys[:half], foreign_keys[half:]) if keys]
+            results = await asyncio.gather(*(self._fetch_by_foreign_keys(session, entity_type, keys, retry_attempt)
+                                             for keys, retry_attempt in retries))
+            return sum(results)
+        await self._writer_queue.put(ForeignKeysCompleted(entity_type.name, foreign_keys))
+        return done
+
+    def _select_pending_foreign_keys(self, entity_type: EntityType) -> List[Sequence]:
+        principal = self._context.odata_sync_by_fk(entity_type)
+        rc = self._context.get_referential_constrain(entity_type, principal)
+        with self._db_connection.cursor() as cursor:
+            principal_fk_column_names = " ,".join([to_pg_name(n) for n in rc.principal.property_names])
+            cursor.execute(f'SELECT {principal_fk_column_names} FROM odata.{to_pg_name(principal.name)}')
+            return [fk for fk in cursor.fetchall() if
+                    not self._checkpoint.is_foreign_key_completed(entity_type.name, fk)]
+
+    async def _sync_entity_type(self, session: aiohttp.ClientSession, entity_type: EntityType):
+        time_begin = timer()
+        # Before the first request, bounding the watermark
+        self._started_at[entity_type.name] = await self._in_db_thread(self._checkpoint.entity_type_started,
+                                                                      entity_type.name)
+        modified_filter = None
+        if (watermark := self._watermarks.get(entity_type.name)) and has_modified_property(self._context,
+                                                                                           entity_type):
+            modified_filter = odata_filter_modified_since(watermark)
+            principal = None
+        else:
+            principal = self._context.odata_sync_by_fk(entity_type)
+        if principal:
+            if principal.name in self._completed:
+                await self._completed[principal.name].wait()
+            # Principal entities are in the database by now
+            foreign_keys = await self._in_db_thread(self._select_pending_foreign_keys, entity_type)
+            size = self._context.settings.fk_batch_size
+            log.info(f'Fetching entities of type "{entity_type.name}" by {len(foreign_keys)} foreign keys'
+                     f' of "{principal.name}"')
+            done = sum(await asyncio.gather(
+                *(self._fetch_by_foreign_keys(session, entity_type, foreign_keys[i:i + size]) for i in
+                  range(0, len(foreign_keys), size))))
+        else:
+            url = self._checkpoint.next_urls.get(entity_type.name) or self._entity_set_url(
+                entity_type, odata_filter_conjunction(self._context.odata_filter_for_entity_type(entity_type),
+                                                      modified_filter))
+            log.info(f'Fetching entities of type "{entity_type.name}"' +
+                     (f' ({modified_filter})' if modified_filter else ''))
+            done = await self._fetch_pages(session, entity_type, url, entity_type.name)
+        completed = EntityTypeCompleted(entity_type, self._completed[entity_type.name])
+        await self._writer_queue.put(completed)
+        await completed.done.wait()
+        log.info(f'Completed entity type "{entity_type.name}" with {done} items after {timer() - time_begin} seconds'
+                 f' ({self.upsert_counts.get(entity_type.name, UpsertCounts())})')
+
+    async def _run(self):
+        max_connections = self._context.settings.odata_server_max_connections
+        self._request_semaphore = asyncio.Semaphore(max_connections)
+        # Bounded, so fetching pauses when the database falls behind
+        self._writer_queue = asyncio.Queue(maxsize=2 * max_connections)
+        entity_types = [et for et in self._context.include if
+                        et.name not in self._checkpoint.completed_entity_types]
+        self._completed = {et.name: asyncio.Event() for et in entity_types}
+        writer = asyncio.create_task(self._writer())
+        # Hedging stuck requests is up to the threaded sync, the deadlines apply nevertheless
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self._context.settings.odata_connect_timeout,
+                                        sock_read=self._context.settings.odata_read_timeout)
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=max_connections),
+                                         timeout=timeout) as session:
+            syncs = [asyncio.create_task(self._sync_entity_type(session, et)) for et in entity_types]
+            # Fail early if either the writer or any of the syncs fails, remaining tasks get cancelled by asyncio.run
+            pending = set(syncs) | {writer}
+            while pending - {writer}:
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    task.result()
+        await self._writer_queue.put(None)
+        await writer
+
+    def run(self):
+        try:
+            asyncio.run(self._run())
+        finally:
+            self._db_executor.shutdown()
+            if self._archive:
+                self._archive.close()
+                log.info(f'Archive: {self._archive}')
@@ -0,0 +1,120 @@
+import logging
+import logging.handlers
+import multiprocessing
+from threading import Thread
+from typing import Optional, List
+
+from odata2sql import metrics
+from odata2sql.command_sync import WorkScheduler, Shutdown, do_odata_fetch, _queue_size
+from odata2sql.concurrency import ConcurrencyController
+from odata2sql.flow_control import SharedInFlightBudget, InFlightBudget
+from odata2sql.http_session import RequestStatistics
+from odata2sql.odata import Settings, Context
+
+log = logging.getLogger(__name__)
+
+# Seconds to wait for a worker process to shut down before terminating it
+SHUTDOWN_TIMEOUT = 10
+
+
+def distribute(total: int, parts: int) -> List[int]:
+    """Split @total into @parts as even as possible, e.g. connections among worker processes"""
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def run_worker_process(settings: Settings, metadata: Optional[bytes], input_: multiprocessing.Queue,
+                       output: multiprocessing.Queue, budget: InFlightBudget, connections: int,
+                       log_queue: multiprocessing.Queue, log_level: int):
+    """Worker process function. Runs @connections worker threads (see do_odata_fetch), which fetch, decode and map
+    entities to rows. As the threads of different processes do not compete for the same GIL, CPU bound work scales with
+    the number of cores. Log records get forwarded to the scheduler using @log_queue."""
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(log_level)
+    try:
+        context = Context.from_settings(settings, metadata)
+        # Caps of entity types apply per process
+        controller = ConcurrencyController(connections, max(1, connections // 4), context.settings.odata_max_connections,
+                                           settings.adaptive_concurrency)
+        statistics = RequestStatistics(settings.hedge_percentile)
+    except Exception as e:
+        output.put(RuntimeError(f'Worker process failed to start: {e!r}'))
+        return
+    threads = [Thread(target=do_odata_fetch, args=(context, input_, output, budget, controller, statistics),
+                      daemon=True, name=f'OData worker thread #{i}') for i in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    log.info(f'Shutting process down: {controller}, {statistics}')
+
+
+def _forward_log_records(log_queue: multiprocessing.Queue):
+    """Handle records logged by worker processes as if they were logged by this one"""
+    while (record := log_queue.get()) is not None:
+        logging.getLogger(record.name).handle(record)
+
+
+class ProcessWorkScheduler(WorkScheduler):
+    """Same as WorkScheduler, but fetching entities happens in worker processes (see run_worker_process).
+
+    The OData server connections get split among the processes, each of them adapting its share to the server's health
+    on its own. Rows get handed back to the scheduler, which persists them using the database writers. Fetching pauses
+    while the shared budget of rows in flight is exhausted.
+    """
+    # Neither forks the threads of this process nor its database connections
+    _multiprocessing = multiprocessing.get_context('spawn')
+    _queues = _multiprocessing
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        settings = self._context.settings
+        self._connections = distribute(settings.odata_server_max_connections,
+                                       min(settings.sync_processes, settings.odata_server_max_connections))
+        self._budget = SharedInFlightBudget(self._multiprocessing, settings.max_in_flight_rows,
+                                            settings.max_in_flight_bytes)
+        self._log_queue = self._multiprocessing.Queue()
+        self._log_forwarder: Optional[Thread] = None
+        self._processes: List[multiprocessing.Process] = []
+
+    def _register_metrics(self):
+        super()._register_metrics()
+        # Known to the worker processes only
+        for metric in (metrics.ODATA_REQUESTS_IN_FLIGHT, metrics.ODATA_REQUEST_LIMIT, metrics.ODATA_REQUEST_BACK_OFFS,
+                       metrics.ODATA_REQUESTS_HEDGED, metrics.ODATA_REQUEST_TIMEOUTS):
+            metric.set_function(lambda: None)
+
+    def flow_statistics(self) -> str:
+        statistics = (f'{_queue_size(self._odata_work_queue)} work items queued,'
+                      f' {_queue_size(self._odata_result_queue)} results queued')
+        if self._writer_pool:
+            statistics += f', writer queues {self._writer_pool.queue_depths()}'
+        alive = sum(1 for p in self._processes if p.is_alive())
+        return f'{statistics}, {self._budget}, {alive} of {len(self._connections)} worker processes alive'
+
+    def _start_fetchers(self):
+        self._log_forwarder = Thread(target=_forward_log_records, args=(self._log_queue,), daemon=True,
+                                     name='Log forwarder')
+        self._log_forwarder.start()
+        log_level = logging.getLogger().getEffectiveLevel()
+        for i, connections in enumerate(self._connections):
+            process = self._multiprocessing.Process(
+                target=run_worker_process,
+                args=(self._context.settings, self._context.metadata, self._odata_work_queue, self._odata_result_queue,
+                      self._budget, connections, self._log_queue, log_level),
+                daemon=True, name=f'OData worker process #{i}')
+            process.start()
+            self._processes.append(process)
+        log.info(f'Started {len(self._processes)} worker processes using {self._connections} connections')
+
+    def _stop_fetchers(self):
+        for _ in range(sum(self._connections)):
+            self._odata_work_queue.put(Shutdown())
+        for process in self._processes:
+            process.join(SHUTDOWN_TIMEOUT)
+            if process.is_alive():
+                log.warning(f'Terminating {process.name}')
+                process.terminate()
+                process.join()
+        self._log_queue.put(None)
+        self._log_forwarder.join()
@@ -1,4 +1,7 @@
+import datetime
 import os
+import sqlite3
+import uuid
 
 import pyodata
 import pytest
@@ -27,3 +30,79 @@ def context(client, settings):
 
 SERVICE_URL = 'https://ws.parlament.ch/odata.svc'
 fixture_directory = os.path.join(os.path.dirname(__file__), 'fixture/')
+pre_init_directory = os.path.join(os.path.dirname(__file__), '../pre-init.d/')
+
+
+def _sql_literal(value) -> str:
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class SqliteCursor:
+    """Enough of a psycopg2 cursor for the statements on the private schema, see private_db"""
+
+    def __init__(self, connection: 'SqliteConnection'):
+        self.connection = connection
+        self._cursor = connection.sqlite.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._cursor.close()
+
+    def execute(self, statement, parameters=()):
+        if isinstance(statement, bytes):
+            statement = statement.decode()
+        self._cursor.execute(statement.replace('%s', '?').replace('%%', '%'), tuple(parameters or ()))
+
+    def mogrify(self, template: bytes, parameters) -> bytes:
+        """As used by psycopg2.extras.execute_values"""
+        return (template.decode() % tuple(_sql_literal(p) for p in parameters)).encode()
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+
+class SqliteConnection:
+    """In-memory SQLite database standing in for PostgreSQL, holding the schemas odata and private. The tables get
+    created by the given pre-init.d scripts, adapted to SQLite's dialect."""
+    encoding = 'UTF8'
+
+    def __init__(self, *script_names: str):
+        self.sqlite = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES)
+        for schema in ('odata', 'private'):
+            self.sqlite.execute(f"ATTACH DATABASE ':memory:' AS {schema}")
+        self.sqlite.create_function('NOW', 0, lambda: datetime.datetime.utcnow().isoformat(' '))
+        self.sqlite.create_function('GREATEST', 2, max)
+        for script_name in script_names:
+            with open(os.path.join(pre_init_directory, script_name)) as f:
+                script = f.read()
+            script = '\n'.join(line for line in script.splitlines() if not line.startswith('COMMENT ON'))
+            self.sqlite.executescript(script.replace('DEFAULT NOW()', 'DEFAULT CURRENT_TIMESTAMP'))
+
+    def cursor(self) -> SqliteCursor:
+        return SqliteCursor(self)
+
+    def commit(self):
+        self.sqlite.commit()
+
+    def rollback(self):
+        self.sqlite.rollback()
+
+
+sqlite3.register_adapter(uuid.UUID, str)
+sqlite3.register_adapter(datetime.datetime, lambda d: d.isoformat(' '))
+sqlite3.register_converter('timestamp', lambda b: datetime.datetime.fromisoformat(b.decode()))
+
+
+@pytest.fixture
+def private_db() -> SqliteConnection:
+    """Database holding the watermark and checkpoint tables"""
+    return SqliteConnection('002-sync-watermark.sql', '003-sync-checkpoint.sql')
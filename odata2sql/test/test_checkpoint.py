@@ -0,0 +1,43 @@
+import uuid
+
+from odata2sql.checkpoint import Checkpoint
+
+SESSION_ID = uuid.UUID('0b8f7a5e-2c39-4a4e-9a57-61b4d3c2e1f0')
+
+
+def test_checkpoint_round_trip(private_db):
+    checkpoint = Checkpoint(private_db, SESSION_ID)
+    started_at = checkpoint.entity_type_started('Person')
+    checkpoint.entity_type_completed('Person')
+    checkpoint.entity_type_started('PersonAddress')
+    checkpoint.page_persisted('Business:ID[,100)', 'https://example.com/Business?$skiptoken=1')
+    checkpoint.page_persisted('Business:ID[,100)', 'https://example.com/Business?$skiptoken=2')
+    checkpoint.key_ranges_planned('Business', [(None, 100), (100, 200), (200, None)])
+    checkpoint.key_range_completed('Business', 100, 200)
+    checkpoint.key_range_completed('Business', 200, None)
+    checkpoint.foreign_keys_completed('Voting', [(1, 'DE'), (2, 'DE')])
+
+    resumed = Checkpoint(private_db, SESSION_ID).load()
+    assert resumed.completed_entity_types == {'Person'}
+    assert resumed.started_at['Person'] == started_at
+    assert set(resumed.started_at) == {'Person', 'PersonAddress'}
+    assert resumed.next_urls == {'Business:ID[,100)': 'https://example.com/Business?$skiptoken=2'}
+    assert resumed.key_ranges == {'Business': [(None, 100, False), (100, 200, True), (200, None, True)]}
+    assert resumed.is_foreign_key_completed('Voting', (1, 'DE'))
+    assert resumed.is_foreign_key_completed('Voting', [2, 'DE'])
+    assert not resumed.is_foreign_key_completed('Voting', (3, 'DE'))
+    assert not resumed.is_foreign_key_completed('Vote', (1, 'DE'))
+    # Resuming keeps the start of the first run
+    assert resumed.entity_type_started('Person') == started_at
+
+
+def test_checkpoint_per_session(private_db):
+    checkpoint = Checkpoint(private_db, SESSION_ID)
+    checkpoint.entity_type_completed('Person')
+    checkpoint.page_persisted('Person', 'https://example.com/Person?$skiptoken=1')
+    checkpoint.foreign_keys_completed('Voting', [(1, 'DE')])
+
+    other = Checkpoint(private_db, uuid.uuid4()).load()
+    assert other.completed_entity_types == set()
+    assert other.next_urls == {}
+    assert not other.is_foreign_key_completed('Voting', (1, 'DE'))
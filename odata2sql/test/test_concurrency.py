@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+import requests
+
+from odata2sql.concurrency import ConcurrencyController, is_overload
+
+
+def request(controller, key='Voting', error=None):
+    with controller.request(key):
+        if error:
+            raise error
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.exceptions.HTTPError(response=response)
+
+
+def test_is_overload():
+    assert is_overload(requests.exceptions.ReadTimeout())
+    assert is_overload(requests.exceptions.ConnectionError())
+    assert is_overload(http_error(503))
+    assert not is_overload(http_error(404))
+    assert not is_overload(ValueError())
+
+
+def test_additive_increase():
+    controller = ConcurrencyController(10, 2)
+    # One more per round of requests
+    for _ in range(3):
+        request(controller)
+    assert controller.limit == 3
+    for _ in range(100):
+        request(controller)
+    assert controller.limit == 10
+    assert controller.peak_limit == 10
+
+
+def test_multiplicative_decrease_once_per_cooldown():
+    controller = ConcurrencyController(16, 16)
+    for _ in range(3):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            request(controller, error=requests.exceptions.ConnectionError())
+    assert controller.limit == 8
+    assert controller.back_offs == 1
+    with pytest.raises(ValueError):
+        request(controller, error=ValueError())
+    assert controller.limit == 8
+
+
+def test_slow_request_decreases():
+    controller = ConcurrencyController(16, 8, target_seconds=-1)
+    request(controller)
+    assert controller.limit == 7
+
+
+def test_fixed():
+    controller = ConcurrencyController(16, 2, adaptive=False)
+    assert controller.limit == 16
+    with pytest.raises(requests.exceptions.ConnectionError):
+        request(controller, error=requests.exceptions.ConnectionError())
+    assert controller.limit == 16
+
+
+def test_cap_per_key():
+    controller = ConcurrencyController(4, 4, caps=lambda key: 1 if key == 'Voting' else None, adaptive=False)
+    started = threading.Event()
+    with controller.request('Voting'):
+        thread = threading.Thread(target=lambda: (request(controller, 'Voting'), started.set()))
+        thread.start()
+        # Other entity types are not affected by the cap
+        request(controller, 'Vote')
+        assert not started.wait(0.1)
+    assert started.wait(5)
+    thread.join()
+
+
+def test_try_acquire():
+    controller = ConcurrencyController(2, 2, caps=lambda key: 2 if key == 'Voting' else None, adaptive=False)
+    # Not within a request
+    assert controller.try_acquire() is None
+    with controller.request('Voting'):
+        release = controller.try_acquire()
+        assert controller.in_flight == 2
+        # Limit reached
+        assert controller.try_acquire() is None
+        release()
+        assert controller.in_flight == 1
+    assert controller.in_flight == 0
+    assert controller.try_acquire() is None
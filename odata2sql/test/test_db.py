@@ -1,6 +1,6 @@
 import pytest
 
-from odata2sql.sql import to_snake_case, to_pg_name
+from odata2sql.sql import to_snake_case, to_pg_name, run_sql_scripts
 
 
 def test_to_snake_case():
@@ -15,3 +15,22 @@ def test_to_pg_name():
 
     with pytest.raises(ValueError):
         to_pg_name("Suspici;ous")
+
+
+def test_run_sql_scripts(tmp_path):
+    class Cursor:
+        def __init__(self):
+            self.executed = []
+
+        def execute(self, statement):
+            self.executed.append(statement)
+
+    (tmp_path / '200-second.sql').write_text('SELECT 2;')
+    (tmp_path / '100-first.sql').write_text('SELECT 1;')
+    (tmp_path / 'README').write_text('Not a script')
+    cur = Cursor()
+    run_sql_scripts(cur, tmp_path)
+    assert cur.executed == ['SELECT 1;', 'SELECT 2;']
+
+    with pytest.raises(ValueError):
+        run_sql_scripts(cur, tmp_path / 'missing')
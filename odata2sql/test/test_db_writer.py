@@ -0,0 +1,81 @@
+import contextlib
+import queue
+import threading
+import time
+
+from odata2sql.db_writer import DbWriterPool, WorkItemPersisted, WorkItemDurable
+
+
+class Rows:
+    """Stand-in for WorkItemDbPersisting"""
+
+    def __init__(self, entity_type_name, number):
+        self.entity_type_name = entity_type_name
+        self.table_name = entity_type_name.lower()
+        self.number = number
+        self.columns = ['id']
+        self.rows = [[number]]
+        self.checkpoint_key = None
+        self.next_url = None
+        self.payload_bytes = 64
+        self.stage_seconds = {}
+        self.upsert_counts = None
+
+    @property
+    def total(self):
+        return len(self.rows)
+
+
+class Fetch:
+    """Stand-in for WorkItemFetchByEntityType"""
+
+    def __init__(self, entity_type_name):
+        self.entity_type_name = entity_type_name
+
+
+@contextlib.contextmanager
+def connection_factory():
+    yield threading.get_ident()
+
+
+def drain(output: queue.Queue, count: int):
+    return [output.get(timeout=5) for _ in range(count)]
+
+
+def test_barrier_after_all_rows_of_table():
+    applied = []
+
+    def apply(connection, work_item):
+        time.sleep(0.01)
+        applied.append((connection, work_item.entity_type_name, work_item.number))
+
+    output = queue.Queue()
+    pool = DbWriterPool(connection_factory, apply, output, writer_count=2, queue_depth=2)
+    pool.start()
+    for i in range(3):
+        pool.submit(Rows('Person', i))
+        pool.submit(Rows('Party', i))
+    pool.barrier(Fetch('Person'))
+    pool.barrier(Fetch('Party'))
+    acks = drain(output, 8)
+    pool.shutdown()
+
+    for entity_type_name in ('Person', 'Party'):
+        ack_types = [type(a) for a in acks if entity_type_name == (
+            a.work_item.entity_type_name if type(a) is WorkItemDurable else a.entity_type_name)]
+        assert ack_types == [WorkItemPersisted] * 3 + [WorkItemDurable]
+        assert [n for _, name, n in applied if name == entity_type_name] == [0, 1, 2]
+    assert len({connection for connection, _, _ in applied}) == 2, 'Tables are spread across writers'
+
+
+def test_failing_writer_reports_error():
+    def apply(connection, work_item):
+        raise ValueError('Broken')
+
+    output = queue.Queue()
+    pool = DbWriterPool(connection_factory, apply, output, writer_count=1, queue_depth=1)
+    pool.start()
+    for i in range(3):
+        pool.submit(Rows('Person', i))
+    assert isinstance(output.get(timeout=5), RuntimeError)
+    pool.shutdown()
@@ -0,0 +1,92 @@
+import contextlib
+import threading
+import uuid
+
+from odata2sql.deferred_indexes import defer_indexes, rebuild_indexes
+
+
+class Cursor:
+    def __init__(self, connection):
+        self._connection = connection
+        self._result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, statement, parameters=None):
+        with self._connection.lock:
+            self._connection.executed.append((statement.strip(), parameters))
+        if 'FROM pg_index' in statement:
+            self._result = [('odata.vote_idx_language', 'vote', 'CREATE INDEX vote_idx_language ON odata.vote (language)'),
+                            ('odata."zone_idx_name"', 'zone', 'CREATE INDEX "zone_idx_name" ON odata."zone" (name)')]
+        elif 'FROM private.deferred_index' in statement:
+            self._result = self._connection.deferred
+
+    def fetchall(self):
+        return self._result
+
+
+class Connection:
+    def __init__(self, deferred=()):
+        self.deferred = list(deferred)
+        self.executed = []
+        self.commits = 0
+        self.lock = threading.Lock()
+
+    def cursor(self):
+        return Cursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def statements(self):
+        return [statement for statement, _ in self.executed]
+
+
+def test_defer_indexes():
+    connection = Connection()
+    assert defer_indexes(connection, ['vote', 'zone'], uuid.uuid4()) == 2
+    assert connection.executed[0][1] == (['vote', 'zone'],)
+    statements = connection.statements()
+    assert statements[2] == 'DROP INDEX odata.vote_idx_language'
+    assert statements[4] == 'DROP INDEX odata."zone_idx_name"'
+    assert connection.executed[1][1][0] == 'odata.vote_idx_language'
+    assert connection.commits == 1
+
+
+def test_rebuild_indexes():
+    deferred = [('vote', 'odata.vote_idx_language', 'CREATE INDEX vote_idx_language ON odata.vote (language)'),
+                ('vote', 'odata.vote_idx_id', 'CREATE INDEX vote_idx_id ON odata.vote (id)'),
+                ('zone', 'odata."zone_idx_name"', 'CREATE INDEX "zone_idx_name" ON odata."zone" (name)')]
+    connection = Connection(deferred)
+    builders = []
+
+    @contextlib.contextmanager
+    def connection_factory():
+        builders.append(builder := Connection())
+        yield builder
+
+    rebuild_indexes(connection, connection_factory, 2, '1GB', analyze=['vote', 'person'])
+    # A connection per table, be it for building its indexes or analyzing it
+    assert len(builders) == 3
+    statements = [b.statements() for b in builders]
+    assert all(s[0].startswith("SELECT set_config('maintenance_work_mem'") for s in statements)
+    assert sorted(s for b in statements for s in b if s.startswith('CREATE INDEX')) == sorted(d for _, _, d in deferred)
+    assert sorted(s for b in statements for s in b if s.startswith('ANALYZE')) == ['ANALYZE odata.person',
+                                                                                  'ANALYZE odata.vote']
+    vote = next(s for s in statements if 'ANALYZE odata.vote' in s)
+    assert vote[1:] == ['CREATE INDEX vote_idx_language ON odata.vote (language)',
+                                 'DELETE FROM private.deferred_index WHERE index_name = %s',
+                                 'CREATE INDEX vote_idx_id ON odata.vote (id)',
+                                 'DELETE FROM private.deferred_index WHERE index_name = %s',
+                                 'ANALYZE odata.vote']
+
+
+def test_rebuild_indexes_nothing_to_do():
+    def connection_factory():
+        raise AssertionError('No connection needed')
+
+    rebuild_indexes(Connection(), connection_factory, 4)
@@ -0,0 +1,62 @@
+import multiprocessing
+import threading
+
+from odata2sql.flow_control import InFlightBudget, SharedInFlightBudget, estimate_payload_bytes
+
+
+def test_estimate_payload_bytes():
+    assert estimate_payload_bytes([]) == 0
+    small = estimate_payload_bytes([(1, 'DE')] * 10)
+    assert small > 0
+    assert estimate_payload_bytes([(1, 'DE')] * 1000) == 100 * small
+    assert estimate_payload_bytes([(1, 'DE' * 1000)] * 10) > small
+
+
+def test_budget_admits_oversized_page_if_idle():
+    budget = InFlightBudget(max_rows=10, max_bytes=100)
+    budget.acquire(50, 5000)
+    assert (budget.pages, budget.rows, budget.bytes) == (1, 50, 5000)
+    budget.release(50, 5000)
+    assert (budget.pages, budget.rows, budget.bytes) == (0, 0, 0)
+    assert (budget.peak_rows, budget.peak_bytes) == (50, 5000)
+
+
+def test_budget_blocks_until_released():
+    budget = InFlightBudget(max_rows=10)
+    budget.acquire(8, 0)
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: (budget.acquire(5, 0), acquired.set()))
+    thread.start()
+    assert not acquired.wait(0.1)
+    budget.release(8, 0)
+    assert acquired.wait(5)
+    thread.join()
+    assert budget.rows == 5
+    assert budget.blocked_seconds > 0
+
+
+def test_budget_unlimited():
+    budget = InFlightBudget()
+    for _ in range(100):
+        budget.acquire(10 ** 6, 10 ** 9)
+    assert budget.rows == 10 ** 8
+
+
+def _acquire(budget: InFlightBudget, rows: int, acquired):
+    budget.acquire(rows, 0)
+    acquired.set()
+
+
+def test_shared_budget_spans_processes():
+    mp_context = multiprocessing.get_context('spawn')
+    budget = SharedInFlightBudget(mp_context, max_rows=10)
+    budget.acquire(8, 0)
+    acquired = mp_context.Event()
+    process = mp_context.Process(target=_acquire, args=(budget, 5, acquired))
+    process.start()
+    assert not acquired.wait(0.5)
+    budget.release(8, 0)
+    assert acquired.wait(10)
+    process.join()
+    assert (budget.pages, budget.rows, budget.peak_rows) == (1, 5, 8)
+    assert budget.blocked_seconds > 0
@@ -0,0 +1,122 @@
+import http.server
+import threading
+import time
+
+import pytest
+import requests
+
+from odata2sql.concurrency import ConcurrencyController
+from odata2sql.http_session import DeadlineSession, RequestStatistics, HEDGE_MIN_SAMPLES, HEDGE_MIN_DELAY_SECONDS
+
+
+class FirstRequestStuckHandler(http.server.BaseHTTPRequestHandler):
+    """Answers every request but the first one immediately"""
+    requests = 0
+
+    def do_GET(self):
+        assert self.headers['Authorization'], 'Hedged requests must be configured like the session'
+        type(self).requests += 1
+        if type(self).requests == 1:
+            time.sleep(5)
+        body = str(type(self).requests).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    FirstRequestStuckHandler.requests = 0
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FirstRequestStuckHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/'
+    server.shutdown()
+
+
+def test_hedge_delay():
+    statistics = RequestStatistics(90)
+    for i in range(HEDGE_MIN_SAMPLES - 1):
+        statistics.succeeded(i)
+    # Too few samples to tell what is unusually slow
+    assert statistics.hedge_delay() is None
+    statistics.succeeded(HEDGE_MIN_SAMPLES - 1)
+    assert statistics.hedge_delay() == 18
+    assert statistics.requests == HEDGE_MIN_SAMPLES
+
+
+def test_hedge_delay_minimum():
+    statistics = RequestStatistics(50)
+    for _ in range(HEDGE_MIN_SAMPLES):
+        statistics.succeeded(0.01)
+    assert statistics.hedge_delay() == HEDGE_MIN_DELAY_SECONDS
+
+
+def test_no_hedging():
+    statistics = RequestStatistics(None)
+    for _ in range(HEDGE_MIN_SAMPLES):
+        statistics.succeeded(5)
+    assert statistics.hedge_delay() is None
+
+
+def test_deadlines(monkeypatch):
+    timeouts = []
+
+    def request(session, method, url, **kwargs):
+        timeouts.append(kwargs['timeout'])
+        raise requests.exceptions.ReadTimeout()
+
+    monkeypatch.setattr(requests.Session, 'request', request)
+    statistics = RequestStatistics()
+    with DeadlineSession((3.0, 30.0), statistics) as session:
+        with pytest.raises(requests.exceptions.Timeout):
+            session.get('http://localhost/Voting')
+    assert timeouts == [(3.0, 30.0)]
+    assert statistics.timeouts == 1
+
+
+def test_hedged_request_wins(server_url):
+    statistics = RequestStatistics(50)
+    for _ in range(HEDGE_MIN_SAMPLES):
+        statistics.succeeded(0.01)
+    with DeadlineSession((3.0, 30.0), statistics) as session:
+        session.auth = ('user', 'secret')
+        begin = time.monotonic()
+        response = session.get(server_url)
+        assert time.monotonic() - begin < 4
+    # Answered by the second request
+    assert response.text == '2'
+    assert (statistics.stuck, statistics.hedges_won) == (1, 1)
+    assert str(statistics) == '21 requests, 1 stuck (1 answered by the hedged request first), 0 timed out'
+
+
+def test_hedged_request_takes_slot(server_url):
+    statistics = RequestStatistics(50)
+    for _ in range(HEDGE_MIN_SAMPLES):
+        statistics.succeeded(0.01)
+    controller = ConcurrencyController(2, 2, adaptive=False)
+    with DeadlineSession((3.0, 30.0), statistics, controller) as session, controller.request('Voting'):
+        session.auth = ('user', 'secret')
+        assert session.get(server_url).text == '2'
+    assert (statistics.stuck, statistics.hedges_won) == (1, 1)
+    # The hedged request released its slot once answered
+    deadline = time.monotonic() + 10
+    while controller.in_flight and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert controller.in_flight == 0
+
+
+def test_no_hedging_without_slot(server_url):
+    statistics = RequestStatistics(50)
+    for _ in range(HEDGE_MIN_SAMPLES):
+        statistics.succeeded(0.01)
+    controller = ConcurrencyController(1, 1, adaptive=False)
+    with DeadlineSession((3.0, 30.0), statistics, controller) as session, controller.request('Voting'):
+        session.auth = ('user', 'secret')
+        # Waits for the stuck request
+        assert session.get(server_url).text == '1'
+    assert statistics.stuck == 0
@@ -0,0 +1,47 @@
+from odata2sql.index_advisor import IndexAdvisor, IndexUsage, redundant_indexes, unused_indexes, index_report
+from odata2sql.odata import Context, SettingsBuilder
+from odata2sql.test.conftest import SERVICE_URL
+
+
+def test_index_advisor(context):
+    assert IndexAdvisor(context).odata_to_ddl() == """\
+CREATE STATISTICS odata.person_stat_id_language (ndistinct, dependencies) ON "id", "language" FROM odata.person;
+
+CREATE INDEX person_address_idx_person_number_language ON odata.person_address (person_number, "language") \
+INCLUDE ("id");
+CREATE STATISTICS odata.person_address_stat_id_language (ndistinct, dependencies) ON "id", "language" \
+FROM odata.person_address;
+CREATE STATISTICS odata.person_address_stat_person_number_language (ndistinct, dependencies) \
+ON person_number, "language" FROM odata.person_address;"""
+
+
+def test_index_advisor_skips_foreign_keys_not_synced(client):
+    settings = SettingsBuilder(SERVICE_URL).sync_config(
+        {'entities': {'PersonAddress': {'selected_properties': ['ID', 'Language', 'City']}}}).build()
+    ddl = IndexAdvisor(Context(client, settings)).odata_to_ddl()
+    assert 'CREATE INDEX' not in ddl
+    assert 'person_address_stat_id_language' in ddl
+
+
+def _index(name, key_columns, included_columns=(), unique=False, scans=1, table_name='vote'):
+    return IndexUsage(table_name, name, unique, key_columns, included_columns, False, scans, 8192)
+
+
+def test_redundant_indexes():
+    pkey = _index('vote_pkey', (1, 2), unique=True)
+    by_id = _index('vote_idx_id', (1,))
+    by_fk = _index('vote_idx_business_number_language', (3, 2), (1,))
+    by_fk_again = _index('vote_idx_business_number', (3, 2), (1,))
+    by_fk_without_id = _index('vote_idx_business_number_only', (3,))
+    other_table = _index('voting_idx_id', (1,), table_name='voting')
+    usage = [pkey, by_id, by_fk, by_fk_again, by_fk_without_id, other_table]
+    assert redundant_indexes(usage) == [(by_id, pkey), (by_fk_again, by_fk), (by_fk_without_id, by_fk)]
+
+
+def test_unused_indexes():
+    usage = [_index('vote_pkey', (1, 2), unique=True, scans=0), _index('vote_idx_language', (2,), scans=0),
+             _index('vote_idx_registration_number', (4,))]
+    assert unused_indexes(usage) == [usage[1]]
+    assert index_report(usage + [_index('vote_idx_language_again', (2,), scans=0)]) == [
+        'Redundant index odata.vote_idx_language_again (0.0 MiB, 0 scans): Covered by vote_idx_language on vote',
+        'Unused index odata.vote_idx_language (0.0 MiB) on vote']
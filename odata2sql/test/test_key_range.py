@@ -0,0 +1,55 @@
+import json
+from urllib.parse import unquote
+
+import requests
+from pyodata.v2.service import Service
+
+from odata2sql.key_range import KeyRange, range_key_property, key_ranges, boundaries_from_server
+from odata2sql.odata import Context
+from odata2sql.test.conftest import SERVICE_URL
+
+
+def test_key_range_odata_filter():
+    assert KeyRange('ID', None, None).odata_filter() is None
+    assert KeyRange('ID', 10, None).odata_filter() == 'ID ge 10'
+    assert KeyRange('ID', None, 20).odata_filter() == 'ID lt 20'
+    assert KeyRange('ID', 10, 20, 'L').odata_filter() == 'ID ge 10L and ID lt 20L'
+    assert str(KeyRange('ID', None, 20)) == 'ID[,20)'
+
+
+def test_range_key_property(context):
+    assert range_key_property(context.get_entity_type_by_name('Person')).name == 'ID'
+    # Keyed by Edm.Guid
+    assert range_key_property(context.get_entity_type_by_name('PersonAddress')) is None
+
+
+def test_key_ranges(context):
+    key_property = range_key_property(context.get_entity_type_by_name('Person'))
+    assert key_ranges(key_property, []) == [KeyRange('ID', None, None)]
+    assert key_ranges(key_property, [30, 10, 30]) == [KeyRange('ID', None, 10), KeyRange('ID', 10, 30),
+                                                      KeyRange('ID', 30, None)]
+
+
+class FakeSession(requests.Session):
+    """Answer requests for the lowest and highest key"""
+
+    def __init__(self, lowest, highest):
+        super().__init__()
+        self.limits = [lowest, highest]
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({'d': {'results': [{'ID': self.limits.pop(0)}]}}).encode('utf-8')
+        return response
+
+
+def test_boundaries_from_server(client, settings):
+    person = client.schema.entity_type('Person')
+    session = FakeSession(100, 500)
+    context = Context(Service(SERVICE_URL, client.schema, session), settings)
+    assert boundaries_from_server(context, person, range_key_property(person), 4) == [200, 300, 400]
+    assert '$orderby=ID desc' in unquote(session.urls[1])
+    assert '$top=1' in unquote(session.urls[1])
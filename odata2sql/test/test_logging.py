@@ -0,0 +1,119 @@
+import contextlib
+import logging
+import threading
+import uuid
+
+from odata2sql.logging import LogDbHandler, log_to_database
+
+SESSION_ID = uuid.UUID('00000000-0000-0000-0000-000000000001')
+
+
+class FakeConnection:
+    def __init__(self):
+        self.thread = None
+
+    def rollback(self):
+        pass
+
+
+class RecordingHandler(LogDbHandler):
+    """Keeps batches in memory instead of inserting them"""
+
+    def __init__(self, *args, **kwargs):
+        self.connection = FakeConnection()
+        self.batches = []
+        self.insert_started = threading.Event()
+        self.may_insert = threading.Event()
+        self.may_insert.set()
+        super().__init__(SESSION_ID, self._connect, *args, **kwargs)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        self.connection.thread = threading.current_thread()
+        yield self.connection
+
+    def _insert(self, connection, rows):
+        self.insert_started.set()
+        self.may_insert.wait()
+        self.batches.append(rows)
+
+    @property
+    def messages(self):
+        return [row[4] for batch in self.batches for row in batch]
+
+
+def _logger(handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(f'test_logging.{uuid.uuid4()}')
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    return logger
+
+
+def test_flushes_everything_on_close():
+    handler = RecordingHandler(flush_seconds=60)
+    logger = _logger(handler)
+    for i in range(5):
+        logger.info(f'Message {i}')
+    handler.close()
+    assert handler.messages == [f'Message {i}' for i in range(5)]
+    assert handler.batches[0][0][0] == SESSION_ID
+    assert handler.batches[0][0][2:4] == (logging.INFO, 'INFO')
+
+
+def test_uses_connection_of_its_own():
+    handler = RecordingHandler()
+    _logger(handler).info('Hello')
+    handler.close()
+    assert handler.connection.thread not in (None, threading.current_thread())
+
+
+def test_batches_by_size():
+    handler = RecordingHandler(batch_size=3, flush_seconds=60)
+    logger = _logger(handler)
+    for i in range(7):
+        logger.info(f'Message {i}')
+    handler.close()
+    assert [len(b) for b in handler.batches] == [3, 3, 1]
+
+
+def test_batches_by_time():
+    handler = RecordingHandler(flush_seconds=0.01)
+    _logger(handler).info('Hello')
+    assert handler.insert_started.wait(5)
+    handler.close()
+    assert handler.messages == ['Hello']
+
+
+def test_flush():
+    handler = RecordingHandler(flush_seconds=60)
+    logger = _logger(handler)
+    logger.info('Hello')
+    handler.flush()
+    assert handler.messages == ['Hello']
+    handler.close()
+
+
+def test_drops_records_exceeding_capacity():
+    handler = RecordingHandler(batch_size=1, capacity=2)
+    logger = _logger(handler)
+    handler.may_insert.clear()
+    logger.info('Blocking')
+    assert handler.insert_started.wait(5)
+    for i in range(5):
+        logger.info(f'Message {i}')
+    handler.may_insert.set()
+    handler.close()
+    assert sorted(handler.messages) == ['Blocking', 'Dropped 3 log records, logging faster than they could be persisted',
+                                        'Message 0', 'Message 1']
+
+
+def test_log_to_database(monkeypatch):
+    handlers = []
+    monkeypatch.setattr('odata2sql.logging.LogDbHandler', lambda *_: handlers.append(RecordingHandler()) or handlers[0])
+    logger = logging.getLogger(f'test_logging.{uuid.uuid4()}')
+    logger.propagate = False
+    with log_to_database(logger, SESSION_ID, None):
+        logger.warning('Hello')
+    assert not logger.handlers
+    assert handlers[0].messages == ['Hello']
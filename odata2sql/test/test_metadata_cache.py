@@ -0,0 +1,53 @@
+import os
+
+import pytest
+import requests
+
+from odata2sql.metadata import MetadataCache, content_hash, load_metadata
+from odata2sql.test.conftest import SERVICE_URL, fixture_directory
+
+METADATA_FILE = os.path.join(fixture_directory, 'metadata.xml')
+
+
+class NoNetwork(requests.Session):
+    def get(self, *args, **kwargs):
+        raise AssertionError('Unexpected request')
+
+
+def test_cache_roundtrip(tmp_path):
+    cache = MetadataCache(str(tmp_path))
+    assert cache.get(SERVICE_URL) is None
+    hash_ = cache.put(SERVICE_URL, b'<edmx/>')
+    assert hash_ == content_hash(b'<edmx/>')
+    assert (tmp_path / f'{hash_}.xml').read_bytes() == b'<edmx/>'
+    assert cache.get(SERVICE_URL) == b'<edmx/>'
+    assert cache.get('https://example.org/odata.svc') is None
+
+
+def test_cache_ignores_damaged_document(tmp_path):
+    cache = MetadataCache(str(tmp_path))
+    hash_ = cache.put(SERVICE_URL, b'<edmx/>')
+    (tmp_path / f'{hash_}.xml').write_bytes(b'<edm')
+    assert cache.get(SERVICE_URL) is None
+
+
+def test_load_metadata_seeds_cache(tmp_path):
+    with open(METADATA_FILE, 'rb') as f:
+        expected = f.read()
+    assert load_metadata(SERVICE_URL, NoNetwork(), METADATA_FILE, str(tmp_path)) == expected
+    # Served from the cache from now on, without network access
+    assert load_metadata(SERVICE_URL, NoNetwork(), None, str(tmp_path)) == expected
+
+
+def test_load_metadata_refresh(tmp_path):
+    MetadataCache(str(tmp_path)).put(SERVICE_URL, b'<edmx/>')
+    with pytest.raises(AssertionError):
+        load_metadata(SERVICE_URL, NoNetwork(), None, str(tmp_path), refresh=True)
+
+
+def test_with_new_session_shares_schema(context):
+    other = context.with_new_session()
+    assert other.client.schema is context.client.schema
+    assert other.client.connection is not context.client.connection
+    assert other.client.retain_null
+    assert other.include == context.include
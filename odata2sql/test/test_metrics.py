@@ -0,0 +1,61 @@
+import requests
+
+from odata2sql.concurrency import ConcurrencyController
+from odata2sql.metrics import Registry, expose_metrics, REGISTRY
+
+
+def test_exposition():
+    registry = Registry()
+    counter = registry.counter('rows_total', 'Rows', ['table'])
+    counter.inc(3, table='person')
+    counter.inc(table='person')
+    counter.inc(table='a "quoted"\nname')
+    gauge = registry.gauge('queue_depth', 'Queue depth')
+    gauge.set_function(lambda: 7)
+    histogram = registry.histogram('duration_seconds', 'Duration', [0.1, 1], ['table'])
+    histogram.observe(0.05, table='person')
+    histogram.observe(0.5, table='person')
+    histogram.observe(5, table='person')
+    assert registry.exposition().splitlines() == [
+        '# HELP rows_total Rows',
+        '# TYPE rows_total counter',
+        'rows_total{table="a \\"quoted\\"\\nname"} 1',
+        'rows_total{table="person"} 4',
+        '# HELP queue_depth Queue depth',
+        '# TYPE queue_depth gauge',
+        'queue_depth 7',
+        '# HELP duration_seconds Duration',
+        '# TYPE duration_seconds histogram',
+        'duration_seconds_bucket{table="person",le="0.1"} 1',
+        'duration_seconds_bucket{table="person",le="1"} 2',
+        'duration_seconds_bucket{table="person",le="+Inf"} 3',
+        'duration_seconds_sum{table="person"} 5.55',
+        'duration_seconds_count{table="person"} 3',
+    ]
+
+
+def test_unknown_values_are_left_out():
+    registry = Registry()
+    registry.gauge('queue_depth', 'Queue depth').set_function(lambda: None)
+    assert registry.exposition().splitlines() == ['# HELP queue_depth Queue depth', '# TYPE queue_depth gauge']
+
+
+def test_http_endpoint_and_file(tmp_path):
+    registry = Registry()
+    registry.counter('rows_total', 'Rows').inc(2)
+    filename = str(tmp_path / 'sync.prom')
+    with expose_metrics(0, filename, registry) as port:
+        response = requests.get(f'http://127.0.0.1:{port}/metrics')
+        assert response.status_code == 200
+        assert 'rows_total 2' in response.text
+        registry.counter('pages_total', 'Pages').inc()
+    # Rewritten once more when leaving
+    with open(filename) as f:
+        assert 'pages_total 1' in f.read()
+
+
+def test_controller_records_request_durations():
+    controller = ConcurrencyController(2)
+    with controller.request('MetricsTest'):
+        pass
+    assert 'curia_vista_odata_request_duration_seconds_count{entity_type="MetricsTest"} 1' in REGISTRY.exposition()
@@ -0,0 +1,70 @@
+import datetime
+
+import pytest
+
+from odata2sql.odata_json import decode_datetime, decode_datetime_offset, decode_int64, parse_page, RowDecoder, \
+    DECODERS, json_parser
+
+UTC = datetime.timezone.utc
+
+
+def test_decode_datetime():
+    assert decode_datetime(None) is None
+    assert decode_datetime('/Date(1516614510000)/') == datetime.datetime(2018, 1, 22, 9, 48, 30, tzinfo=UTC)
+    assert decode_datetime('/Date(-1000)/') == datetime.datetime(1969, 12, 31, 23, 59, 59, tzinfo=UTC)
+    with pytest.raises(ValueError):
+        decode_datetime('2018-01-22')
+
+
+def test_decode_datetime_offset():
+    value = decode_datetime_offset('/Date(1516614510000+0060)/')
+    assert value.utcoffset() == datetime.timedelta(hours=1)
+
+
+def test_decode_int64():
+    assert decode_int64('9007199254740993') == 9007199254740993
+    assert decode_int64('42L') == 42
+    assert decode_int64(None) is None
+
+
+def test_parse_page():
+    page = parse_page({'d': {'results': [{'ID': 1}], '__count': '17', '__next': 'https://example.com/next'}})
+    assert page.results == [{'ID': 1}]
+    assert page.total_count == 17
+    assert page.next_url == 'https://example.com/next'
+    page = parse_page({'d': [{'ID': 1}]})
+    assert page.results == [{'ID': 1}]
+    assert page.next_url is None
+
+
+def test_row_decoder(context):
+    person = context.get_entity_type_by_name('Person')
+    decoder = RowDecoder(person, ['ID', 'Language', 'DateOfBirth'])
+    assert decoder.rows([{'__metadata': {}, 'ID': 7, 'Language': 'DE', 'DateOfBirth': '/Date(0)/'},
+                         {'ID': 8, 'Language': 'FR', 'DateOfBirth': None}]) == [
+               (7, 'DE', datetime.datetime(1970, 1, 1, tzinfo=UTC)),
+               (8, 'FR', None)]
+
+
+def test_row_decoder_decodes_repeated_values_once(context, monkeypatch):
+    calls = []
+
+    def decode(value):
+        calls.append(value)
+        return decode_datetime(value)
+
+    monkeypatch.setitem(DECODERS, 'Edm.DateTime', decode)
+    person = context.get_entity_type_by_name('Person')
+    rows = RowDecoder(person, ['ID', 'DateOfBirth']).rows([{'ID': i, 'DateOfBirth': '/Date(0)/'} for i in range(3)])
+    assert [row[1] for row in rows] == [datetime.datetime(1970, 1, 1, tzinfo=UTC)] * 3
+    assert calls == ['/Date(0)/']
+
+
+def test_row_decoder_empty_page(context):
+    assert RowDecoder(context.get_entity_type_by_name('Person'), ['ID']).rows([]) == []
+
+
+def test_json_parser():
+    assert json_parser('json')(b'{"d": []}') == {'d': []}
+    with pytest.raises(ValueError):
+        json_parser('pickle')
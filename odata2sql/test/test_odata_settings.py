@@ -1,6 +1,8 @@
+import datetime
+
 import pytest
 
-from odata2sql.odata import SettingsBuilder
+from odata2sql.odata import SettingsBuilder, odata_filter_conjunction, odata_filter_modified_since
 from odata2sql.test.conftest import SERVICE_URL
 
 
@@ -51,3 +53,27 @@ def test_sync_by_fk(config, dependant, principal, comment):
 def test_selected_properties(config, entity_type_name, properties, comment):
     settings = SettingsBuilder(SERVICE_URL).sync_config(config).build()
     assert settings.odata_selected_properties(entity_type_name) == properties
+
+
+@pytest.mark.parametrize('filters, expected, comment', [
+    ((), None, 'Nothing to combine'),
+    ((None, ''), None, 'Only empty filters'),
+    (("Language eq 'DE'", None), "Language eq 'DE'", 'Single filter'),
+    (("Language eq 'DE'", 'ID eq 1'), "(Language eq 'DE') and (ID eq 1)", 'Two filters'),
+])
+def test_odata_filter_conjunction(filters, expected, comment):
+    assert odata_filter_conjunction(*filters) == expected, comment
+
+
+def test_odata_filter_modified_since():
+    assert odata_filter_modified_since(
+        datetime.datetime(2023, 5, 7, 14, 2, 3, 456000)) == "Modified gt datetime'2023-05-07T14:02:03.456'"
+    cest = datetime.timezone(datetime.timedelta(hours=2))
+    assert odata_filter_modified_since(
+        datetime.datetime(2023, 5, 7, 14, 2, 3, tzinfo=cest)) == "Modified gt datetime'2023-05-07T12:02:03.000'"
+
+
+def test_odata_max_connections():
+    settings = SettingsBuilder(SERVICE_URL).sync_config({'entities': {'Voting': {'max_connections': 4}}}).build()
+    assert settings.odata_max_connections('Voting') == 4
+    assert settings.odata_max_connections('Vote') is None
@@ -36,3 +36,59 @@ def test_faulty_odata_server_max_connections():
 def test_custom_session_id():
     assert SettingsBuilder(SERVICE_URL).session_id(
         UUID('48385914-1ca9-46ba-8839-92a8d6c380b9')).build().session_id == UUID('48385914-1ca9-46ba-8839-92a8d6c380b9')
+
+
+def test_default_db_loader():
+    assert SettingsBuilder(SERVICE_URL).build().db_loader == 'copy-text'
+
+
+def test_faulty_db_loader():
+    with pytest.raises(ValueError) as e:
+        SettingsBuilder(SERVICE_URL).db_loader('carrier-pigeon').build()
+    assert str(e.value) == 'Invalid database loader: carrier-pigeon'
+
+
+def test_faulty_db_writers():
+    with pytest.raises(ValueError) as e:
+        SettingsBuilder(SERVICE_URL).db_writers(0).build()
+    assert str(e.value) == 'Invalid database writer count: 0'
+    with pytest.raises(ValueError) as e:
+        SettingsBuilder(SERVICE_URL).db_writers(2, 0).build()
+    assert str(e.value) == 'Invalid database writer queue depth: 0'
+
+
+def test_faulty_odata_decoder():
+    with pytest.raises(ValueError) as e:
+        SettingsBuilder(SERVICE_URL).odata_decoder('xml').build()
+    assert str(e.value) == 'Invalid OData decoder: xml'
+    with pytest.raises(ValueError) as e:
+        SettingsBuilder(SERVICE_URL).odata_decoder('json', 'yaml').build()
+    assert str(e.value) == 'Invalid JSON parser: yaml'
+
+
+def test_faulty_max_in_flight():
+    with pytest.raises(ValueError) as e:
+        SettingsBuilder(SERVICE_URL).max_in_flight(0, None).build()
+    assert str(e.value) == 'Invalid maximal number of rows in flight: 0'
+    settings = SettingsBuilder(SERVICE_URL).max_in_flight(None, None).build()
+    assert settings.max_in_flight_rows is None and settings.max_in_flight_bytes is None
+
+
+def test_faulty_odata_timeouts():
+    with pytest.raises(ValueError) as e:
+        SettingsBuilder(SERVICE_URL).odata_timeouts(10.0, 0).build()
+    assert str(e.value) == 'Invalid timeout: 0'
+    with pytest.raises(ValueError) as e:
+        SettingsBuilder(SERVICE_URL).hedge_percentile(100).build()
+    assert str(e.value) == 'Invalid hedge percentile: 100'
+    assert SettingsBuilder(SERVICE_URL).hedge_percentile(None).build().hedge_percentile is None
+
+
+def test_defer_indexes():
+    settings = SettingsBuilder(SERVICE_URL).build()
+    assert not settings.defer_indexes and settings.maintenance_work_mem is None
+    settings = SettingsBuilder(SERVICE_URL).defer_indexes(True, '2GB').build()
+    assert settings.defer_indexes and settings.maintenance_work_mem == '2GB'
+    with pytest.raises(ValueError) as e:
+        SettingsBuilder(SERVICE_URL).defer_indexes(True, "1GB'; DROP SCHEMA odata").build()
+    assert str(e.value) == "Invalid maintenance_work_mem: 1GB'; DROP SCHEMA odata"
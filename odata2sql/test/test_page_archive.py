@@ -0,0 +1,51 @@
+import json
+import os
+import uuid
+
+from odata2sql.page_archive import PageArchive, read_pages, latest_session, archived_entity_types, session_directory
+
+SESSION_ID = uuid.UUID('48385914-1ca9-46ba-8839-92a8d6c380b9')
+
+
+def test_round_trip(tmp_path):
+    archive = PageArchive(str(tmp_path), SESSION_ID)
+    archive.append('Person', b'{"d": {"results": [\n  {"ID": 1, "Name": "line\\nbreak"}\n]}}')
+    archive.append('Person', b'{"d": {"results": []}}')
+    archive.append('PersonAddress', b'{"d": []}')
+    archive.close()
+    pages = [json.loads(p) for p in read_pages(str(tmp_path), SESSION_ID, 'Person')]
+    assert pages == [{'d': {'results': [{'ID': 1, 'Name': 'line\nbreak'}]}}, {'d': {'results': []}}]
+    assert archived_entity_types(str(tmp_path), SESSION_ID) == ['Person', 'PersonAddress']
+    assert archive.pages == 3
+    assert list(read_pages(str(tmp_path), SESSION_ID, 'Unknown')) == []
+
+
+def test_resumed_session_appends(tmp_path):
+    for i in range(2):
+        archive = PageArchive(str(tmp_path), SESSION_ID)
+        archive.append('Person', f'{{"page": {i}}}'.encode())
+        archive.close()
+    assert [json.loads(p) for p in read_pages(str(tmp_path), SESSION_ID, 'Person')] == [{'page': 0}, {'page': 1}]
+
+
+def test_truncated_archive(tmp_path):
+    archive = PageArchive(str(tmp_path), SESSION_ID)
+    for i in range(100):
+        archive.append('Person', f'{{"page": {i}}}'.encode())
+    archive.close()
+    path = session_directory(str(tmp_path), SESSION_ID) / 'Person.jsonl.gz'
+    content = path.read_bytes()
+    path.write_bytes(content[:len(content) - 10])
+    pages = [json.loads(p) for p in read_pages(str(tmp_path), SESSION_ID, 'Person')]
+    assert pages == [{'page': i} for i in range(len(pages))]
+    assert len(pages) < 100
+
+
+def test_latest_session(tmp_path):
+    assert latest_session(str(tmp_path)) is None
+    older = uuid.uuid4()
+    for i, session_id in enumerate((older, SESSION_ID)):
+        session_directory(str(tmp_path), session_id).mkdir()
+        os.utime(session_directory(str(tmp_path), session_id), (i, i))
+    (tmp_path / 'not-a-session').mkdir()
+    assert latest_session(str(tmp_path)) == SESSION_ID
@@ -0,0 +1,61 @@
+import datetime
+import struct
+
+import pytest
+
+from odata2sql.pg_copy import encode_text, encode_binary, encode_text_columns, encode_binary_columns
+from odata2sql.row_batch import RowBatch
+
+UTC = datetime.timezone.utc
+
+
+def test_encode_text():
+    rows = [
+        [1, 'DE', 'Tab\there', True, datetime.datetime(2021, 7, 3, 12, 30, tzinfo=UTC)],
+        [2, 'FR', 'Back\\slash\nnewline', False, None],
+    ]
+    types = ['Edm.Int32', 'Edm.String', 'Edm.String', 'Edm.Boolean', 'Edm.DateTime']
+    assert encode_text(rows, types) == (b'1\tDE\tTab\\there\tt\t2021-07-03 12:30:00\n'
+                                        b'2\tFR\tBack\\\\slash\\nnewline\tf\t\\N\n')
+
+
+def test_encode_text_converts_to_utc():
+    cet = datetime.timezone(datetime.timedelta(hours=1))
+    assert encode_text([[datetime.datetime(2021, 1, 1, 1, 0, tzinfo=cet)]],
+                       ['Edm.DateTimeOffset']) == b'2021-01-01 00:00:00\n'
+
+
+def test_encode_binary():
+    rows = [[7, 'RM', None, datetime.datetime(2000, 1, 1, 0, 0, 1, tzinfo=UTC),
+             '48385914-1ca9-46ba-8839-92a8d6c380b9']]
+    types = ['Edm.Int16', 'Edm.String', 'Edm.Boolean', 'Edm.DateTime', 'Edm.Guid']
+    data = encode_binary(rows, types)
+    assert data.startswith(b'PGCOPY\n\377\r\n\0' + b'\0' * 8)
+    assert data.endswith(b'\xff\xff')
+    assert data[19:-2] == (struct.pack('!h', 5) +
+                           struct.pack('!ih', 2, 7) +
+                           struct.pack('!i', 2) + b'RM' +
+                           struct.pack('!i', -1) +
+                           struct.pack('!iq', 8, 1000000) +
+                           struct.pack('!i', 16) + bytes.fromhex('483859141ca946ba883992a8d6c380b9'))
+
+
+def test_encode_binary_unknown_type():
+    with pytest.raises(ValueError):
+        encode_binary([[1.5]], ['Edm.Double'])
+
+
+@pytest.mark.parametrize('encode_rows, encode_columns', [(encode_text, encode_text_columns),
+                                                         (encode_binary, encode_binary_columns)])
+def test_encode_columns_of_batch(encode_rows, encode_columns):
+    rows = [(1, 'DE', True, datetime.datetime(2021, 7, 3, 12, 30, tzinfo=UTC)),
+            (2, None, False, None)]
+    types = ['Edm.Int32', 'Edm.String', 'Edm.Boolean', 'Edm.DateTime']
+    batch = RowBatch.from_rows(rows, types)
+    assert encode_columns([batch.column(i) for i in range(len(types))], types) == encode_rows(rows, types)
+    assert encode_columns([[] for _ in types], types) == encode_rows([], types)
+
+
+def test_encode_binary_column():
+    assert encode_text([[b'\x00\xff']], ['Edm.Binary']) == b'\\\\x00ff\n'
+    assert encode_binary([[b'\x00\xff']], ['Edm.Binary'])[19:-2] == struct.pack('!hi', 1, 2) + b'\x00\xff'
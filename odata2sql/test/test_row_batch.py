@@ -0,0 +1,69 @@
+import datetime
+import pickle
+import uuid
+
+from odata2sql.flow_control import estimate_payload_bytes
+from odata2sql.row_batch import RowBatch, last_per_key, column_values
+
+UTC = datetime.timezone.utc
+TYPES = ['Edm.Int32', 'Edm.String', 'Edm.Boolean', 'Edm.DateTime', 'Edm.Int64', 'Edm.Guid']
+ROWS = [
+    (1, 'DE', True, datetime.datetime(2021, 7, 3, 12, 30, 0, 123000, tzinfo=UTC), 2 ** 40, uuid.UUID(int=1)),
+    (2, None, False, None, None, None),
+    (None, 'Grüezi', None, datetime.datetime(1848, 9, 12, tzinfo=UTC), -1, uuid.UUID(int=2)),
+]
+
+
+def test_round_trip():
+    batch = RowBatch.from_rows(ROWS, TYPES)
+    assert len(batch) == 3
+    assert list(batch) == ROWS
+    assert batch[1] == ROWS[1]
+    assert batch[-1] == ROWS[-1]
+    assert batch == ROWS
+    assert batch.column(1) == ['DE', None, 'Grüezi']
+    assert type(batch.column(2)[0]) is bool
+
+
+def test_slices_and_take():
+    batch = RowBatch.from_rows(ROWS, TYPES)
+    assert list(batch[1:]) == ROWS[1:]
+    assert list(batch.take([2, 0])) == [ROWS[2], ROWS[0]]
+    assert list(batch[:0]) == []
+
+
+def test_values_not_matching_their_type_are_kept():
+    rows = [(2 ** 40, 'Text', datetime.datetime(2021, 1, 1))]
+    batch = RowBatch.from_rows(rows, ['Edm.Int32', 'Edm.Int16', 'Edm.DateTime'])
+    assert list(batch) == rows
+
+
+def test_empty():
+    batch = RowBatch.from_rows([], TYPES)
+    assert len(batch) == 0
+    assert list(batch) == []
+    assert batch.column(0) == []
+
+
+def test_compact_when_pickled():
+    rows = [(i, f'Name {i}', i % 2 == 0, datetime.datetime(2021, 1, 1, tzinfo=UTC)) for i in range(1000)]
+    types = TYPES[:4]
+    batch = RowBatch.from_rows(rows, types)
+    pickled = pickle.dumps(batch)
+    assert len(pickled) < 0.75 * len(pickle.dumps(rows))
+    assert pickle.loads(pickled) == rows
+    assert 0 < batch.nbytes < estimate_payload_bytes(rows) / 4
+
+
+def test_last_per_key():
+    rows = [(1, 'DE', 'a'), (1, 'FR', 'b'), (1, 'DE', 'c')]
+    types = ['Edm.Int32', 'Edm.String', 'Edm.String']
+    batch = RowBatch.from_rows(rows, types)
+    assert list(last_per_key(batch, [0, 1])) == [(1, 'FR', 'b'), (1, 'DE', 'c')]
+    assert last_per_key(rows, [0, 1]) == [(1, 'FR', 'b'), (1, 'DE', 'c')]
+    assert last_per_key(batch, [0, 2]) is batch
+
+
+def test_column_values():
+    assert column_values(RowBatch.from_rows(ROWS, TYPES), 0) == [1, 2, None]
+    assert column_values(ROWS, 0) == [1, 2, None]
@@ -0,0 +1,31 @@
+import datetime
+
+from odata2sql.row_batch import RowBatch
+from odata2sql.row_hash import row_hashes, with_row_hashes
+
+UTC = datetime.timezone.utc
+TYPES = ['Edm.Int32', 'Edm.String', 'Edm.DateTime']
+
+
+def test_row_hashes_differ_by_content():
+    rows = [(1, 'DE', None), (1, 'DE', datetime.datetime(2021, 7, 3, tzinfo=UTC)), (1, 'FR', None), (1, 'DE', None)]
+    hashes = row_hashes(rows, TYPES)
+    assert all(len(h) == 16 for h in hashes)
+    assert hashes[0] == hashes[3]
+    assert len(set(hashes)) == 3
+
+
+def test_row_hashes_independent_of_representation():
+    cet = datetime.timezone(datetime.timedelta(hours=1))
+    rows = [(1, 'DE', datetime.datetime(2021, 7, 3, 12, tzinfo=UTC)), (2, None, None)]
+    assert row_hashes(RowBatch.from_rows(rows, TYPES), TYPES) == row_hashes(rows, TYPES)
+    assert row_hashes([(1, 'DE', datetime.datetime(2021, 7, 3, 13, tzinfo=cet))], TYPES) == row_hashes(rows[:1], TYPES)
+
+
+def test_with_row_hashes():
+    rows = [(1, 'DE', None), (2, 'FR', None)]
+    batch = with_row_hashes(RowBatch.from_rows(rows, TYPES), TYPES)
+    assert isinstance(batch, RowBatch)
+    assert batch == with_row_hashes(rows, TYPES)
+    assert [row[:3] for row in batch] == rows
+    assert [row[3] for row in batch] == row_hashes(rows, TYPES)
@@ -1,4 +1,6 @@
+from odata2sql.odata import Context, SettingsBuilder
 from odata2sql.schema_generator import LeanAndMean
+from odata2sql.test.conftest import SERVICE_URL
 
 
 def test_schema_generator_serious(context):
@@ -8,6 +10,7 @@ def test_schema_generator_serious(context):
   "language" char(2) NOT NULL,
   last_name varchar(60),
   date_of_birth timestamp,
+  row_hash bytea,
   PRIMARY KEY ("id", "language")
 );
 
@@ -16,5 +19,37 @@ CREATE TABLE odata.person_address (
   "id" uuid NOT NULL,
   "language" char(2) NOT NULL,
   city text,
+  row_hash bytea,
   PRIMARY KEY ("id", "language")
 );"""
+
+
+def test_schema_generator_partitioning(client):
+    context = Context(client, SettingsBuilder(SERVICE_URL).sync_config({'entities': {
+        'Person': {'partition': {'by': 'list', 'property': 'Language', 'values': ['DE', 'FR']}},
+        'PersonAddress': {'partition': {'by': 'range', 'property': 'Language', 'values': ['E', 'G']}},
+    }}).build())
+    ddl = LeanAndMean(context).odata_to_ddl()
+    assert ddl == """CREATE TABLE odata.person (
+  "id" integer NOT NULL,
+  "language" char(2) NOT NULL,
+  last_name varchar(60),
+  date_of_birth timestamp,
+  row_hash bytea,
+  PRIMARY KEY ("id", "language")
+) PARTITION BY LIST ("language");
+CREATE TABLE odata.person_de PARTITION OF odata.person FOR VALUES IN ('DE');
+CREATE TABLE odata.person_fr PARTITION OF odata.person FOR VALUES IN ('FR');
+CREATE TABLE odata.person_default PARTITION OF odata.person DEFAULT;
+
+CREATE TABLE odata.person_address (
+  person_number integer,
+  "id" uuid NOT NULL,
+  "language" char(2) NOT NULL,
+  city text,
+  row_hash bytea,
+  PRIMARY KEY ("id", "language")
+) PARTITION BY RANGE ("language");
+CREATE TABLE odata.person_address_before_e PARTITION OF odata.person_address FOR VALUES FROM (MINVALUE) TO ('E');
+CREATE TABLE odata.person_address_from_e PARTITION OF odata.person_address FOR VALUES FROM ('E') TO ('G');
+CREATE TABLE odata.person_address_from_g PARTITION OF odata.person_address FOR VALUES FROM ('G') TO (MAXVALUE);"""
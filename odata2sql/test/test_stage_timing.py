@@ -0,0 +1,27 @@
+from odata2sql.stage_timing import StageTimings, percentile
+
+
+def test_percentile():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([3.0], 90) == 3
+    assert percentile([], 50) is None
+
+
+def test_summary():
+    timings = StageTimings()
+    for i in range(10):
+        timings.record('Person', 100, {'fetch': 0.1 * (i + 1), 'queue': 0.01, 'persist': 0.05})
+    timings.record('PersonAddress', 50, {'fetch': 0.2, 'queue': 0.0, 'persist': 0.05})
+    summaries = {s.stage: s for s in timings.summary()}
+    # Stages no page went through are left out
+    assert list(summaries) == ['fetch', 'queue', 'persist']
+    fetch = summaries['fetch']
+    assert (fetch.pages, fetch.rows) == (11, 1050)
+    assert fetch.max == 1.0
+    assert round(fetch.p50, 1) == 0.5
+    assert round(summaries['persist'].rows_per_second) == round(1050 / 0.55)
+    assert timings.rows_by_entity_type == {'Person': 1000, 'PersonAddress': 50}
+    assert timings.pages_by_entity_type == {'Person': 10, 'PersonAddress': 1}
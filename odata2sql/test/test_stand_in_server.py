@@ -0,0 +1,119 @@
+import pyodata
+import pytest
+import requests
+
+from odata2sql.command_sync import JsonPageFetcher, WorkItemFetchByEntityType
+from odata2sql.concurrency import ConcurrencyController
+from odata2sql.odata import Context, SettingsBuilder
+from odata2sql.stand_in_server import StandInServer, Faults, parse_schema, generate_entities, parse_filter, LANGUAGES
+from odata2sql.test.conftest import fixture_directory
+
+
+@pytest.fixture
+def metadata() -> bytes:
+    with open(fixture_directory + '/metadata.xml', 'rb') as metadata_file:
+        return metadata_file.read()
+
+
+def serve(metadata: bytes, count: int = 100, page_size: int = 30, faults: Faults = Faults()) -> StandInServer:
+    schema = parse_schema(metadata)
+    entities = {es.name: generate_entities(schema, es.entity_type, lambda name: count) for es in schema.entity_sets}
+    server = StandInServer(('127.0.0.1', 0), metadata, entities, page_size, faults)
+    server.serve_in_background()
+    return server
+
+
+@pytest.fixture
+def server(metadata):
+    server = serve(metadata)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stand_in_context(server) -> Context:
+    settings = SettingsBuilder(server.url).build()
+    return Context(pyodata.Client(server.url, requests.Session()), settings)
+
+
+def test_generated_foreign_keys_refer_to_principals(metadata):
+    schema = parse_schema(metadata)
+    persons = generate_entities(schema, schema.entity_type('Person'), lambda name: 100)
+    addresses = generate_entities(schema, schema.entity_type('PersonAddress'), lambda name: 100)
+    person_keys = {(p['ID'], p['Language']) for p in persons}
+    assert len(person_keys) == 100
+    assert {p['Language'] for p in persons} == set(LANGUAGES)
+    assert all((a['PersonNumber'], a['Language']) in person_keys for a in addresses if a['PersonNumber'] is not None)
+
+
+def test_filter(metadata):
+    person = parse_schema(metadata).entity_type('Person')
+    entity = {'ID': 7, 'Language': 'DE', 'LastName': "O'Neill", 'DateOfBirth': '/Date(0)/'}
+
+    def matches(expression):
+        return parse_filter(person, expression)(entity)
+
+    assert matches("Language eq 'DE' and (ID eq 1 or ID eq 7)")
+    assert not matches("Language eq 'FR' or ID gt 7")
+    assert matches("LastName eq 'O''Neill' and not (ID lt 7)")
+    assert matches("DateOfBirth lt datetime'1970-01-01T00:00:00.001' and ID le 7L")
+    assert not matches("DateOfBirth eq null")
+
+
+def test_invalid_filter(server):
+    response = requests.get(f'{server.url}/Person?$filter=Unknown eq 1')
+    assert response.status_code == 400
+    assert 'Unknown property' in response.json()['error']['message']['value']
+
+
+@pytest.mark.parametrize('option', ['$skip', '$top'])
+@pytest.mark.parametrize('value', ['ten', '-1', '1.5', ''])
+def test_invalid_skip_and_top(server, option, value):
+    response = requests.get(f'{server.url}/Person?{option}={value}')
+    assert response.status_code == 400
+    assert response.json()['error']['message']['value'] == f'Invalid value of {option}: {value}'
+
+
+def test_skip_and_top(server):
+    response = requests.get(f'{server.url}/Person?$orderby=ID&$skip=95&$top=10')
+    assert len(response.json()['d']['results']) == 5
+
+
+def test_paging(stand_in_context):
+    person = stand_in_context.get_entity_type_by_name('Person')
+    fetcher = JsonPageFetcher(stand_in_context, ConcurrencyController(1))
+    work_item = WorkItemFetchByEntityType(person, stand_in_context, "Language eq 'DE'")
+    pages = list(work_item.run(stand_in_context, fetcher, ['ID', 'Language']))
+    # 20 entities in German, 30 entities per page
+    assert [len(p.rows) for p in pages] == [20]
+    work_item = WorkItemFetchByEntityType(person, stand_in_context)
+    pages = list(work_item.run(stand_in_context, fetcher, ['ID', 'Language', 'DateOfBirth']))
+    assert [len(p.rows) for p in pages] == [30, 30, 30, 10]
+    assert len({row[:2] for p in pages for row in p.rows}) == 100
+    assert pages[0].total_count == 100
+
+
+def test_count_and_order(stand_in_context, server):
+    person = stand_in_context.get_entity_type_by_name('Person')
+    assert stand_in_context.get_entity_type_total_count(person, 'ID le 2') == 10
+    url = stand_in_context.entity_set_url(person, None, ['ID'], order_by='ID desc', top=1)
+    assert requests.get(url).json()['d']['results'][0]['ID'] == 20
+
+
+def test_injected_faults(metadata):
+    server = serve(metadata, faults=Faults(error_rate=1.0))
+    try:
+        assert requests.get(f'{server.url}/Person').status_code == 503
+        # The metadata stays available
+        assert requests.get(f'{server.url}/$metadata').status_code == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+    server = serve(metadata, faults=Faults(disconnect_rate=1.0))
+    try:
+        with pytest.raises(requests.exceptions.ConnectionError):
+            requests.get(f'{server.url}/Person')
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,55 @@
+import multiprocessing
+
+import pytest
+
+from odata2sql.command_sync import Shutdown, WorkItemFetchByEntityType, WorkItemDbPersisting
+from odata2sql.flow_control import SharedInFlightBudget
+from odata2sql.odata import Context, SettingsBuilder
+from odata2sql.sql import to_pg_name
+from odata2sql.sync_multiprocessing import distribute, run_worker_process
+from odata2sql.test.test_stand_in_server import serve, metadata
+
+
+def test_distribute():
+    assert distribute(8, 3) == [3, 3, 2]
+    assert distribute(2, 2) == [1, 1]
+    assert sum(distribute(16, 5)) == 16
+
+
+def test_settings_reject_invalid_process_count():
+    with pytest.raises(ValueError, match='Invalid process count'):
+        SettingsBuilder('https://example.org/odata.svc').sync_processes(0).build()
+
+
+def test_settings_reject_archiving_pages_in_worker_processes():
+    with pytest.raises(ValueError, match='not supported by the multiprocessing engine'):
+        SettingsBuilder('https://example.org/odata.svc').sync_engine('multiprocessing').page_archive('/tmp').build()
+
+
+def test_worker_process_fetches_rows(metadata):
+    server = serve(metadata, count=100, page_size=30)
+    try:
+        settings = SettingsBuilder(server.url).build()
+        context = Context.from_settings(settings, metadata)
+        mp_context = multiprocessing.get_context('spawn')
+        input_, output, log_queue = mp_context.Queue(), mp_context.Queue(), mp_context.Queue()
+        input_.put(WorkItemFetchByEntityType(context.get_entity_type_by_name('Person'), context))
+        input_.put(Shutdown())
+        input_.put(Shutdown())
+        budget = SharedInFlightBudget(mp_context)
+        process = mp_context.Process(target=run_worker_process,
+                                     args=(settings, metadata, input_, output, budget, 2, log_queue, 30))
+        process.start()
+        pages = []
+        while type(item := output.get(timeout=30)) is WorkItemDbPersisting:
+            pages.append(item)
+        process.join(30)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert type(item) is WorkItemFetchByEntityType
+    assert item.done_count == 100
+    assert [p.total for p in pages] == [30, 30, 30, 10]
+    assert pages[0].columns == [to_pg_name(n) for n in ('ID', 'Language', 'LastName', 'DateOfBirth')]
+    assert process.exitcode == 0
+    assert budget.rows == 100
@@ -0,0 +1,60 @@
+import datetime
+from types import SimpleNamespace
+
+from odata2sql.odata import Context, SettingsBuilder
+from odata2sql.row_batch import RowBatch
+from odata2sql.test.conftest import SERVICE_URL
+from odata2sql.watermark import track_modified, next_watermark, store_watermark, load_watermarks, WATERMARK_OVERLAP
+
+UTC = datetime.timezone.utc
+
+
+def persisting(rows, columns=('"id"', 'modified')):
+    return SimpleNamespace(entity_type_name='Vote', columns=list(columns), rows=rows)
+
+
+def test_track_modified():
+    max_modified = {}
+    track_modified(max_modified, persisting([(1, None)]))
+    assert max_modified == {}
+    track_modified(max_modified, persisting([(1, datetime.datetime(2021, 3, 1, tzinfo=UTC)),
+                                             (2, datetime.datetime(2021, 5, 1, tzinfo=UTC)), (3, None)]))
+    assert max_modified == {'Vote': datetime.datetime(2021, 5, 1, tzinfo=UTC)}
+    # Earlier modifications do not lower it
+    rows = RowBatch.from_rows([(4, datetime.datetime(2021, 4, 1, tzinfo=UTC))], ['Edm.Int32', 'Edm.DateTime'])
+    track_modified(max_modified, persisting(rows))
+    assert max_modified == {'Vote': datetime.datetime(2021, 5, 1, tzinfo=UTC)}
+    # Entity types lacking the property are not tracked
+    track_modified(max_modified, persisting([(5, 'DE')], ('"id"', '"language"')))
+    assert max_modified == {'Vote': datetime.datetime(2021, 5, 1, tzinfo=UTC)}
+
+
+def test_next_watermark():
+    started_at = datetime.datetime(2021, 6, 1, 12, tzinfo=UTC)
+    # Nothing modified while fetching
+    assert next_watermark(datetime.datetime(2021, 5, 1, tzinfo=UTC), started_at) == \
+           datetime.datetime(2021, 5, 1, tzinfo=UTC) - WATERMARK_OVERLAP
+    assert next_watermark(datetime.datetime(2021, 5, 1), started_at) == \
+           datetime.datetime(2021, 5, 1, tzinfo=UTC) - WATERMARK_OVERLAP
+    # Entities on pages fetched before got modified meanwhile, unnoticed
+    assert next_watermark(datetime.datetime(2021, 6, 1, 15, tzinfo=UTC), started_at) == started_at - WATERMARK_OVERLAP
+
+
+def test_store_and_load_watermarks(client, private_db):
+    context = Context(client, SettingsBuilder(SERVICE_URL).build())
+    german = Context(client, SettingsBuilder(SERVICE_URL).sync_config({'filter': "Language eq 'DE'"}).build())
+    person = context.get_entity_type_by_name('Person')
+    assert load_watermarks(private_db, context) == {}
+
+    store_watermark(private_db, context, person, datetime.datetime(2021, 5, 1, 14, tzinfo=UTC))
+    cet = datetime.timezone(datetime.timedelta(hours=1))
+    store_watermark(private_db, german, person, datetime.datetime(2021, 3, 1, 13, tzinfo=cet))
+    # Stored per $filter, in UTC
+    assert load_watermarks(private_db, context) == {'Person': datetime.datetime(2021, 5, 1, 14)}
+    assert load_watermarks(private_db, german) == {'Person': datetime.datetime(2021, 3, 1, 12)}
+
+    # Never moves backwards
+    store_watermark(private_db, context, person, datetime.datetime(2021, 4, 1, tzinfo=UTC))
+    assert load_watermarks(private_db, context) == {'Person': datetime.datetime(2021, 5, 1, 14)}
+    store_watermark(private_db, context, person, datetime.datetime(2021, 6, 1, tzinfo=UTC))
+    assert load_watermarks(private_db, context) == {'Person': datetime.datetime(2021, 6, 1)}
@@ -0,0 +1,75 @@
+import datetime
+import logging
+from typing import Dict
+
+from pyodata.v2.model import EntityType
+
+from odata2sql.odata import Context
+from odata2sql.row_batch import column_values
+from odata2sql.sql import to_pg_name
+
+log = logging.getLogger(__name__)
+
+# Property holding the point in time of the last modification, provided by most Curia Vista entity types
+MODIFIED_PROPERTY_NAME = 'Modified'
+# Entities modified up to this long before a watermark get fetched again by the next update (and skipped by the
+# loader if unchanged), covering modifications committed late and clocks of the server and ours being slightly off
+WATERMARK_OVERLAP = datetime.timedelta(minutes=5)
+
+
+def has_modified_property(context: Context, entity_type: EntityType) -> bool:
+    """Whether @entity_type's entities get fetched including their modification time"""
+    return MODIFIED_PROPERTY_NAME in context.odata_selected_properties(entity_type)
+
+
+def load_watermarks(db_connection, context: Context) -> Dict[str, datetime.datetime]:
+    """High-water marks of all included entity types which have been synced before using the same filter"""
+    watermarks = {}
+    with db_connection.cursor() as cur:
+        for entity_type in context.include:
+            cur.execute('SELECT modified FROM private.sync_watermark WHERE entity_type = %s AND odata_filter = %s',
+                        (entity_type.name, context.odata_filter_for_entity_type(entity_type) or ''))
+            if row := cur.fetchone():
+                watermarks[entity_type.name] = row[0]
+    return watermarks
+
+
+def store_watermark(db_connection, context: Context, entity_type: EntityType, modified: datetime.datetime):
+    """Remember @modified as high-water mark of @entity_type, unless a more recent one is known already"""
+    if modified.tzinfo is not None:
+        modified = modified.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    log.info(f'Storing watermark {modified.isoformat()} for entity type "{entity_type.name}"')
+    with db_connection.cursor() as cur:
+        cur.execute('INSERT INTO private.sync_watermark (entity_type, odata_filter, modified, session_id)'
+                    ' VALUES (%s, %s, %s, %s)'
+                    ' ON CONFLICT (entity_type, odata_filter) DO UPDATE'
+                    ' SET modified = GREATEST(sync_watermark.modified, EXCLUDED.modified),'
+                    ' session_id = EXCLUDED.session_id, updated_at = NOW()',
+                    (entity_type.name, context.odata_filter_for_entity_type(entity_type) or '', modified,
+                     context.session_id))
+    db_connection.commit()
+
+
+def next_watermark(max_modified: datetime.datetime, started_at: datetime.datetime) -> datetime.datetime:
+    """Watermark to store once all entities of an entity type got fetched, @max_modified being the most recent
+    modification seen and @started_at (UTC) the point in time fetching started.
+
+    Entities on pages fetched early may get modified again while later pages are fetched, so @max_modified alone is
+    not a safe watermark. Nothing modified after @started_at has been missed, though. Naive datetimes are UTC.
+    """
+    if max_modified.tzinfo is None:
+        max_modified = max_modified.replace(tzinfo=datetime.timezone.utc)
+    return min(max_modified, started_at) - WATERMARK_OVERLAP
+
+
+def track_modified(max_modified: Dict[str, datetime.datetime], work_item):
+    """Update @max_modified with the most recent modification within the rows of @work_item (a WorkItemDbPersisting)"""
+    try:
+        index = work_item.columns.index(to_pg_name(MODIFIED_PROPERTY_NAME))
+    except ValueError:
+        return
+    if not (values := [v for v in column_values(work_item.rows, index) if v is not None]):
+        return
+    if current := max_modified.get(work_item.entity_type_name):
+        values.append(current)
+    max_modified[work_item.entity_type_name] = max(values)
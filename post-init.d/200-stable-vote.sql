@@ -1,32 +1,126 @@
+-- stable.vote used to be a view aggregating all of odata.voting on every query. Its content is stored by now, refreshed
+-- after each sync for the votes touched by it (see ../post-sync.d), and rebuilt from scratch by init.
+DO $$
+BEGIN
+    IF EXISTS (SELECT FROM pg_views WHERE schemaname = 'stable' AND viewname = 'vote') THEN
+        DROP VIEW stable.vote CASCADE;
+    END IF;
+END; $$;
 DROP VIEW IF EXISTS private.vote_helper CASCADE;
-CREATE OR REPLACE VIEW private.vote_helper AS
-SELECT vote.id,
-    voting.language,
-    COUNT(voting.decision) AS decision_count,
-    voting.decision,
-    vote.subject
-FROM odata.vote
-    INNER JOIN odata.voting ON voting.id_vote = vote.id AND voting.language = vote.language
-GROUP BY vote.id, voting.language, voting.decision, vote.subject;
-COMMENT ON VIEW private.vote_helper IS 'Helper for stable.vote: Count casted voting types (yes, no, abstain, etc.) per vote.';
+DROP TABLE IF EXISTS private.vote_touched, private.vote_decision, stable.vote CASCADE;
+
+CREATE TABLE private.vote_touched (
+    id integer NOT NULL,
+    language char(2) NOT NULL,
+    PRIMARY KEY (id, language)
+);
+COMMENT ON TABLE private.vote_touched IS 'Votes inserted or updated (including their votings) since stable.vote got refreshed the last time.';
+
+CREATE TABLE private.vote_decision (
+    id integer NOT NULL,
+    language char(2) NOT NULL,
+    decision integer,
+    decision_count bigint NOT NULL
+);
+CREATE INDEX vote_decision_idx_id_language ON private.vote_decision (id, language);
+COMMENT ON TABLE private.vote_decision IS 'Helper for stable.vote: Count casted voting types (yes, no, abstain, etc.) per vote.';
+
+CREATE TABLE stable.vote (
+    id integer NOT NULL,
+    language char(2) NOT NULL,
+    decision integer,
+    category text,
+    PRIMARY KEY (id, language)
+);
+COMMENT ON TABLE stable.vote IS 'Decisions (yes, no, etc.) made during a vote; Best guess at the vote kind (either final, plenary, entry or NULL if indeterminate).';
+
+CREATE OR REPLACE FUNCTION private.vote_category(subject text) RETURNS text
+    LANGUAGE sql IMMUTABLE AS $$
+SELECT CASE
+    WHEN lower(subject) SIMILAR TO 'schlussabstimmung|vote final|votazione finale%' THEN 'final'
+    WHEN lower(subject) SIMILAR TO 'gesamtabstimmung|vote sur l''ensemble|votazione sul complesso' THEN 'plenary'
+    WHEN lower(subject) SIMILAR TO 'eintrett*en|entra(re|ta) in materia|entr(ée|er) en matière' THEN 'entry'
+    ELSE NULL
+END
+$$;
+
+-- Refreshing the votings of a few votes relies on voting_idx_id_vote_language (see odata2sql/index_advisor.py)
+
+-- Statement level, so a page of upserted entities costs a single insert. Rows skipped by the loader due to an unchanged
+-- row hash are not part of the transition table.
+CREATE OR REPLACE FUNCTION private.vote_touched_by_vote() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO private.vote_touched (id, language)
+    SELECT DISTINCT id, language FROM touched
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END; $$;
+
+CREATE OR REPLACE FUNCTION private.vote_touched_by_voting() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO private.vote_touched (id, language)
+    SELECT DISTINCT id_vote, language FROM touched
+    ON CONFLICT DO NOTHING;
+    RETURN NULL;
+END; $$;
+
+-- Transition tables are limited to triggers of a single event
+CREATE TRIGGER vote_touched_on_insert AFTER INSERT ON odata.vote
+    REFERENCING NEW TABLE AS touched FOR EACH STATEMENT EXECUTE FUNCTION private.vote_touched_by_vote();
+CREATE TRIGGER vote_touched_on_update AFTER UPDATE ON odata.vote
+    REFERENCING NEW TABLE AS touched FOR EACH STATEMENT EXECUTE FUNCTION private.vote_touched_by_vote();
+CREATE TRIGGER vote_touched_on_insert AFTER INSERT ON odata.voting
+    REFERENCING NEW TABLE AS touched FOR EACH STATEMENT EXECUTE FUNCTION private.vote_touched_by_voting();
+CREATE TRIGGER vote_touched_on_update AFTER UPDATE ON odata.voting
+    REFERENCING NEW TABLE AS touched FOR EACH STATEMENT EXECUTE FUNCTION private.vote_touched_by_voting();
 
 -- TODO: decision will behave unexpected if neither yes nor no has the highest count. Has this ever happened? What would
 --       the official outcome be then?
-DROP VIEW IF EXISTS stable.vote CASCADE;
-CREATE OR REPLACE VIEW stable.vote AS
-SELECT DISTINCT ON (id, language)
-    id,
-    language,
-    decision,
-    CASE
-        WHEN lower(subject) SIMILAR TO 'schlussabstimmung|vote final|votazione finale%' THEN 'final'
-        WHEN lower(subject) SIMILAR TO 'gesamtabstimmung|vote sur l''ensemble|votazione sul complesso' THEN 'plenary'
-        WHEN lower(subject) SIMILAR TO 'eintrett*en|entra(re|ta) in materia|entr(ée|er) en matière' THEN 'entry'
-        ELSE NULL
-    END AS category
-FROM private.vote_helper
-ORDER BY id, language, decision, decision_count DESC;
-COMMENT ON VIEW stable.vote IS 'Decisions (yes, no, etc.) made during a vote; Best guess at the vote kind (either final, plenary, entry or NULL if indeterminate).';
+CREATE OR REPLACE FUNCTION private.refresh_stable_vote(full_rebuild boolean DEFAULT false) RETURNS bigint
+    LANGUAGE plpgsql AS $$
+DECLARE
+    refreshed bigint;
+BEGIN
+    -- Blocks the triggers of a concurrent sync until this refresh commits. Otherwise, votes touched meanwhile would get
+    -- deleted from private.vote_touched at the end without having been refreshed.
+    LOCK TABLE private.vote_touched IN SHARE ROW EXCLUSIVE MODE;
+    IF full_rebuild THEN
+        TRUNCATE private.vote_touched, private.vote_decision, stable.vote;
+        INSERT INTO private.vote_touched (id, language) SELECT id, language FROM odata.vote;
+    ELSE
+        DELETE FROM private.vote_decision USING private.vote_touched
+        WHERE vote_decision.id = vote_touched.id AND vote_decision.language = vote_touched.language;
+        DELETE FROM stable.vote USING private.vote_touched
+        WHERE vote.id = vote_touched.id AND vote.language = vote_touched.language;
+    END IF;
+
+    INSERT INTO private.vote_decision (id, language, decision, decision_count)
+    SELECT voting.id_vote, voting.language, voting.decision, COUNT(voting.decision)
+    FROM private.vote_touched
+        INNER JOIN odata.voting ON voting.id_vote = vote_touched.id AND voting.language = vote_touched.language
+    GROUP BY voting.id_vote, voting.language, voting.decision;
+
+    INSERT INTO stable.vote (id, language, decision, category)
+    SELECT DISTINCT ON (vote.id, vote.language)
+        vote.id,
+        vote.language,
+        vote_decision.decision,
+        private.vote_category(vote.subject)
+    FROM private.vote_touched
+        INNER JOIN odata.vote ON vote.id = vote_touched.id AND vote.language = vote_touched.language
+        INNER JOIN private.vote_decision ON vote_decision.id = vote.id AND vote_decision.language = vote.language
+    ORDER BY vote.id, vote.language, vote_decision.decision, vote_decision.decision_count DESC;
+    GET DIAGNOSTICS refreshed = ROW_COUNT;
+
+    DELETE FROM private.vote_touched;
+    RETURN refreshed;
+END; $$;
+COMMENT ON FUNCTION private.refresh_stable_vote IS 'Recompute stable.vote for the votes in private.vote_touched, or for all of them if full_rebuild. Returns the number of votes stored.';
+
+SELECT private.refresh_stable_vote(true);
+ANALYZE private.vote_decision, stable.vote;
 
 CREATE OR REPLACE VIEW inconsistent.vote_category AS
 SELECT id
@@ -0,0 +1,3 @@
+-- Votes and votings touched by the sync got recorded in private.vote_touched, see ../post-init.d/200-stable-vote.sql
+SELECT private.refresh_stable_vote();
+ANALYZE stable.vote;
@@ -0,0 +1,298 @@
+import datetime
+import json
+from urllib.parse import unquote_plus
+
+import pytest
+import requests
+from pyodata.v2.model import Config
+from pyodata.v2.service import Service
+
+from odata2sql.checkpoint import Checkpoint
+from odata2sql.command_sync import odata_filter_by_foreign_keys, AdaptiveBatchSize, WorkItemFetchByPrincipal, \
+    PyodataPageFetcher, JsonPageFetcher, apply_bisecting, WorkItemFetchByEntityType, WorkScheduler, RowPage
+from odata2sql.concurrency import ConcurrencyController
+from odata2sql.key_range import KeyRange
+from odata2sql.odata import Context, SettingsBuilder
+from odata2sql.odata_json import RowDecoder, parse_page
+from odata2sql.page_archive import PageArchive, read_pages
+from odata2sql.test.conftest import SERVICE_URL, SqliteConnection
+from odata2sql.watermark import store_watermark, load_watermarks, WATERMARK_OVERLAP
+
+UTC = datetime.timezone.utc
+
+
+@pytest.fixture
+def voting_by_vote(context):
+    voting = context.get_entity_type_by_name('Voting')
+    vote = context.get_entity_type_by_name('Vote')
+    return context.get_referential_constrain(voting, vote)
+
+
+def test_odata_filter_by_foreign_keys(voting_by_vote):
+    assert odata_filter_by_foreign_keys(voting_by_vote, [(1, 'DE')]) == "Language eq 'DE' and IdVote eq 1"
+    assert odata_filter_by_foreign_keys(voting_by_vote, [(1, 'DE'), (2, 'DE'), (3, 'DE')]) == \
+           "Language eq 'DE' and (IdVote eq 1 or IdVote eq 2 or IdVote eq 3)"
+    assert odata_filter_by_foreign_keys(voting_by_vote, [(1, 'DE'), (2, 'FR'), (3, 'DE')]) == \
+           "(Language eq 'DE' and (IdVote eq 1 or IdVote eq 3)) or (Language eq 'FR' and IdVote eq 2)"
+
+
+def test_work_item_fetch_by_principal_validates_keys(context, voting_by_vote):
+    with pytest.raises(ValueError):
+        WorkItemFetchByPrincipal(voting_by_vote, [], context)
+    with pytest.raises(ValueError):
+        WorkItemFetchByPrincipal(voting_by_vote, [(1,)], context)
+    assert WorkItemFetchByPrincipal(voting_by_vote, [[1, 'DE'], [2, 'DE']], context).foreign_keys == [(1, 'DE'),
+                                                                                                  (2, 'DE')]
+
+
+def test_adaptive_batch_size_grows_when_fast():
+    size = AdaptiveBatchSize(10, 50, target_seconds=10)
+    size.succeeded(10, 1.0)
+    assert int(size) == 15
+    for _ in range(10):
+        size.succeeded(int(size), 1.0)
+    assert int(size) == 50
+
+
+def test_adaptive_batch_size_shrinks_when_slow_or_failing():
+    size = AdaptiveBatchSize(40, 50, target_seconds=10)
+    size.succeeded(40, 20.0)
+    assert int(size) == 20
+    size.failed()
+    assert int(size) == 10
+    size.succeeded(10, 7.0)
+    assert int(size) == 10, 'Within target, keep size'
+    size.succeeded(3, 1.0)
+    assert int(size) == 10, 'Ignore work items with less keys than the current size'
+
+
+def json_response(url, document) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response.headers['content-type'] = 'application/json'
+    response._content = json.dumps(document).encode('utf-8')
+    return response
+
+
+class FakeSession:
+    def __init__(self, document):
+        self.document = document
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(unquote_plus(url))
+        return json_response(url, self.document)
+
+    def request(self, method, url, params='', **kwargs):
+        return self.get(f'{url}?{params}')
+
+
+def test_page_fetchers_agree(context):
+    document = {'d': {'__count': '2', 'results': [
+        {'__metadata': {}, 'ID': 1, 'Language': 'DE', 'IdVote': 1, 'Decision': 1, 'VoteEnd': '/Date(1516614510000)/',
+         'VoteEndWithTimezone': '/Date(1516614510000+0060)/'},
+        {'__metadata': {}, 'ID': 2, 'Language': 'DE', 'IdVote': 1, 'Decision': None, 'VoteEnd': None,
+         'VoteEndWithTimezone': None}]}}
+    voting = context.get_entity_type_by_name('Voting')
+    property_names = ['ID', 'Language', 'IdVote', 'Decision', 'VoteEnd', 'VoteEndWithTimezone']
+    pages = []
+    for fetcher_class in (PyodataPageFetcher, JsonPageFetcher):
+        session = FakeSession(document)
+        client = Service(SERVICE_URL + '/', context.client.schema, session, config=Config(retain_null=True))
+        fetcher = fetcher_class(Context(client, context.settings), ConcurrencyController(1))
+        page = fetcher.fetch(voting, property_names, 'IdVote eq 1', None, True)
+        assert '$filter=IdVote eq 1' in session.urls[0]
+        pages.append(page)
+    assert [list(row) for row in pages[0].rows] == [list(row) for row in pages[1].rows]
+    assert pages[0].total_count == pages[1].total_count == 2
+    assert set(pages[0].stage_seconds) == {'fetch', 'extract'}
+    assert set(pages[1].stage_seconds) == {'fetch', 'decode', 'extract'}
+
+
+def test_json_page_fetcher_archives_pages(context, tmp_path):
+    document = {'d': {'results': [
+        {'__metadata': {}, 'ID': 1, 'Language': 'DE', 'IdVote': 1, 'Decision': 1, 'VoteEnd': '/Date(1516614510000)/'}]}}
+    voting = context.get_entity_type_by_name('Voting')
+    property_names = ['ID', 'Language', 'IdVote', 'Decision', 'VoteEnd']
+    client = Service(SERVICE_URL + '/', context.client.schema, FakeSession(document), config=Config(retain_null=True))
+    archive = PageArchive(str(tmp_path), context.session_id)
+    fetcher = JsonPageFetcher(Context(client, context.settings), ConcurrencyController(1), archive)
+    page = fetcher.fetch(voting, property_names, None, None, False)
+    archive.close()
+    # Replaying the archive results in the very same rows
+    archived = [parse_page(json.loads(c)) for c in read_pages(str(tmp_path), context.session_id, 'Voting')]
+    assert len(archived) == 1
+    assert RowDecoder(voting, property_names).rows(archived[0].results) == page.rows
+
+
+def test_apply_bisecting_isolates_bad_rows():
+    calls = []
+    rejected = []
+
+    def apply(rows):
+        calls.append(len(rows))
+        if any(row % 100 == 42 for row in rows):
+            raise ValueError('bad row')
+
+    assert apply_bisecting(list(range(1000)), apply, lambda row, e: rejected.append(row), ValueError) == 10
+    assert rejected == list(range(42, 1000, 100))
+    # Far less than retrying all rows one by one
+    assert len(calls) < 200
+
+
+def test_apply_bisecting_single_bad_row_costs_log_n():
+    calls = []
+
+    def apply(rows):
+        calls.append(len(rows))
+        if 500 in rows:
+            raise ValueError('bad row')
+
+    assert apply_bisecting(list(range(1024)), apply, lambda row, e: None, ValueError) == 1
+    assert len(calls) == 1 + 2 * 10
+
+
+def test_apply_bisecting_passes_other_errors():
+    def apply(rows):
+        raise KeyError()
+
+    with pytest.raises(KeyError):
+        apply_bisecting([1, 2], apply, lambda row, e: None, ValueError)
+
+
+def test_work_item_fetch_by_entity_type_key_range(context):
+    business = context.get_entity_type_by_name('Business')
+    whole = WorkItemFetchByEntityType(business, context)
+    lower = WorkItemFetchByEntityType(business, context, key_range=KeyRange('ID', None, 100))
+    upper = WorkItemFetchByEntityType(business, context, key_range=KeyRange('ID', 100, None))
+    assert whole.checkpoint_key == 'Business'
+    assert lower.checkpoint_key == 'Business:ID[,100)'
+    assert upper.checkpoint_key == 'Business:ID[100,)'
+    assert lower != upper
+    assert [lower, upper].index(upper) == 1
+
+
+class RecordingFetcher:
+    """Answers every request with an empty, final page"""
+
+    def __init__(self):
+        self.requests = []
+
+    def fetch(self, entity_type, property_names, odata_filter, next_url, inline_count) -> RowPage:
+        self.requests.append((odata_filter, next_url))
+        return RowPage([], 0, None)
+
+
+def test_incremental_update_fetches_entities_modified_since_watermark(client, monkeypatch):
+    context = Context(client, SettingsBuilder(SERVICE_URL).sync_config(
+        {'sync_unconfigured_entities': False, 'entities': {'Party': {'sync': True}}}).build())
+    party = context.get_entity_type_by_name('Party')
+    db = SqliteConnection('002-sync-watermark.sql', '003-sync-checkpoint.sql')
+    store_watermark(db, context, party, datetime.datetime(2021, 5, 1, tzinfo=UTC))
+    monkeypatch.setattr(Context, 'get_entity_type_total_count', lambda self, entity_type, additional_filter=None: 1)
+    # As done by work(context, args, incremental=True)
+    scheduler = WorkScheduler(context, db, load_watermarks(db, context))
+    scheduler._enqueue_ready_entity_types()
+    work_item = scheduler._odata_work_queue.get_nowait()
+    fetcher = RecordingFetcher()
+    list(work_item.run(context, fetcher, context.odata_selected_properties(party)))
+    assert fetcher.requests == [("Modified gt datetime'2021-05-01T00:00:00.000'", None)]
+
+    # Entities got modified while fetching, the watermark must not skip those on pages fetched before
+    scheduler._max_modified['Party'] = datetime.datetime.now(UTC) + datetime.timedelta(hours=1)
+    scheduler._work_item_done(work_item)
+    started_at = Checkpoint(db, context.session_id).load().started_at['Party']
+    assert load_watermarks(db, context) == {'Party': (started_at - WATERMARK_OVERLAP).replace(tzinfo=None)}
+
+
+def drain(work_queue) -> list:
+    items = []
+    while not work_queue.empty():
+        items.append(work_queue.get_nowait())
+    return items
+
+
+@pytest.fixture
+def total_count_of_one(monkeypatch):
+    monkeypatch.setattr(Context, 'get_entity_type_total_count', lambda self, entity_type, additional_filter=None: 1)
+
+
+@pytest.fixture
+def voting_context(client) -> Context:
+    """Fetch Voting by foreign keys of Vote, 8 keys per work item"""
+    return Context(client, SettingsBuilder(SERVICE_URL).fk_batch_size(8).sync_config(
+        {'sync_unconfigured_entities': False, 'entities': {'Voting': {'sync': True, 'sync_by': 'Vote'}}}).build())
+
+
+@pytest.fixture
+def voting_db() -> SqliteConnection:
+    """Database holding 16 votes"""
+    db = SqliteConnection('002-sync-watermark.sql', '003-sync-checkpoint.sql')
+    db.sqlite.execute('CREATE TABLE odata.vote (id integer, language text)')
+    db.sqlite.executemany('INSERT INTO odata.vote VALUES (?, ?)', [(i, 'DE') for i in range(16)])
+    return db
+
+
+@pytest.fixture
+def voting_scheduler(voting_context, voting_db, total_count_of_one) -> WorkScheduler:
+    return WorkScheduler(voting_context, voting_db)
+
+
+def test_retry_removes_the_failed_work_item_only(voting_scheduler):
+    voting_scheduler._enqueue_entity_type('Voting')
+    first, second = drain(voting_scheduler._odata_work_queue)
+    assert first != second
+    voting_scheduler._retry_failed_work_item(second)
+    work_items = voting_scheduler._backlog_in_progress['Voting'].work_items
+    assert first in work_items and second not in work_items
+    assert [len(w.foreign_keys) for w in work_items] == [8, 4, 4]
+
+
+def test_retry_isolated_foreign_key_gets_all_attempts(voting_scheduler):
+    voting_scheduler._enqueue_entity_type('Voting')
+    bad_key = (6, 'DE')
+    work_item = next(w for w in drain(voting_scheduler._odata_work_queue) if bad_key in w.foreign_keys)
+    attempts = []
+    with pytest.raises(RuntimeError):
+        while True:
+            voting_scheduler._retry_failed_work_item(work_item)
+            work_item = next(w for w in drain(voting_scheduler._odata_work_queue) if bad_key in w.foreign_keys)
+            attempts.append((len(work_item.foreign_keys), work_item.attempt))
+    assert attempts == [(4, 2), (2, 3), (1, 1), (1, 2), (1, 3)]
+
+
+def test_resume_skips_completed_entity_types_and_foreign_keys(voting_context, voting_db, total_count_of_one):
+    checkpoint = Checkpoint(voting_db, voting_context.session_id)
+    checkpoint.entity_type_completed('Vote')
+    checkpoint.foreign_keys_completed('Voting', [(i, 'DE') for i in range(5)])
+    # As done by work() when resuming the session
+    scheduler = WorkScheduler(voting_context, voting_db,
+                              checkpoint=Checkpoint(voting_db, voting_context.session_id).load())
+    assert 'Vote' not in scheduler._backlog_wait_for_dependencies
+    # No longer waiting for Vote
+    assert scheduler._backlog_wait_for_dependencies['Voting'] is None
+    scheduler._enqueue_entity_type('Voting')
+    work_items = drain(scheduler._odata_work_queue)
+    assert sorted(fk for w in work_items for fk in w.foreign_keys) == [(i, 'DE') for i in range(5, 16)]
+
+
+def test_resume_skips_completed_key_ranges_and_pages(client, total_count_of_one):
+    context = Context(client, SettingsBuilder(SERVICE_URL).sync_config(
+        {'sync_unconfigured_entities': False, 'entities': {'Business': {'sync': True}}}).build())
+    db = SqliteConnection('002-sync-watermark.sql', '003-sync-checkpoint.sql')
+    checkpoint = Checkpoint(db, context.session_id)
+    checkpoint.key_ranges_planned('Business', [(None, 100), (100, 200), (200, None)])
+    checkpoint.key_range_completed('Business', None, 100)
+    next_url = f'{SERVICE_URL}/Business?$skiptoken=150'
+    checkpoint.page_persisted('Business:ID[100,200)', next_url)
+
+    scheduler = WorkScheduler(context, db, checkpoint=Checkpoint(db, context.session_id).load())
+    scheduler._enqueue_entity_type('Business')
+    work_items = drain(scheduler._odata_work_queue)
+    assert [str(w.key_range) for w in work_items] == ['ID[100,200)', 'ID[200,)']
+    fetcher = RecordingFetcher()
+    for work_item in work_items:
+        list(work_item.run(context, fetcher, ['ID', 'Language']))
+    # Continues with the page following the last one persisted
+    assert [url for _, url in fetcher.requests] == [next_url, None]
@@ -110,3 +110,26 @@ def test_selected_properties(client, config, entity_type_name, properties, comme
     ctx = Context(client, SettingsBuilder(SERVICE_URL).sync_config(config).build())
     entity_type = ctx.get_entity_type_by_name(entity_type_name)
     assert ctx.odata_selected_properties(entity_type) == properties, comment
+
+
+@pytest.mark.parametrize('partitioning, message', [
+    ({'by': 'hash', 'property': 'Language', 'values': ['DE']},
+     'Entity type "Voting" has an invalid partitioning method: hash'),
+    ({'by': 'list', 'property': 'FirstName', 'values': ['DE']},
+     'Entity type "Voting" can not be partitioned by "FirstName"'),
+    ({'by': 'list', 'property': 'Language', 'values': []}, 'Entity type "Voting" lacks values to partition by'),
+    ({'by': 'list', 'property': 'Language', 'values': [None]},
+     'Entity type "Voting" has partition values of unsupported types'),
+    ({'by': 'range', 'property': 'IdLegislativePeriod', 'values': [50, 51]},
+     'Entity type "Voting" can not be partitioned by "IdLegislativePeriod", as it is not part of the key'),
+    ({'by': 'range', 'property': 'Language', 'values': ['FR', 'DE']},
+     'Entity type "Voting" has partition bounds not in ascending order'),
+])
+def test_invalid_partitioning(client, partitioning, message):
+    config = {'entities': {'Voting': {'selected_properties': ['ID', 'Language', 'IdVote', 'RegistrationNumber',
+                                                              'IdLegislativePeriod'],
+                                      'partition': partitioning}}}
+    with pytest.raises(ValueError) as e:
+        Context(client, SettingsBuilder(SERVICE_URL).sync_config(config).build())
+
+    assert str(e.value) == message